@@ -0,0 +1,51 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gravity_ensemble import simulate_ensemble, sweep_bodies
+from gravity_sim import Vec3, load_scenario, simulate
+
+default_scenario = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scenarios", "sun_earth_moon.json")
+
+
+# Time a sweep of the Moon's initial velocity run as one ensemble against the same members run one at a time. The
+# one at a time time is extrapolated from the first few members
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ensemble runs against running each member on its own.")
+    parser.add_argument("scenario", nargs="?", default=default_scenario, help="scenario JSON file with a Moon")
+    parser.add_argument("--members", type=int, nargs="+", default=[1, 10, 100, 500], help="ensemble sizes")
+    parser.add_argument("--sim-time", type=int, default=2000, help="number of steps")
+    parser.add_argument("--integrator", default="verlet", help="integrator")
+    parser.add_argument("--timed-singles", type=int, default=3, help="members timed one at a time")
+    args = parser.parse_args(argv)
+
+    scenario = load_scenario(args.scenario)
+    moon = scenario.bodies["moon"]
+
+    print(f"{'members':>8} {'ensemble (s)':>13} {'one at a time (s)':>18} {'speedup':>8} {'ms/member':>10}")
+
+    for count in args.members:
+        members = sweep_bodies(scenario.bodies, "moon", "velocity",
+                               [Vec3(moon.velocity.x, moon.velocity.y + dv, moon.velocity.z)
+                                for dv in np.linspace(-70, 70, count)])
+
+        start = time.perf_counter()
+        simulate_ensemble(members, scenario.step_size, args.sim_time, summary=True, integrator=args.integrator)
+        ensemble_time = time.perf_counter() - start
+
+        timed = members[:args.timed_singles]
+        start = time.perf_counter()
+        for member in timed:
+            simulate(member, scenario.step_size, args.sim_time, integrator=args.integrator)
+        single_time = (time.perf_counter() - start) / len(timed) * count
+
+        print(f"{count:>8} {ensemble_time:>13.2f} {single_time:>18.2f} {single_time / ensemble_time:>8.1f} "
+              f"{ensemble_time / count * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
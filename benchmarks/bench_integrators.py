@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gravity_sim import bodies_to_arrays, get_integrator, integrate, load_scenario, n_body_accel_array, total_energy
+
+default_scenario = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "scenarios", "sun_earth_moon.json")
+
+
+# Run one integrator over the same span of simulated time, returning the worst relative energy error along the way,
+# the final positions, the number of force evaluations it took, and the run time. Evaluations of only some of the
+# bodies count as the fraction of a full evaluation they are
+def run(positions, velocities, masses, integrator, integrator_options, step_size, span, check_freq):
+    evaluations = [0]
+
+    def counted_accel(position, masses, targets=None):
+        evaluations[0] += 1 if targets is None else len(targets) / len(masses)
+        return n_body_accel_array(position, masses, targets)
+
+    step_func = get_integrator(integrator, integrator_options)
+    start_energy = total_energy(positions, velocities, masses)
+    worst = 0.0
+
+    start = time.perf_counter()
+    for i, position, velocity, _ in integrate(positions, velocities, masses, step_size, span // step_size + 1,
+                                              counted_accel, step_func):
+        if i % check_freq == 0:
+            worst = max(worst, abs(total_energy(position, velocity, masses) / start_energy - 1))
+
+    return worst, position, evaluations[0], time.perf_counter() - start
+
+
+# Compare the integrators by the energy and position errors they reach for a given number of force evaluations,
+# over a grid of step sizes, tolerances for the adaptive integrator, and eta for the block timestep integrator.
+# Position errors are the largest distance of any body from a Yoshida run at reference_step
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare integrators by their errors against force evaluations.")
+    parser.add_argument("scenario", nargs="?", default=default_scenario, help="scenario JSON file")
+    parser.add_argument("--span", type=int, default=365 * 86400, help="simulated time (s)")
+    parser.add_argument("--steps", type=int, nargs="+", default=[1350, 5400, 10800, 21600], help="step sizes (s)")
+    parser.add_argument("--tolerances", type=float, nargs="+", default=[1e-8, 1e-10, 1e-12], help="adaptive rtol")
+    parser.add_argument("--adaptive-step", type=int, default=86400, help="output step of the adaptive integrator (s)")
+    parser.add_argument("--etas", type=float, nargs="+", default=[0.01, 0.005, 0.0025], help="block timestep eta")
+    parser.add_argument("--block-step", type=int, default=86400, help="output step of the block integrator (s)")
+    parser.add_argument("--wisdom-holman-steps", type=int, nargs="+", default=[43200, 86400],
+                        help="extra step sizes of the Wisdom-Holman integrator (s)")
+    parser.add_argument("--reference-step", type=int, default=225, help="step of the reference Yoshida run (s)")
+    args = parser.parse_args(argv)
+
+    _, _, positions, velocities, masses = bodies_to_arrays(load_scenario(args.scenario).bodies)
+
+    runs = [("verlet", None, step) for step in args.steps]
+    runs += [("yoshida4", None, step) for step in args.steps]
+    runs += [("wisdom_holman", None, step) for step in args.steps + args.wisdom_holman_steps]
+    runs += [("adaptive", {"rtol": rtol}, args.adaptive_step) for rtol in args.tolerances]
+    runs += [("block", {"eta": eta}, args.block_step) for eta in args.etas]
+
+    _, reference, _, _ = run(positions, velocities, masses, "yoshida4", None, args.reference_step, args.span,
+                             args.span)
+
+    print(f"{'integrator':>13} {'step (s)':>9} {'option':>12} {'force evals':>12} {'max |dE/E|':>11} "
+          f"{'max err (m)':>11} {'time (s)':>9}")
+
+    for integrator, options, step_size in runs:
+        # Runs can only be compared with the reference if they end at the same time
+        if args.span % step_size:
+            print(f"{integrator:>13} {step_size:>9} skipped, the step doesn't divide the span")
+            continue
+
+        error, final, evaluations, elapsed = run(positions, velocities, masses, integrator, options, step_size,
+                                                 args.span, max(int(86400 / step_size), 1))
+        option = " ".join(f"{key}={value:g}" for key, value in options.items()) if options else "-"
+        distance = np.linalg.norm(final - reference, axis=1).max()
+
+        print(f"{integrator:>13} {step_size:>9} {option:>12} {evaluations:>12.0f} {error:>11.2e} {distance:>11.3g} "
+              f"{elapsed:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
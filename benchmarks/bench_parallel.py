@@ -0,0 +1,62 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_tree import best_time, plummer_cluster
+from gravity_parallel import close_force_pools, get_force_pool
+from gravity_sim import n_body_accel_array
+
+# Largest body count the single process direct sum is actually timed at, beyond it its O(N^2) time is extrapolated
+direct_max_n = 20000
+
+
+# Time one force evaluation of the parallel solver for a range of worker counts and body counts, against the single
+# process direct sum. Each pool is started and warmed up before it is timed
+def main(argv=None):
+    cores = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, 8, 16, 32, 64, cores} & set(range(1, cores + 1)))
+
+    parser = argparse.ArgumentParser(description="Benchmark the parallel force solver against the core count.")
+    parser.add_argument("--n", type=int, nargs="+", default=[1000, 5000, 10000, 20000, 50000], help="body counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=worker_counts, help="worker counts")
+    parser.add_argument("--tile-size", type=int, default=256, help="tile side length")
+    parser.add_argument("--repeats", type=int, default=1, help="timed repeats, the best is reported")
+    args = parser.parse_args(argv)
+
+    print(f"{cores} cores available")
+    print(f"{'N':>8} {'direct (s)':>11} " + " ".join(f"{f'{w} workers (s)':>15} {'speedup':>8}" for w in args.workers))
+
+    # Body counts past direct_max_n extrapolate from the direct sum's time per pair, so it is measured up front in
+    # case the first of them comes before any timed one
+    rate_n = min(min(args.n), direct_max_n)
+    positions, masses = plummer_cluster(rate_n)
+    direct_rate = best_time(lambda: n_body_accel_array(positions, masses), args.repeats) / rate_n ** 2
+
+    for n in args.n:
+        positions, masses = plummer_cluster(n)
+
+        if n <= direct_max_n:
+            direct_time = best_time(lambda: n_body_accel_array(positions, masses), args.repeats)
+            direct_rate = direct_time / n ** 2
+            line = f"{n:>8} {direct_time:>11.3f} "
+        else:
+            direct_time = direct_rate * n ** 2
+            line = f"{n:>8} {direct_time:>10.2f}* "
+
+        for workers in args.workers:
+            pool = get_force_pool(workers)
+            pool.accel(positions, masses, tile_size=args.tile_size)
+
+            pool_time = best_time(lambda: pool.accel(positions, masses, tile_size=args.tile_size), args.repeats)
+            line += f"{pool_time:>15.3f} {direct_time / pool_time:>8.2f} "
+
+        print(line.rstrip())
+
+    close_force_pools()
+    print("* extrapolated from the time per pair of the last timed direct sum")
+
+
+if __name__ == "__main__":
+    main()
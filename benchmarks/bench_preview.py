@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gravity_preview import Preview
+from gravity_sim import load_scenario
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+default_scenarios = [os.path.join(package_dir, "scenarios", f"{name}.json")
+                     for name in ("sun_earth_moon", "solar_system", "solar_system_moons")]
+
+
+# Time from creating a preview of a scenario to each of its levels being finished, advancing it budget seconds at a
+# time like the GUI's frame loop does. The first level's time is the latency of the preview after a body is moved
+def level_times(scenario, budget, integrator):
+    start = time.perf_counter()
+    preview = Preview(scenario.bodies, scenario.step_size, scenario.sim_time, integrator=integrator)
+
+    times = []
+    while not preview.is_done():
+        if preview.advance(budget):
+            times.append(time.perf_counter() - start)
+
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the latency and refinement times of the live preview.")
+    parser.add_argument("scenarios", nargs="*", default=default_scenarios, help="scenario files")
+    parser.add_argument("--budget", type=float, default=0.005, help="seconds the preview is advanced at a time")
+    parser.add_argument("--integrator", default="verlet", help="integrator")
+    parser.add_argument("--repeats", type=int, default=3, help="timed repeats, the best is reported")
+    args = parser.parse_args(argv)
+
+    for path in args.scenarios:
+        scenario = load_scenario(path)
+        level_times(scenario, args.budget, args.integrator)  # Warm up the force solver's imports
+
+        runs = [level_times(scenario, args.budget, args.integrator) for _ in range(args.repeats)]
+        best = [min(level) for level in zip(*runs)]
+
+        print(f"{scenario.name} ({len(scenario.bodies)} bodies): " +
+              ", ".join(f"level {level} {seconds * 1000:.1f} ms" for level, seconds in enumerate(best)))
+
+
+if __name__ == "__main__":
+    main()
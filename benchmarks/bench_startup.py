@@ -0,0 +1,77 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+scenario_path = os.path.join(package_dir, "scenarios", "sun_earth_moon.json")
+
+# Modules whose cold import is timed by default, from the headless core to the GUI
+default_modules = ["gravity_sim", "gravity_store", "gravity_backends", "gravity_worker", "gravity_tool"]
+
+# Prints the time from just before the import to the end of the code timed, measured inside the new process
+timer_code = "import time; start = time.perf_counter(); {code}; print(time.perf_counter() - start)"
+
+
+# Run a new Python process and return its wall time along with the time it printed, or None for both if it failed.
+# Every process starts cold, so nothing imported by an earlier one is reused
+def time_process(args):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=package_dir, capture_output=True, text=True)
+    wall_time = time.perf_counter() - start
+
+    if result.returncode != 0:
+        return None, None
+
+    lines = result.stdout.strip().splitlines()
+    return wall_time, float(lines[-1]) if lines else None
+
+
+# Best wall and printed times over repeats runs of a process, or None if any run failed
+def best_process_time(args, repeats):
+    times = [time_process(args) for _ in range(repeats)]
+    if any(wall_time is None for wall_time, _ in times):
+        return None
+
+    return min(wall_time for wall_time, _ in times), min(inner or 0.0 for _, inner in times)
+
+
+def print_row(name, times):
+    if times is None:
+        print(f"{name:<28} {'failed':>12}")
+    else:
+        print(f"{name:<28} {times[1] * 1000:>10.1f}ms {times[0] * 1000:>10.1f}ms")
+
+
+# Time the cold import of each module, a short headless batch job, and the GUI's time to its first frame, each in a
+# new process. The interpreter's own startup is timed on its own for reference
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cold imports and the startup of batch jobs and the GUI.")
+    parser.add_argument("--modules", nargs="+", default=default_modules, help="modules to time the import of")
+    parser.add_argument("--repeats", type=int, default=5, help="timed runs of each, the best is reported")
+    parser.add_argument("--steps", type=int, default=100, help="steps of the batch job")
+    parser.add_argument("--no-gui", action="store_true", help="skip the time to the GUI's first frame, which needs "
+                                                               "a display")
+    args = parser.parse_args(argv)
+
+    print(f"{'':<28} {'timed':>12} {'process':>12}")
+    print_row("interpreter", best_process_time(["-c", timer_code.format(code="pass")], args.repeats))
+
+    for module in args.modules:
+        print_row(f"import {module}", best_process_time(["-c", timer_code.format(code=f"import {module}")],
+                                                        args.repeats))
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        batch_code = timer_code.format(code=f"import gravity_sim; gravity_sim.main([{scenario_path!r}, '--sim-time', "
+                                            f"'{args.steps}', '-o', {out_dir!r}])")
+        print_row(f"batch job ({args.steps} steps)", best_process_time(["-c", batch_code], args.repeats))
+
+    if not args.no_gui:
+        gui_code = timer_code.format(code="import gravity_tool; gravity_tool.main(max_frames=1)")
+        print_row("GUI first frame", best_process_time(["-c", gui_code], args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gravity_sim import Body, G, Vec3, load_scenario, n_body_accel_array, simulate
+
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+scenario_dir = os.path.join(benchmark_dir, "..", "scenarios")
+default_baseline = os.path.join(benchmark_dir, "baseline.json")
+
+# Scenarios run end to end, with the number of steps they are run for
+default_scenarios = {"sun_earth_moon": 20000, "solar_system": 20000}
+
+# Integrations are skipped where N^2 * steps, the number of pair interactions they evaluate, is above this budget
+default_pair_budget = 2e9
+
+
+# Bodies in circular orbits around a central star, a system that stays well behaved for any N. The orbits are spread
+# over a thick disk so no two bodies start close together
+def disk_system(n, seed=0):
+    rng = np.random.default_rng(seed)
+    star_mass = 2e30
+    bodies = [Body("star", "Star", Vec3(0.0, 0.0, 0.0), Vec3(0.0, 0.0, 0.0), star_mass, None)]
+
+    for i in range(1, n):
+        radius = rng.uniform(0.5e11, 5e11)
+        angle = rng.uniform(0, 2 * np.pi)
+        height = rng.normal(0, 1e9)
+        speed = np.sqrt(G * star_mass / radius)
+
+        position = Vec3(radius * np.cos(angle), radius * np.sin(angle), height)
+        velocity = Vec3(-speed * np.sin(angle), speed * np.cos(angle), 0.0)
+        bodies.append(Body(f"body_{i}", f"Body {i}", position, velocity, rng.uniform(1e20, 1e24), None))
+
+    return bodies
+
+
+# Per call time of a function, the best of repeats measurements. Each measurement calls it enough times to take at
+# least min_time, so fast kernels aren't timed at the resolution of the clock
+def measure(function, repeats, min_time):
+    start = time.perf_counter()
+    function()
+    first = time.perf_counter() - start
+
+    loops = max(int(math.ceil(min_time / max(first, 1e-9))), 1)
+    times = [first]
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(loops):
+            function()
+        times.append((time.perf_counter() - start) / loops)
+
+    return min(times)
+
+
+# Description of the machine and libraries results were measured with, as they are only comparable between runs on
+# the same machine
+def machine_info():
+    return {"platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__}
+
+
+# Run every benchmark whose name contains one of the filters (all of them without filters), returning a dictionary
+# of results keyed by benchmark name. Each result holds its time per call in seconds and the case's parameters
+def run_suite(body_counts, step_counts, scenarios, repeats, min_time, pair_budget, filters=None):
+    results = {}
+
+    def selected(name):
+        return not filters or any(pattern in name for pattern in filters)
+
+    def record(name, seconds, **parameters):
+        results[name] = dict(parameters, seconds=seconds)
+        print(f"{name:<40} {seconds:>12.6f} s", flush=True)
+
+    for n in body_counts:
+        name = f"kernel/direct/n={n}"
+        if selected(name):
+            bodies = disk_system(n)
+            positions = np.array([body.position for body in bodies], dtype=float)
+            masses = np.array([body.mass for body in bodies], dtype=float)
+            record(name, measure(lambda: n_body_accel_array(positions, masses), repeats, min_time), n=n)
+
+    for n in body_counts:
+        for steps in step_counts:
+            name = f"integrate/verlet/n={n}/steps={steps}"
+            if selected(name) and n * n * steps <= pair_budget:
+                bodies = disk_system(n)
+                record(name, measure(lambda: simulate(bodies, 500, steps), repeats, min_time), n=n, steps=steps)
+
+    for scenario_name, steps in scenarios.items():
+        name = f"scenario/{scenario_name}/steps={steps}"
+        if selected(name):
+            scenario = load_scenario(os.path.join(scenario_dir, f"{scenario_name}.json"))
+            record(name, measure(lambda: simulate(scenario.bodies, scenario.step_size, steps), repeats, min_time),
+                   n=len(scenario.bodies), steps=steps)
+
+    return results
+
+
+# Compare results with a baseline, returning (name, baseline seconds, seconds, ratio, status) rows, where status is
+# "regression" or "improvement" for ratios beyond the threshold either way, and "new" for benchmarks the baseline
+# doesn't have
+def compare(results, baseline, threshold):
+    rows = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            rows.append((name, None, result["seconds"], None, "new"))
+            continue
+
+        ratio = result["seconds"] / baseline[name]["seconds"]
+        status = "ok"
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improvement"
+
+        rows.append((name, baseline[name]["seconds"], result["seconds"], ratio, status))
+
+    return rows
+
+
+def print_report(rows, threshold):
+    print(f"\n{'benchmark':<40} {'baseline (s)':>13} {'current (s)':>12} {'ratio':>7}  status")
+
+    for name, old, new, ratio, status in rows:
+        old_text = "-" if old is None else f"{old:.6f}"
+        ratio_text = "-" if ratio is None else f"{ratio:.3f}"
+        print(f"{name:<40} {old_text:>13} {new:>12.6f} {ratio_text:>7}  {status}")
+
+    regressions = sum(status == "regression" for *_, status in rows)
+    print(f"\n{regressions} regression(s) slower than the baseline by more than {threshold:.0%}")
+
+
+# Run the suite and write its results as JSON. Given a baseline file, the results are compared with it and the exit
+# code is 1 if any benchmark regressed by more than the threshold, so the suite can gate a change
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the force kernel and full runs, and compare the results "
+                                                 "with a stored baseline.")
+    parser.add_argument("--n", type=int, nargs="+", default=[3, 10, 100, 1000, 10000], help="body counts")
+    parser.add_argument("--steps", type=int, nargs="+", default=[10, 100, 1000, 10000], help="step counts")
+    parser.add_argument("--scenario-steps", type=int, help="override the step count of the bundled scenarios")
+    parser.add_argument("--repeats", type=int, default=3, help="timed repeats, the best is reported")
+    parser.add_argument("--min-time", type=float, default=0.1, help="least time one measurement takes (s)")
+    parser.add_argument("--pair-budget", type=float, default=default_pair_budget,
+                        help="skip integrations evaluating more than this many pair interactions")
+    parser.add_argument("--filter", nargs="+", help="only run benchmarks whose name contains one of these")
+    parser.add_argument("-o", "--output", help="JSON file the results are written to")
+    parser.add_argument("--baseline", default=default_baseline, help="baseline JSON file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative slowdown reported as a regression (default: 0.1, i.e. 10%%)")
+    args = parser.parse_args(argv)
+
+    scenarios = dict(default_scenarios)
+    if args.scenario_steps:
+        scenarios = {name: args.scenario_steps for name in scenarios}
+
+    results = run_suite(args.n, args.steps, scenarios, args.repeats, args.min_time, args.pair_budget, args.filter)
+    report = {"machine": machine_info(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.save_baseline:
+        # Benchmarks left out by a filter keep their old baseline
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as file:
+                report["results"] = dict(json.load(file)["results"], **results)
+
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --save-baseline to store one")
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+
+    if baseline["machine"] != report["machine"]:
+        print("\nWarning: the baseline was measured on a different machine or library versions")
+
+    rows = compare(results, baseline["results"], args.threshold)
+    print_report(rows, args.threshold)
+
+    return 1 if any(status == "regression" for *_, status in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from gravity_sim import n_body_accel_array
+from gravity_tree import barnes_hut_accel, barnes_hut_error
+
+# Largest body count the direct sum is actually timed at, beyond it its O(N^2) time is extrapolated
+direct_max_n = 10000
+
+
+# Bodies of a Plummer sphere star cluster, the clustered initial conditions the tree solver is meant for
+def plummer_cluster(n, seed=0, radius=1e15, mass=2e30):
+    rng = np.random.default_rng(seed)
+    r = radius / np.sqrt(rng.uniform(0.01, 0.99, n) ** (-2 / 3) - 1)
+    direction = rng.normal(size=(n, 3))
+    direction /= np.linalg.norm(direction, axis=1)[:, np.newaxis]
+
+    return direction * r[:, np.newaxis], np.full(n, mass)
+
+
+def best_time(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+# Time one acceleration evaluation of the tree and direct solvers over a range of body counts. Time / (N log2 N)
+# staying flat for the tree shows its O(N log N) scaling
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Barnes-Hut solver against the direct sum.")
+    parser.add_argument("--n", type=int, nargs="+", default=[1000, 3000, 10000, 30000, 100000], help="body counts")
+    parser.add_argument("--theta", type=float, default=0.5, help="opening angle")
+    parser.add_argument("--repeats", type=int, default=1, help="timed repeats, the best is reported")
+    args = parser.parse_args(argv)
+
+    print(f"{'N':>8} {'tree (s)':>10} {'direct (s)':>11} {'speedup':>8} {'tree us/(N log N)':>18} {'median err':>11} {'p99 err':>9}")
+
+    direct_rate = None
+    for n in args.n:
+        positions, masses = plummer_cluster(n)
+
+        tree_time = best_time(lambda: barnes_hut_accel(positions, masses, theta=args.theta), args.repeats)
+
+        if n <= direct_max_n:
+            direct_time = best_time(lambda: n_body_accel_array(positions, masses), args.repeats)
+            direct_rate = direct_time / n ** 2
+            direct_label = f"{direct_time:>11.3f}"
+        else:
+            direct_time = direct_rate * n ** 2 if direct_rate else float("nan")
+            direct_label = f"{direct_time:>10.1f}*"
+
+        error = barnes_hut_error(positions, masses, args.theta, sample=200)
+
+        print(f"{n:>8} {tree_time:>10.3f} {direct_label} {direct_time / tree_time:>8.1f} "
+              f"{tree_time / (n * np.log2(n)) * 1e6:>18.3f} {error['median']:>11.2e} {error['p99']:>9.2e}")
+
+    print("* extrapolated from the largest timed direct sum")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import json
+import os
+import time
+import numpy as np
+from gravity_sim import G, default_cache_dir, n_body_accel_array
+
+try:
+    import numba
+except ImportError:  # Optional, the numba backend is only offered where it is installed
+    numba = None
+
+# region Global Definitions and Variables
+
+# Crossover points of the auto backend as (largest body count, backend) pairs in increasing order, measured with
+# calibrate_backends on a single core. Backends that aren't installed are skipped, and body counts past the last
+# available pair use numpy. The numba pair is an estimate until calibrated, numba not being a requirement
+default_crossovers = [[4, "reference"], [32, "numpy"], [None, "numba"]]
+
+# Crossovers measured on this machine by calibrate_backends, read in place of the defaults when present
+crossover_path = os.path.join(default_cache_dir, "backends.json")
+
+# Body counts calibrate_backends measures by default
+default_calibration_sizes = [2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64, 128, 256, 512, 1024, 2048]
+
+# Crossovers in use, loaded on the first auto choice, and the backend chosen for each body count so far
+crossovers = None
+backend_choices = {}
+
+# endregion
+
+
+# region Backends
+
+# Pure Python pair loop over lists, the reference the other backends are checked against. It has no array overhead,
+# which also makes it the fastest backend for two or three bodies
+def reference_accel(positions, masses, targets=None, softening=0.0):
+    points = positions.tolist()
+    mass_list = masses.tolist()
+    rows = range(len(points)) if targets is None else np.asarray(targets).tolist()
+    softening_sq = softening * softening
+
+    accelerations = []
+    for i in rows:
+        x, y, z = points[i]
+        accel_x = accel_y = accel_z = 0.0
+
+        for j, (other_x, other_y, other_z) in enumerate(points):
+            if j == i:
+                continue
+
+            delta_x, delta_y, delta_z = other_x - x, other_y - y, other_z - z
+            distance_sq = delta_x * delta_x + delta_y * delta_y + delta_z * delta_z + softening_sq
+            scaler = G * mass_list[j] / (distance_sq * distance_sq ** 0.5)
+
+            accel_x += delta_x * scaler
+            accel_y += delta_y * scaler
+            accel_z += delta_z * scaler
+
+        accelerations.append((accel_x, accel_y, accel_z))
+
+    return np.array(accelerations, dtype=float).reshape(-1, 3)
+
+
+if numba is not None:
+    # Compiled pair loop visiting each pair once and applying it to both bodies, without any N x N temporaries
+    @numba.njit(cache=True)
+    def numba_pair_kernel(positions, masses, g, softening_sq):
+        n = len(masses)
+        accelerations = np.zeros((n, 3))
+
+        for i in range(n):
+            for j in range(i + 1, n):
+                delta_x = positions[j, 0] - positions[i, 0]
+                delta_y = positions[j, 1] - positions[i, 1]
+                delta_z = positions[j, 2] - positions[i, 2]
+
+                distance_sq = delta_x * delta_x + delta_y * delta_y + delta_z * delta_z + softening_sq
+                inverse_cube = g / (distance_sq * np.sqrt(distance_sq))
+                scaler_i = masses[j] * inverse_cube
+                scaler_j = masses[i] * inverse_cube
+
+                accelerations[i, 0] += delta_x * scaler_i
+                accelerations[i, 1] += delta_y * scaler_i
+                accelerations[i, 2] += delta_z * scaler_i
+                accelerations[j, 0] -= delta_x * scaler_j
+                accelerations[j, 1] -= delta_y * scaler_j
+                accelerations[j, 2] -= delta_z * scaler_j
+
+        return accelerations
+
+    # Compiled loop over the target bodies only, from every body
+    @numba.njit(cache=True)
+    def numba_target_kernel(positions, masses, targets, g, softening_sq):
+        accelerations = np.zeros((len(targets), 3))
+
+        for row in range(len(targets)):
+            i = targets[row]
+            for j in range(len(masses)):
+                if j == i:
+                    continue
+
+                delta_x = positions[j, 0] - positions[i, 0]
+                delta_y = positions[j, 1] - positions[i, 1]
+                delta_z = positions[j, 2] - positions[i, 2]
+
+                distance_sq = delta_x * delta_x + delta_y * delta_y + delta_z * delta_z + softening_sq
+                scaler = g * masses[j] / (distance_sq * np.sqrt(distance_sq))
+
+                accelerations[row, 0] += delta_x * scaler
+                accelerations[row, 1] += delta_y * scaler
+                accelerations[row, 2] += delta_z * scaler
+
+        return accelerations
+
+
+def numba_accel(positions, masses, targets=None, softening=0.0):
+    positions = np.ascontiguousarray(positions, dtype=float)
+    masses = np.ascontiguousarray(masses, dtype=float)
+
+    if targets is not None:
+        return numba_target_kernel(positions, masses, np.ascontiguousarray(targets, dtype=np.int64), G,
+                                   softening * softening)
+
+    return numba_pair_kernel(positions, masses, G, softening * softening)
+
+
+# Direct sum backends selectable by name, each called as backend(positions, masses, targets=None, softening=0.0)
+compute_backends = {"reference": reference_accel, "numpy": n_body_accel_array}
+if numba is not None:
+    compute_backends["numba"] = numba_accel
+
+# endregion
+
+
+# region Backend Selection
+
+def load_crossovers():
+    global crossovers
+    crossovers = default_crossovers
+
+    if os.path.exists(crossover_path):
+        with open(crossover_path) as file:
+            crossovers = json.load(file)["crossovers"]
+
+    backend_choices.clear()
+
+
+# Backend the auto choice uses for n bodies: the first available one whose crossover point is at least n
+def select_backend(n):
+    if n not in backend_choices:
+        if crossovers is None:
+            load_crossovers()
+
+        backend_choices[n] = next((backend for largest_n, backend in crossovers
+                                   if backend in compute_backends and (largest_n is None or n <= largest_n)), "numpy")
+
+    return backend_choices[n]
+
+
+# The direct sum force solver, evaluated by the named backend, or by the one chosen for the number of bodies with
+# "auto". The choice is made on every call, so a run whose body count changes keeps using the fastest backend. The
+# force is softened over a length of softening (see n_body_accel_array)
+def direct_accel(positions, masses, targets=None, backend="auto", softening=0.0):
+    if backend == "auto":
+        backend = backend_choices.get(len(masses)) or select_backend(len(masses))
+
+    if backend not in compute_backends:
+        raise ValueError(f"Unknown or unavailable compute backend '{backend}', expected one of "
+                         f"{', '.join(compute_backends)}")
+
+    return compute_backends[backend](positions, masses, targets, softening)
+
+# endregion
+
+
+# region Calibration
+
+# Random bodies spread over a cube, only used for timing the backends
+def calibration_system(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-1e11, 1e11, (n, 3)), rng.uniform(1e20, 1e30, n)
+
+
+# Per call time of every available backend for each body count, as {n: {backend: seconds}}. Each backend is called
+# until it has run for at least min_time, after a first call that also compiles the numba kernels
+def time_backends(sizes, min_time=0.05, max_reference_n=256):
+    timings = {}
+
+    for n in sizes:
+        positions, masses = calibration_system(n)
+        timings[n] = {}
+
+        for name, backend in compute_backends.items():
+            # The reference loop is quadratic in Python, past a few hundred bodies it is never the fastest
+            if name == "reference" and n > max_reference_n:
+                continue
+
+            backend(positions, masses)
+
+            calls = 0
+            start = time.perf_counter()
+            while calls == 0 or time.perf_counter() - start < min_time:
+                backend(positions, masses)
+                calls += 1
+
+            timings[n][name] = (time.perf_counter() - start) / calls
+
+    return timings
+
+
+# Crossover points of the fastest backend at each body count, merging neighbouring counts with the same winner. The
+# largest count keeps None, so its winner is used for any larger system
+def crossovers_from_timings(timings):
+    points = []
+
+    for n in sorted(timings):
+        fastest = min(timings[n], key=timings[n].get)
+
+        if points and points[-1][1] == fastest:
+            points[-1][0] = n
+        else:
+            points.append([n, fastest])
+
+    points[-1][0] = None
+    return points
+
+
+# Measure the backends on this machine and make the auto choice use the crossovers found, writing them to path so
+# later runs use them too
+def calibrate_backends(sizes=None, min_time=0.05, path=crossover_path):
+    timings = time_backends(sizes or default_calibration_sizes, min_time)
+    measured = crossovers_from_timings(timings)
+
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as file:
+            json.dump({"crossovers": measured, "timings": {str(n): times for n, times in timings.items()}}, file,
+                      indent=2)
+
+    global crossovers
+    crossovers = measured
+    backend_choices.clear()
+
+    return timings, measured
+
+
+# Largest relative difference of every backend's accelerations from the reference backend's, for n random bodies
+def check_backends(n=64):
+    positions, masses = calibration_system(n, seed=1)
+    reference = reference_accel(positions, masses)
+    scale = np.linalg.norm(reference, axis=1)
+
+    return {name: float(np.max(np.linalg.norm(backend(positions, masses) - reference, axis=1) / scale))
+            for name, backend in compute_backends.items()}
+
+
+# Print the backends' timings and the crossovers found, and store them for the auto choice unless --dry-run is given
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Time the direct sum backends and store the crossover points the "
+                                                 "auto backend chooses by.")
+    parser.add_argument("--n", type=int, nargs="+", default=default_calibration_sizes, help="body counts to time")
+    parser.add_argument("--min-time", type=float, default=0.05, help="least time each measurement takes (s)")
+    parser.add_argument("--dry-run", action="store_true", help="print the crossovers without storing them")
+    args = parser.parse_args(argv)
+
+    for name, error in check_backends().items():
+        print(f"{name:<10} max relative error against the reference {error:.2e}")
+
+    timings, measured = calibrate_backends(args.n, args.min_time, None if args.dry_run else crossover_path)
+
+    names = list(compute_backends)
+    print(f"\n{'n':>6}" + "".join(f"{name:>12}" for name in names))
+    for n, times in timings.items():
+        print(f"{n:>6}" + "".join(f"{times[name] * 1e6:>10.1f}us" if name in times else f"{'-':>12}"
+                                  for name in names))
+
+    print("\nCrossovers:", ", ".join(f"{backend} up to {'any N' if n is None else n}" for n, backend in measured))
+    if not args.dry_run:
+        print(f"Stored in {crossover_path}")
+
+
+if __name__ == "__main__":
+    main()
+
+# endregion
@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+from collections import OrderedDict
+from gravity_sim import bodies_to_arrays, default_cache_dir, simulate, test_particle_mask
+from gravity_store import TrajectoryStore, default_chunk_bytes
+
+# region Global Definitions and Variables
+
+# Most memory the in-memory tier holds trajectories in, least recently used ones are dropped first
+default_memory_bytes = 256 * 1024 * 1024
+
+# Most disk space the on-disk tier takes up, least recently used stores are deleted first
+default_disk_bytes = 4 * 1024 * 1024 * 1024
+
+# Solver options that only choose how the force is evaluated: the direct sum's compute backend and the parallel
+# solver's worker count and tile size. They are left out of the cache key, so a run cached on one machine or pool size
+# is found on another
+execution_options = {"backend", "workers", "tile_size"}
+
+# endregion
+
+
+# region Cache Keys
+
+# Hash of everything a simulation's result depends on: the bodies (but not their colours), which of them are test
+# particles, and the step size, length, save stride, solver, and integrator settings, but not the solver's
+# execution_options. Floats are written exactly, so a value edited and set back to what it was hashes the same again
+def cache_key(bodies, step_size, sim_time, save_stride=1, solver="direct", solver_options=None, integrator="verlet",
+              integrator_options=None):
+    ids, names, positions, velocities, masses = bodies_to_arrays(bodies)
+    test_particles = test_particle_mask(bodies, masses)
+
+    config = {"ids": ids,
+              "names": names,
+              "positions": [value.hex() for value in positions.ravel().tolist()],
+              "velocities": [value.hex() for value in velocities.ravel().tolist()],
+              "masses": [value.hex() for value in masses.tolist()],
+              "step_size": step_size,
+              "sim_time": sim_time,
+              "save_stride": max(int(save_stride), 1),
+              "solver": solver,
+              "solver_options": {key: value for key, value in (solver_options or {}).items()
+                                 if key not in execution_options},
+              "integrator": integrator,
+              "integrator_options": integrator_options or {},
+              "test_particles": [] if test_particles is None else np.flatnonzero(test_particles).tolist()}
+
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+# endregion
+
+
+# region Result Cache
+
+# Results of earlier simulations, keyed by cache_key. A small in-memory tier holds recently used trajectories as
+# arrays, behind it an on-disk tier holds every cached result as a trajectory store directory. Either tier evicts its
+# least recently used entries once it is over its size limit
+class ResultCache:
+    def __init__(self, directory=default_cache_dir, memory_bytes=default_memory_bytes, disk_bytes=default_disk_bytes):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def __contains__(self, key):
+        return key in self.memory or os.path.exists(os.path.join(self.entry_path(key), "meta.json"))
+
+    # Cached trajectory of a configuration, or None. Trajectories from the disk tier are loaded into memory if they
+    # fit in the in-memory tier and are returned as lazy store views otherwise
+    def get(self, key):
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+
+        path = self.entry_path(key)
+        if not os.path.exists(os.path.join(path, "meta.json")):
+            return None
+
+        # The meta file's modification time records when the entry was last used, for the disk tier's eviction
+        os.utime(os.path.join(path, "meta.json"))
+        trajectory = TrajectoryStore.open(path).trajectory()
+
+        if trajectory_bytes(trajectory) <= self.memory_bytes:
+            trajectory = trajectory._replace(times=np.asarray(trajectory.times),
+                                             positions=np.asarray(trajectory.positions),
+                                             velocities=np.asarray(trajectory.velocities))
+            self.remember(key, trajectory)
+
+        return trajectory
+
+    # Cache a trajectory held in memory, writing it to the disk tier as well
+    def put(self, key, trajectory):
+        if trajectory_bytes(trajectory) <= self.memory_bytes:
+            self.remember(key, trajectory)
+
+        self.add_entry(key, trajectory)
+
+    # Cache the trajectory store at path by copying it into the disk tier. The original is left where it is, so the
+    # run it belongs to can still be continued without changing the cached copy
+    def put_store(self, key, path):
+        self.add_entry(key, TrajectoryStore.open(path).trajectory())
+
+    # Write a trajectory to the disk tier, after evicting old entries to make room for it. It is written to a
+    # temporary directory that is renamed into place once it is complete, so a reader never sees half an entry
+    def add_entry(self, key, trajectory):
+        path = self.entry_path(key)
+        size = trajectory_bytes(trajectory)
+        if size > self.disk_bytes or os.path.exists(path):
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.evict(self.disk_bytes - size)
+
+        save_stride = 1
+        if len(trajectory.times) > 1:
+            save_stride = max(int(round((trajectory.times[1] - trajectory.times[0]) / trajectory.step_size)), 1)
+
+        chunk_steps = min(max(len(trajectory.times), 1), max(default_chunk_bytes // (len(trajectory.ids) * 24), 1))
+
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(temporary_path, ignore_errors=True)
+
+        try:
+            store = TrajectoryStore.create(temporary_path, trajectory.ids, trajectory.names, trajectory.masses,
+                                           trajectory.step_size, save_stride, chunk_steps)
+            store.extend(trajectory.times, trajectory.positions, trajectory.velocities)
+            store.close()
+            store.compact()
+
+            os.replace(temporary_path, path)
+        except OSError:
+            shutil.rmtree(temporary_path, ignore_errors=True)
+
+    def remember(self, key, trajectory):
+        self.memory[key] = trajectory
+        self.memory.move_to_end(key)
+
+        while len(self.memory) > 1 and sum(trajectory_bytes(value) for value in self.memory.values()) > \
+                self.memory_bytes:
+            self.memory.popitem(last=False)
+
+    # Delete the least recently used disk tier entries until the tier takes up at most limit bytes
+    def evict(self, limit):
+        entries = []
+        for name in os.listdir(self.directory):
+            meta_path = os.path.join(self.directory, name, "meta.json")
+
+            # Entries still being written are left alone
+            if not name.endswith(".tmp") and os.path.exists(meta_path):
+                size = sum(entry.stat().st_size for entry in os.scandir(os.path.join(self.directory, name)))
+                entries.append((os.path.getmtime(meta_path), size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= limit:
+                break
+
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        self.memory.clear()
+        if os.path.exists(self.directory):
+            self.evict(0)
+
+    # Same as gravity_sim.simulate, but returning the cached trajectory of a configuration that was run before
+    def simulate(self, bodies, step_size, sim_time, save_stride=1, solver="direct", solver_options=None,
+                 integrator="verlet", integrator_options=None):
+        key = cache_key(bodies, step_size, sim_time, save_stride, solver, solver_options, integrator,
+                        integrator_options)
+        trajectory = self.get(key)
+
+        if trajectory is None:
+            trajectory = simulate(bodies, step_size, sim_time, solver=solver, solver_options=solver_options,
+                                  save_stride=save_stride, integrator=integrator,
+                                  integrator_options=integrator_options)
+            self.put(key, trajectory)
+
+        return trajectory
+
+
+# Bytes taken up by the arrays of a trajectory
+def trajectory_bytes(trajectory):
+    return sum(int(np.prod(np.shape(array))) * 8 for array in (trajectory.times, trajectory.positions,
+                                                               trajectory.velocities))
+
+# endregion
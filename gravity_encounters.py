@@ -0,0 +1,229 @@
+import itertools
+import numpy as np
+from gravity_sim import G
+from gravity_tree import expand_groups
+
+# region Global Definitions and Variables
+
+# A pair of bodies is in a close encounter when its free-fall time sqrt(r^3 / G(m_i + m_j)) is under this many steps,
+# so the step no longer resolves their orbit about each other
+default_encounter_steps = 16
+
+# Most substeps a step is split into for the bodies in close encounters
+default_max_substeps = 256
+
+# Up to this many bodies close_pairs simply checks every pair, which costs less than binning them
+grid_min_n = 64
+
+# Cache of the index arrays of every pair of n bodies, keyed by n
+all_pairs = {}
+
+# Offsets of the grid cells searched from each cell: the cell itself and the 13 of the 26 around it that come after
+# it, so every pair of neighbouring cells is searched once
+neighbour_offsets = [(0, 0, 0)] + [offset for offset in itertools.product((-1, 0, 1), repeat=3) if offset > (0, 0, 0)]
+
+# endregion
+
+
+# region Spatial Index
+
+# Pairs of bodies closer than radius, as index arrays i < j. Bodies are binned into a uniform grid of cells of side
+# radius and only bodies in neighbouring cells are compared, so it takes O(N + pairs) rather than O(N^2). Cells are
+# keyed by the rank of their coordinates among the occupied ones, which keeps the keys small however sparse the grid
+def close_pairs(positions, radius):
+    n = len(positions)
+    if n < 2 or not radius > 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    if n <= grid_min_n:
+        if n not in all_pairs:
+            all_pairs[n] = np.triu_indices(n, 1)
+
+        first, second = all_pairs[n]
+        delta = positions[second] - positions[first]
+        close = np.einsum('ij,ij->i', delta, delta) < radius * radius
+
+        return first[close], second[close]
+
+    cells = np.floor(positions / radius).astype(np.int64)
+    axes = [np.unique(cells[:, axis]) for axis in range(3)]
+    sizes = [len(values) for values in axes]
+
+    # Rank of the cell coordinate one below, the same as, and one above each body's on every axis, and whether that
+    # coordinate is occupied at all
+    ranks, occupied = {}, {}
+    for axis in range(3):
+        for step in (-1, 0, 1):
+            wanted = cells[:, axis] + step
+            rank = np.minimum(np.searchsorted(axes[axis], wanted), sizes[axis] - 1)
+            ranks[axis, step], occupied[axis, step] = rank, axes[axis][rank] == wanted
+
+    keys = (ranks[0, 0] * sizes[1] + ranks[1, 0]) * sizes[2] + ranks[2, 0]
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+
+    firsts, seconds = [], []
+    for offset in neighbour_offsets:
+        # Key of the neighbouring cell of every body, where that cell can be occupied at all
+        neighbour_keys = (ranks[0, offset[0]] * sizes[1] + ranks[1, offset[1]]) * sizes[2] + ranks[2, offset[2]]
+        valid = occupied[0, offset[0]] & occupied[1, offset[1]] & occupied[2, offset[2]]
+
+        start = np.searchsorted(sorted_keys, neighbour_keys, side="left")
+        counts = np.where(valid, np.searchsorted(sorted_keys, neighbour_keys, side="right") - start, 0)
+
+        group, within = expand_groups(counts)
+        first, second = group, order[start[group] + within]
+
+        # Bodies of the same cell are paired both ways and with themselves
+        if offset == (0, 0, 0):
+            first, second = first[first < second], second[first < second]
+
+        firsts.append(first)
+        seconds.append(second)
+
+    first, second = np.concatenate(firsts), np.concatenate(seconds)
+    delta = positions[second] - positions[first]
+    close = np.einsum('ij,ij->i', delta, delta) < radius * radius
+
+    return np.minimum(first[close], second[close]), np.maximum(first[close], second[close])
+
+# endregion
+
+
+# region Encounter Detection
+
+# Pairs of live bodies that are in a close encounter over a step of dt, or come within merge_radius of each other,
+# along with their shortest free-fall or crossing time. A pair counts from the closest it can get over the step, its
+# separation less the distance its relative velocity covers. Candidates are found with close_pairs at the largest
+# distance any pair can be in an encounter from, set by the two heaviest bodies and the fastest ones
+def encounter_pairs(positions, velocities, masses, live, dt, encounter_steps, merge_radius=0.0):
+    bodies = np.flatnonzero(live)
+    if len(bodies) < 2:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int), np.empty(0)
+
+    encounter_time = encounter_steps * dt
+    heaviest = np.sort(masses[bodies])[-2:].sum()
+    relative_velocities = velocities[bodies] - np.mean(velocities[bodies], axis=0)
+    spread = np.sqrt(np.max(np.einsum('ij,ij->i', relative_velocities, relative_velocities)))
+    radius = max(np.cbrt(G * heaviest * encounter_time ** 2), merge_radius) + 2 * spread * dt
+
+    first, second = close_pairs(positions[bodies], radius)
+    first, second = bodies[first], bodies[second]
+
+    delta = positions[second] - positions[first]
+    delta_v = velocities[second] - velocities[first]
+    distance = np.sqrt(np.einsum('ij,ij->i', delta, delta))
+    speed = np.sqrt(np.einsum('ij,ij->i', delta_v, delta_v))
+
+    closest = np.maximum(distance - speed * dt, 0)
+    pair_radius = np.maximum(np.cbrt(G * (masses[first] + masses[second]) * encounter_time ** 2), merge_radius)
+    encounter = closest < pair_radius
+
+    with np.errstate(divide="ignore"):
+        times = np.fmin(np.sqrt(distance ** 3 / (G * (masses[first] + masses[second]))), distance / speed)
+
+    return first[encounter], second[encounter], times[encounter]
+
+
+# Merge every pair closer than merge_radius into its heavier body, which takes the pair's total mass at their centre
+# of mass and moves with their total momentum. The lighter body is left massless and at rest where it was, and is
+# marked in state["merged"] with the index of the body it merged into. Each merge is recorded in
+# state["merge_events"] as [time, survivor, absorbed], time counting from the start of the run
+def merge_bodies(position, velocity, masses, first, second, merge_radius, time, state):
+    merged = state["merged"]
+
+    for i, j in zip(first.tolist(), second.tolist()):
+        if merged[i] >= 0 or merged[j] >= 0:
+            continue
+        if np.sum((position[j] - position[i]) ** 2) >= merge_radius * merge_radius:
+            continue
+
+        survivor, absorbed = (i, j) if masses[i] >= masses[j] else (j, i)
+        total = masses[i] + masses[j]
+
+        if total > 0:
+            position[survivor] = (masses[i] * position[i] + masses[j] * position[j]) / total
+            velocity[survivor] = (masses[i] * velocity[i] + masses[j] * velocity[j]) / total
+
+        masses[survivor] = total
+        masses[absorbed] = 0.0
+        velocity[absorbed] = 0.0
+        merged[absorbed] = survivor
+        state["merge_events"].append([time, survivor, absorbed])
+
+# endregion
+
+
+# region Encounter Integrator
+
+# One kick-drift-kick Verlet step in which bodies in close encounters get substeps of their own. The force is split
+# into the pull between the bodies in encounters, found with encounter_pairs, and everything else: all bodies are
+# kicked by the rest over half steps either side, and while the others drift the bodies in encounters take as many
+# kick-drift-kick substeps under their mutual pull as their shortest free-fall or crossing time needs, up to
+# max_substeps. A near miss then only costs substeps of the few bodies involved, rather than a small step for the
+# whole run. With a merge_radius, pairs coming closer than it are merged (see merge_bodies). The masses given are
+# never changed: the run's masses, merges included, are kept in state["masses"], which starts out as a copy of them.
+# state["substeps"] counts the substeps taken and state["time"] the time integrated
+def encounter_step(position, velocity, accel, masses, dt, accel_func, state, encounter_steps=default_encounter_steps,
+                   max_substeps=default_max_substeps, merge_radius=0.0):
+    if "merged" not in state:
+        state["merged"] = np.full(len(masses), -1)
+        state["merge_events"] = []
+
+    if "masses" not in state:
+        state["masses"] = np.array(masses, dtype=float)
+
+    masses = state["masses"]
+    merged = state["merged"]
+    live = merged < 0
+    time = state.get("time", 0.0)
+
+    first, second, times = encounter_pairs(position, velocity, masses, live, dt, encounter_steps, merge_radius)
+    close = np.unique(np.concatenate((first, second)))
+
+    position = position.copy()
+    velocity = velocity + accel * (dt / 2)
+    velocity[~live] = 0.0
+
+    if len(close) == 0:
+        position += velocity * dt
+    else:
+        substeps = int(np.clip(np.ceil(encounter_steps * dt / np.min(times)), 1, max_substeps))
+        h = dt / substeps
+
+        # The pull between the close bodies is taken out of the kick and given back over the substeps. It is
+        # evaluated on the close bodies alone, so a substep costs O(k^2) for k of them rather than O(k * N)
+        close_accel = accel_func(position[close], masses[close])
+        velocity[close] -= close_accel * (dt / 2)
+
+        far = np.ones(len(masses), dtype=bool)
+        far[close] = False
+        position[far] += velocity[far] * dt
+
+        for substep in range(substeps):
+            velocity[close] += close_accel * (h / 2)
+            position[close] += velocity[close] * h
+            close_accel = accel_func(position[close], masses[close])
+            velocity[close] += close_accel * (h / 2)
+
+            # Bodies merged away stay where they are for the rest of the step
+            if merge_radius > 0:
+                merges = len(state["merge_events"])
+                merge_bodies(position, velocity, masses, first, second, merge_radius, time + (substep + 1) * h, state)
+
+                if len(state["merge_events"]) > merges:
+                    close = close[merged[close] < 0]
+                    close_accel = accel_func(position[close], masses[close])
+
+        # The close bodies' mutual pull at the end of the step is taken back out of the last half kick
+        velocity[close] -= close_accel * (dt / 2)
+        state["substeps"] = state.get("substeps", 0) + substeps
+
+    new_accel = accel_func(position, masses)
+    velocity += new_accel * (dt / 2)
+    velocity[merged >= 0] = 0.0
+    state["time"] = time + dt
+
+    return position, velocity, new_accel
+
+# endregion
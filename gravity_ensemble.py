@@ -0,0 +1,178 @@
+import numpy as np
+from collections import namedtuple
+from gravity_sim import G, Trajectory, accel_small_n, bodies_to_arrays, default_sim_time, default_step_size, \
+    default_test_particle_mass, get_accel_func, get_integrator, identity_mask, integrate, test_particle_mask
+
+# region Global Definitions and Variables
+
+# Per-step statistics of an ensemble over its members, for when the members' trajectories aren't needed. Mean and
+# std positions are (steps, N, 3) arrays, final positions and velocities are (M, N, 3)
+EnsembleSummary = namedtuple('EnsembleSummary', ['ids', 'names', 'step_size', 'times', 'mean_positions',
+                                                 'std_positions', 'final_positions', 'final_velocities'])
+
+# Largest number of (member, body, body) pairs the batched kernel evaluates at once, bounding its temporary arrays
+batch_pair_limit = 2 ** 18
+
+# Integrators that only use elementwise arithmetic on the state arrays, so they can advance a batch of members at once
+batch_integrators = {"verlet", "yoshida4", "adaptive"}
+
+# endregion
+
+
+# region Ensemble Kernels
+
+# Calculate the acceleration of every body of every member from (M, N, 3) positions and (M, N) masses, evaluating
+# the pairs of as many members as fit in batch_pair_limit in one go, with the force softened over a length of softening
+def n_body_accel_batch(positions, masses, softening=0.0):
+    count, n = masses.shape
+    accelerations = np.empty(positions.shape)
+    members = max(batch_pair_limit // max(n * n, 1), 1)
+
+    for start in range(0, count, members):
+        delta = positions[start:start + members, np.newaxis, :] - positions[start:start + members, :, np.newaxis]
+
+        # Self pairs have zero separation, padding their distance keeps them at zero acceleration without dividing by zero
+        distance_sq = np.einsum('bijk,bijk->bij', delta, delta) + identity_mask(n)
+        if softening:
+            distance_sq += softening * softening
+        scaler = (G * masses[start:start + members, np.newaxis, :]) * distance_sq ** -1.5
+
+        accelerations[start:start + members] = np.einsum('bij,bijk->bik', scaler, delta)
+
+    return accelerations
+
+
+# Batched version of a force solver. The direct sum of small systems is evaluated for every member at once, unless a
+# compute backend is chosen for it. Other solvers, and systems large enough that one member already fills the kernel,
+# are called once per member
+def get_batch_accel_func(solver="direct", solver_options=None):
+    accel_func = get_accel_func(solver, solver_options)
+
+    def batch_accel(positions, masses):
+        if solver == "direct" and (solver_options or {}).get("backend", "auto") == "auto" and \
+                masses.shape[1] <= accel_small_n:
+            return n_body_accel_batch(positions, masses, (solver_options or {}).get("softening", 0.0))
+
+        return np.stack([accel_func(positions[i], masses[i]) for i in range(len(masses))])
+
+    return batch_accel
+
+# endregion
+
+
+# region Ensemble API
+
+# Split each member (a dictionary or iterable of bodies, like simulate takes) into arrays stacked along a leading
+# member axis. Every member has to hold the same bodies in the same order
+def members_to_arrays(members):
+    members = [bodies_to_arrays(bodies) for bodies in members]
+
+    if not members:
+        raise ValueError("An ensemble needs at least one member")
+
+    ids, names = members[0][0], members[0][1]
+    for member_ids, _, _, _, _ in members:
+        if member_ids != ids:
+            raise ValueError("Every member of an ensemble must hold the same bodies in the same order")
+
+    positions, velocities, masses = (np.stack([member[field] for member in members]) for field in (2, 3, 4))
+
+    return ids, names, positions, velocities, masses
+
+
+# (M, N) masses the bodies of every member attract others with, zero for the bodies that are test particles in that
+# member (see gravity_sim.test_particle_mask), so they feel the other bodies' gravity but exert none
+def members_gravitating_masses(members, masses, test_particle_mass=default_test_particle_mass):
+    gravitating = masses.copy()
+
+    for i, bodies in enumerate(members):
+        test_particles = test_particle_mask(bodies, masses[i], test_particle_mass)
+        if test_particles is not None:
+            gravitating[i, test_particles] = 0.0
+
+    return gravitating
+
+
+# Copies of bodies with one property of one body replaced by each of the given values, e.g. a sweep of the Moon's
+# initial velocity: sweep_bodies(bodies, "moon", "velocity", [Vec3(0, 29290 + dv, 0) for dv in range(900, 1040)])
+def sweep_bodies(bodies, body_id, field, values):
+    if isinstance(bodies, dict):
+        bodies = bodies.values()
+
+    bodies = list(bodies)
+
+    if body_id not in [body.id for body in bodies]:
+        raise ValueError(f"No body with id '{body_id}' to sweep")
+
+    return [[body._replace(**{field: value}) if body.id == body_id else body for body in bodies] for value in values]
+
+
+# count copies of bodies with every position, velocity, and mass scaled by independent normally distributed factors
+# of 1 +/- the given relative spreads
+def perturb_bodies(bodies, count, position_spread=0.0, velocity_spread=0.0, mass_spread=0.0, seed=0):
+    if isinstance(bodies, dict):
+        bodies = bodies.values()
+
+    bodies = list(bodies)
+    rng = np.random.default_rng(seed)
+    members = []
+
+    for _ in range(count):
+        member = []
+        for body in bodies:
+            position = np.asarray(body.position, dtype=float) * rng.normal(1, position_spread, 3)
+            velocity = np.asarray(body.velocity, dtype=float) * rng.normal(1, velocity_spread, 3)
+            mass = body.mass * rng.normal(1, mass_spread)
+
+            member.append(body._replace(position=type(body.position)(*position),
+                                        velocity=type(body.velocity)(*velocity), mass=mass))
+        members.append(member)
+
+    return members
+
+
+# Solve M members (body sets, see sweep_bodies and perturb_bodies) together along a leading batch axis, so the Python
+# overhead of each step is paid once for the whole ensemble. Returns a list of one Trajectory per member, each a view
+# into shared (M, steps, N, 3) arrays, or with summary set only an EnsembleSummary, whose memory doesn't grow with M.
+# Test particles are handled as in simulate, they are integrated with a mass of 0
+def simulate_ensemble(members, step_size=default_step_size, sim_time=default_sim_time, save_stride=1, summary=False,
+                      solver="direct", solver_options=None, integrator="verlet", integrator_options=None,
+                      test_particle_mass=default_test_particle_mass):
+    if integrator not in batch_integrators:
+        raise ValueError(f"The {integrator} integrator can't run ensembles, expected one of "
+                         f"{', '.join(sorted(batch_integrators))}")
+
+    members = list(members)
+    ids, names, positions, velocities, masses = members_to_arrays(members)
+    gravitating = members_gravitating_masses(members, masses, test_particle_mass)
+    accel_func = get_batch_accel_func(solver, solver_options)
+    step_func = get_integrator(integrator, integrator_options)
+
+    save_stride = max(int(save_stride), 1)
+    rows = (sim_time - 1) // save_stride + 1 if sim_time > 0 else 0
+    times = np.arange(rows) * float(step_size * save_stride)
+
+    if summary:
+        mean_positions = np.zeros((rows,) + positions.shape[1:])
+        std_positions = np.zeros((rows,) + positions.shape[1:])
+    else:
+        saved_positions = np.zeros((len(masses), rows) + positions.shape[1:])
+        saved_velocities = np.zeros((len(masses), rows) + positions.shape[1:])
+
+    for i, position, velocity, _ in integrate(positions, velocities, gravitating, step_size, sim_time, accel_func,
+                                              step_func):
+        if i % save_stride == 0:
+            if summary:
+                mean_positions[i // save_stride] = position.mean(axis=0)
+                std_positions[i // save_stride] = position.std(axis=0)
+            else:
+                saved_positions[:, i // save_stride] = position
+                saved_velocities[:, i // save_stride] = velocity
+
+    if summary:
+        return EnsembleSummary(ids, names, step_size, times, mean_positions, std_positions, position, velocity)
+
+    return [Trajectory(ids, names, masses[i], step_size, times, saved_positions[i], saved_velocities[i])
+            for i in range(len(masses))]
+
+# endregion
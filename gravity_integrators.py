@@ -0,0 +1,347 @@
+import math
+import numpy as np
+from gravity_sim import G, accel_block_size
+
+# region Global Definitions and Variables
+
+# Weights of the 4th order Yoshida (Forest-Ruth) integrator, which composes three Verlet steps of w1, w0, and w1
+# times the step size. w0 is negative, so the middle step goes backwards in time
+yoshida_w1 = 1 / (2 - 2 ** (1 / 3))
+yoshida_w0 = -2 ** (1 / 3) / (2 - 2 ** (1 / 3))
+
+# Dormand-Prince 5(4) coefficients. The last row of dopri_a holds the 5th order weights, so the final stage is
+# evaluated at the new state and its acceleration is reused as the first stage of the next step
+dopri_a = [[],
+           [1 / 5],
+           [3 / 40, 9 / 40],
+           [44 / 45, -56 / 15, 32 / 9],
+           [19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729],
+           [9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656],
+           [35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84]]
+
+# Difference between the 5th and 4th order weights, giving the error estimate of a step
+dopri_e = [71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40]
+
+# Default tolerances of the adaptive integrator. Errors are measured against the largest position and velocity in
+# the system, so rtol is roughly the relative error allowed per substep
+default_rtol = 1e-9
+default_atol = 1e-6
+
+# Limits on how much the adaptive integrator changes its substep at once
+substep_safety = 0.9
+substep_min_factor = 0.2
+substep_max_factor = 5
+
+# Defaults of the block timestep integrator. Each body's substep is the largest power-of-two fraction of the step
+# below block_eta times its dynamical time, and no finer than 2^-block_max_level of the step
+default_block_eta = 0.005
+default_block_max_level = 16
+
+# Limits of the Kepler solver of the Wisdom-Holman integrator. Its Stumpff functions are summed as series below
+# stumpff_series_limit, where their closed forms lose precision to cancellation
+kepler_max_iterations = 50
+kepler_tolerance = 1e-14
+stumpff_series_limit = 1.0
+
+# Terms of the Stumpff function series, c2(z) = sum (-z)^k / (2k + 2)! and c3(z) = sum (-z)^k / (2k + 3)!, as
+# columns of k. Eleven terms reach double precision for |z| up to stumpff_series_limit
+stumpff_series = np.array([[[1 / math.factorial(2 * k + 2)], [1 / math.factorial(2 * k + 3)]] for k in range(11)])
+
+# endregion
+
+
+# region Symplectic Integrators
+
+# One 4th order Yoshida step, three kick-drift-kick Verlet steps whose errors cancel up to 4th order. It costs three
+# force evaluations per step but, like Verlet, keeps the energy error bounded over long runs
+def yoshida4_step(position, velocity, accel, masses, dt, accel_func, state):
+    for weight in (yoshida_w1, yoshida_w0, yoshida_w1):
+        h = weight * dt
+
+        velocity = velocity + accel * (h / 2)
+        position = position + velocity * h
+        accel = accel_func(position, masses)
+        velocity = velocity + accel * (h / 2)
+
+    return position, velocity, accel
+
+
+# Stumpff functions c2(z) and c3(z) of the universal variable Kepler problem, for elliptic (z > 0) and hyperbolic
+# (z < 0) orbits alike
+def stumpff(z):
+    c2 = np.empty_like(z)
+    c3 = np.empty_like(z)
+
+    small = np.abs(z) < stumpff_series_limit
+    if small.any():
+        small_z = z[small]
+        series = 0.0
+        for coefficients in stumpff_series[::-1]:
+            series = coefficients - small_z * series
+        c2[small], c3[small] = series
+
+    elliptic = z >= stumpff_series_limit
+    if elliptic.any():
+        root = np.sqrt(z[elliptic])
+        c2[elliptic] = (1 - np.cos(root)) / z[elliptic]
+        c3[elliptic] = (root - np.sin(root)) / root ** 3
+
+    hyperbolic = z <= -stumpff_series_limit
+    if hyperbolic.any():
+        root = np.sqrt(-z[hyperbolic])
+        c2[hyperbolic] = (np.cosh(root) - 1) / -z[hyperbolic]
+        c3[hyperbolic] = (np.sinh(root) - root) / root ** 3
+
+    return c2, c3
+
+
+# Move bodies along their two body orbits around a fixed mass of gravitational parameter mu for a time dt, returning
+# the new relative positions and velocities and the universal anomalies chi of the moves. The Kepler equation is
+# solved for chi by Laguerre-Conway iterations from chi_guess, which converge for any eccentricity
+def kepler_drift(position, velocity, mu, dt, chi_guess=None):
+    sqrt_mu = np.sqrt(mu)
+    r0 = np.sqrt(np.einsum('ij,ij->i', position, position))
+    eta0 = np.einsum('ij,ij->i', position, velocity) / sqrt_mu
+    alpha = 2 / r0 - np.einsum('ij,ij->i', velocity, velocity) / mu
+    beta = 1 - alpha * r0
+
+    if chi_guess is None or len(chi_guess) != len(r0):
+        chi_guess = sqrt_mu * dt * np.where(alpha > 0, alpha, 1 / r0)
+    chi = np.array(chi_guess, dtype=float)
+
+    for _ in range(kepler_max_iterations):
+        z = alpha * chi ** 2
+        c2, c3 = stumpff(z)
+
+        f = eta0 * chi ** 2 * c2 + beta * chi ** 3 * c3 + r0 * chi - sqrt_mu * dt
+        df = eta0 * chi * (1 - z * c3) + beta * chi ** 2 * c2 + r0
+        ddf = eta0 * (1 - z * c2) + beta * chi * (1 - z * c3)
+
+        delta = 5 * f / (df + np.sign(df) * np.sqrt(np.abs(16 * df ** 2 - 20 * f * ddf)))
+        chi = chi - delta
+
+        if np.all(np.abs(delta) <= kepler_tolerance * np.abs(chi)):
+            break
+
+    z = alpha * chi ** 2
+    c2, c3 = stumpff(z)
+
+    # Lagrange's f and g coefficients give the new state as a combination of the old position and velocity
+    f = 1 - chi ** 2 * c2 / r0
+    g = dt - chi ** 3 * c3 / sqrt_mu
+    new_position = f[:, np.newaxis] * position + g[:, np.newaxis] * velocity
+
+    r = np.sqrt(np.einsum('ij,ij->i', new_position, new_position))
+    f_dot = sqrt_mu / (r * r0) * chi * (z * c3 - 1)
+    g_dot = 1 - chi ** 2 * c2 / r
+    new_velocity = f_dot[:, np.newaxis] * position + g_dot[:, np.newaxis] * velocity
+
+    return new_position, new_velocity, chi
+
+
+# One Wisdom-Holman step in democratic heliocentric coordinates, for systems dominated by one central body. Positions
+# are taken relative to the central body and velocities relative to the barycentre, so each body's motion splits into
+# its Kepler orbit around the central body, solved exactly, and the much weaker pull of the other bodies, applied as
+# half step kicks either side of the orbit, along with the drift of the central body. Only orbits around the central
+# body gain from this, a moon's orbit around its planet is no more accurate than with Verlet at the same step, and a
+# step costs far more than Verlet's for solving the Kepler orbits, at one force evaluation per step. The pull of
+# the other bodies is kept in state["interaction_accel"] between steps, and the last universal anomalies in
+# state["kepler_chi"] as the starting point of the next Kepler solution
+def wisdom_holman_step(position, velocity, accel, masses, dt, accel_func, state):
+    central = int(np.argmax(masses))
+    others = np.arange(len(masses)) != central
+    central_mass = masses[central]
+    total_mass = np.sum(masses)
+    other_masses = masses[others]
+
+    # Test particles come in with a mass of 0 (see gravitating_masses), so mass weighted sums only run over the bodies
+    # that gravitate and adding test particles leaves the others' motion unchanged
+    massive = np.flatnonzero(masses)
+    other_massive = np.flatnonzero(other_masses)
+    other_massive_masses = other_masses[other_massive]
+
+    # The pull of the other bodies alone is the acceleration with the central body massless
+    interaction_masses = masses.copy()
+    interaction_masses[central] = 0.0
+    if "interaction_accel" not in state:
+        state["interaction_accel"] = accel_func(position, interaction_masses)
+
+    barycentre = masses[massive] @ position[massive] / total_mass
+    barycentre_velocity = masses[massive] @ velocity[massive] / total_mass
+    helio_position = position[others] - position[central]
+    bary_velocity = velocity[others] - barycentre_velocity
+
+    bary_velocity = bary_velocity + state["interaction_accel"][others] * (dt / 2)
+    helio_position = helio_position + (other_massive_masses @ bary_velocity[other_massive]) * (dt / (2 * central_mass))
+    helio_position, bary_velocity, state["kepler_chi"] = kepler_drift(helio_position, bary_velocity,
+                                                                      G * central_mass, dt, state.get("kepler_chi"))
+    helio_position = helio_position + (other_massive_masses @ bary_velocity[other_massive]) * (dt / (2 * central_mass))
+
+    # Back to positions and velocities in the original frame, in which the barycentre moves uniformly
+    central_position = barycentre + barycentre_velocity * dt - \
+        other_massive_masses @ helio_position[other_massive] / total_mass
+    new_position = np.empty_like(position)
+    new_position[central] = central_position
+    new_position[others] = helio_position + central_position
+
+    interaction = accel_func(new_position, interaction_masses)
+    bary_velocity = bary_velocity + interaction[others] * (dt / 2)
+
+    new_velocity = np.empty_like(velocity)
+    new_velocity[central] = barycentre_velocity - other_massive_masses @ bary_velocity[other_massive] / central_mass
+    new_velocity[others] = bary_velocity + barycentre_velocity
+    state["interaction_accel"] = interaction
+
+    # Callers get the full accelerations, with the central body's pull added back
+    distance = np.sqrt(np.einsum('ij,ij->i', helio_position, helio_position))
+    new_accel = interaction.copy()
+    new_accel[others] -= helio_position * (G * central_mass / distance ** 3)[:, np.newaxis]
+
+    return new_position, new_velocity, new_accel
+
+# endregion
+
+
+# region Adaptive Integrators
+
+# One Dormand-Prince substep of size h, returning the new position, velocity, and acceleration, and the position
+# and velocity error estimates
+def dopri5_substep(position, velocity, accel, masses, h, accel_func):
+    stage_velocities = [velocity]
+    stage_accels = [accel]
+
+    for weights in dopri_a[1:]:
+        stage_position = position + h * sum(w * v for w, v in zip(weights, stage_velocities) if w != 0)
+        stage_velocity = velocity + h * sum(w * a for w, a in zip(weights, stage_accels) if w != 0)
+
+        stage_velocities.append(stage_velocity)
+        stage_accels.append(accel_func(stage_position, masses))
+
+    position_error = h * sum(e * v for e, v in zip(dopri_e, stage_velocities) if e != 0)
+    velocity_error = h * sum(e * a for e, a in zip(dopri_e, stage_accels) if e != 0)
+
+    return stage_position, stage_velocity, stage_accels[-1], position_error, velocity_error
+
+
+# One output step made of as many Dormand-Prince substeps as the tolerance needs. The substep size is carried over
+# between steps in state["substep"], and state["accepted"] and state["rejected"] count the substeps taken
+def adaptive_step(position, velocity, accel, masses, dt, accel_func, state, rtol=default_rtol, atol=default_atol):
+    time_left = dt
+    h = state.get("substep", dt)
+
+    while time_left > 0:
+        last = h >= time_left * (1 - 1e-12)
+        h_used = time_left if last else h
+
+        new_position, new_velocity, new_accel, position_error, velocity_error = \
+            dopri5_substep(position, velocity, accel, masses, h_used, accel_func)
+
+        position_scale = atol + rtol * max(np.abs(position).max(initial=0), np.abs(new_position).max(initial=0))
+        velocity_scale = atol + rtol * max(np.abs(velocity).max(initial=0), np.abs(new_velocity).max(initial=0))
+        error = max(np.abs(position_error).max(initial=0) / position_scale,
+                    np.abs(velocity_error).max(initial=0) / velocity_scale)
+
+        factor = substep_safety * error ** -0.2 if error > 0 else substep_max_factor
+        factor = min(max(factor, substep_min_factor), substep_max_factor)
+
+        if error <= 1:
+            position, velocity, accel = new_position, new_velocity, new_accel
+            time_left = 0 if last else time_left - h_used
+            state["accepted"] = state.get("accepted", 0) + 1
+
+            # A final substep cut short to land on the output step says little about the size of the next one
+            if not (last and h_used < h):
+                h = h_used * factor
+        else:
+            state["rejected"] = state.get("rejected", 0) + 1
+            h = h_used * factor
+
+    state["substep"] = h
+
+    return position, velocity, accel
+
+# endregion
+
+
+# region Block Timestep Integrators
+
+# Local dynamical time of the target bodies, the shortest over every other body of the pair's free-fall time
+# sqrt(r^3 / G(m_i + m_j)) and of the time r / |v_ij| they take to cross their separation
+def dynamical_times(positions, velocities, masses, targets):
+    times = np.full(len(targets), np.inf)
+
+    for start in range(0, len(targets), accel_block_size):
+        rows = targets[start:start + accel_block_size]
+
+        delta = positions[np.newaxis, :] - positions[rows, np.newaxis]
+        delta_v = velocities[np.newaxis, :] - velocities[rows, np.newaxis]
+        distance = np.sqrt(np.einsum('ijk,ijk->ij', delta, delta))
+        speed_sq = np.einsum('ijk,ijk->ij', delta_v, delta_v)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            free_fall = np.sqrt(distance ** 3 / (G * (masses[rows, np.newaxis] + masses)))
+            crossing = distance / np.sqrt(speed_sq)
+
+        pair_times = np.fmin(free_fall, crossing)
+        pair_times[np.arange(len(rows)), rows] = np.inf
+        times[start:start + len(rows)] = np.nanmin(np.where(pair_times > 0, pair_times, np.inf), axis=1)
+
+    return times
+
+
+# Substep level of the target bodies, the substep of level k being dt / 2^k
+def block_levels(positions, velocities, masses, targets, dt, eta, max_level):
+    with np.errstate(divide="ignore"):
+        levels = np.ceil(np.log2(dt / (eta * dynamical_times(positions, velocities, masses, targets))))
+
+    return np.clip(levels, 0, max_level).astype(int)
+
+
+# One output step of hierarchical block timesteps. Every body gets its own power-of-two substep from its dynamical
+# time, and kick-drift-kick Verlet steps are taken with only the bodies at the end of a substep (the active ones)
+# being kicked and having their accelerations recomputed, while every body drifts. Bodies can move to a finer level
+# at the end of any substep but only one level coarser, at a time both substeps line up. The levels are kept in
+# state["levels"], and state["evaluations"] counts the body accelerations calculated
+def block_step(position, velocity, accel, masses, dt, accel_func, state, eta=default_block_eta,
+               max_level=default_block_max_level):
+    if "levels" not in state:
+        state["levels"] = block_levels(position, velocity, masses, np.arange(len(masses)), dt, eta, max_level)
+
+    levels = state["levels"]
+    position = position.copy()
+    velocity = velocity.copy()
+    accel = accel.copy()
+
+    # Time is counted in ticks of the finest possible substep, a body of level k taking substeps of 2^(max_level - k)
+    total_ticks = 2 ** max_level
+    tick_size = dt / total_ticks
+    tick = 0
+
+    while tick < total_ticks:
+        spans = 2 ** (max_level - levels)
+
+        # Bodies starting a substep get the first half of its kick
+        starting = tick % spans == 0
+        velocity[starting] += accel[starting] * (spans[starting] * (tick_size / 2))[:, np.newaxis]
+
+        # Drift every body to the next time any substep ends
+        next_tick = int(np.min((tick // spans + 1) * spans))
+        position += velocity * ((next_tick - tick) * tick_size)
+        tick = next_tick
+
+        active = np.flatnonzero(tick % spans == 0)
+        active_span = spans[active] * tick_size
+
+        new_accel = accel_func(position, masses, None if len(active) == len(masses) else active)
+        velocity[active] += new_accel * (active_span / 2)[:, np.newaxis]
+        accel[active] = new_accel
+        state["evaluations"] = state.get("evaluations", 0) + len(active)
+
+        active_levels = levels[active]
+        wanted = block_levels(position, velocity, masses, active, dt, eta, max_level)
+        coarser = (wanted < active_levels) & (tick % (spans[active] * 2) == 0)
+        levels[active] = np.where(wanted > active_levels, wanted, active_levels - coarser)
+
+    return position, velocity, accel
+
+# endregion
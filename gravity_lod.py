@@ -0,0 +1,100 @@
+import numpy as np
+
+# region Global Definitions and Variables
+
+# How far past the visible range points are still kept, as a fraction of the range on each side, so a small pan
+# doesn't show missing lines before the next decimation
+view_margin = 0.5
+
+# Most points a decimated line holds per pixel of plot width, beyond that runs of points are reduced to their extremes
+points_per_pixel = 4
+
+# endregion
+
+
+# region View Decimation
+
+# Mask of the points of x and y arrays (along their last axis) inside the given ranges, widened by view_margin, along
+# with the points either side of them, so segments entering and leaving the view are still drawn
+def visible_mask(x, y, x_range, y_range, margin=view_margin):
+    x_pad = (x_range[1] - x_range[0]) * margin
+    y_pad = (y_range[1] - y_range[0]) * margin
+
+    inside = (x >= x_range[0] - x_pad) & (x <= x_range[1] + x_pad) & (y >= y_range[0] - y_pad) & \
+             (y <= y_range[1] + y_pad)
+
+    mask = inside.copy()
+    mask[..., 1:] |= inside[..., :-1]
+    mask[..., :-1] |= inside[..., 1:]
+
+    return mask
+
+
+# Start and end (exclusive) indices of the runs of True in a 1D mask
+def mask_runs(mask):
+    edges = np.flatnonzero(np.diff(np.concatenate(([False], mask, [False])).astype(np.int8)))
+    return edges[::2], edges[1::2]
+
+
+# Indices of the points of each of groups of group_size consecutive points that have the smallest and largest x and
+# y, in order. A run reduced this way keeps its outline, as every excursion of the line is kept by its extreme point
+def extreme_indices(x, y, group_size):
+    groups = -(-len(x) // group_size)
+    padded = groups * group_size
+
+    indices = np.minimum(np.arange(padded), len(x) - 1).reshape(groups, group_size)
+    grouped_x, grouped_y = x[indices], y[indices]
+
+    offsets = np.stack([grouped_x.argmin(axis=1), grouped_x.argmax(axis=1),
+                        grouped_y.argmin(axis=1), grouped_y.argmax(axis=1)], axis=1)
+    extremes = np.sort(indices[np.arange(groups)[:, np.newaxis], offsets], axis=1).ravel()
+
+    return np.unique(np.concatenate(([0], extremes, [len(x) - 1])))
+
+
+# Points of one line to draw for a view of the given ranges and size in pixels. Points far outside the view are
+# dropped and the line is broken with a NaN where it leaves the view, consecutive points falling in the same pixel
+# are drawn as one, and if more than points_per_pixel * width points remain they are reduced to the extremes of runs
+# of points. NaNs already in x and y break the line the same way
+def decimate_view(x, y, x_range, y_range, width, height):
+    starts, ends = mask_runs(visible_mask(x, y, x_range, y_range))
+    if len(starts) == 0:
+        return np.empty(0), np.empty(0)
+
+    lengths = ends - starts
+    if len(starts) == 1:
+        points_x, points_y = x[starts[0]:ends[0]], y[starts[0]:ends[0]]
+    else:
+        indices = np.repeat(starts - np.cumsum(np.concatenate(([0], lengths[:-1]))), lengths) + \
+            np.arange(lengths.sum())
+        points_x, points_y = x[indices], y[indices]
+
+    # Pixel cells of the points, the first and last point of every run are always kept
+    cell_x = np.floor((points_x - x_range[0]) * (max(width, 1) / (x_range[1] - x_range[0])))
+    cell_y = np.floor((points_y - y_range[0]) * (max(height, 1) / (y_range[1] - y_range[0])))
+
+    keep = np.ones(len(points_x), dtype=bool)
+    keep[1:] = (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+
+    run_ends = np.cumsum(lengths)
+    keep[run_ends - lengths] = True
+    keep[run_ends - 1] = True
+
+    run_of_point = np.repeat(np.arange(len(lengths)), lengths)[keep]
+    points_x, points_y = points_x[keep], points_y[keep]
+
+    limit = points_per_pixel * max(width, 1)
+    if len(points_x) > limit:
+        reduced = extreme_indices(points_x, points_y, max(4 * len(points_x) // limit, 2))
+
+        # Keep the ends of every run too, so runs stay apart
+        run_edges = np.flatnonzero(np.diff(run_of_point)) + 1
+        reduced = np.union1d(reduced, np.concatenate((run_edges - 1, run_edges)))
+
+        points_x, points_y, run_of_point = points_x[reduced], points_y[reduced], run_of_point[reduced]
+
+    gaps = np.flatnonzero(np.diff(run_of_point)) + 1
+
+    return np.insert(points_x, gaps, np.nan), np.insert(points_y, gaps, np.nan)
+
+# endregion
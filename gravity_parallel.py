@@ -0,0 +1,258 @@
+import atexit
+import multiprocessing as mp
+import os
+import numpy as np
+from multiprocessing import shared_memory
+from gravity_sim import G, n_body_accel_array, n_body_accel_targets, upper_triangle_mask
+
+# region Global Definitions and Variables
+
+# Side length of the square tiles the N x N interaction matrix is split into. A tile's temporary arrays take about
+# 40 * tile_size^2 bytes
+default_tile_size = 256
+
+# Below this many bodies the pool's per-call messaging costs more than it saves, so the force is evaluated in-process
+parallel_min_n = 2048
+
+# Worker processes are spawned, like the simulation worker, so they never inherit the GUI's rendering context
+pool_context = mp.get_context("spawn")
+
+# Running pools, keyed by their worker count, kept alive between force evaluations
+force_pools = {}
+
+# endregion
+
+
+# region Tiling
+
+# Cache of tile assignments, keyed by (n, tile_size, workers)
+tile_assignments = {}
+
+
+# Split the upper triangle of the N x N interaction matrix, including the diagonal, into (row start, row end, column
+# start, column end) tiles and deal them out to the workers, largest remaining load first. Each tile is evaluated
+# once and applied to both its row and column bodies, so the whole matrix is covered by the upper triangle
+def assign_tiles(n, tile_size, workers):
+    key = (n, tile_size, workers)
+
+    if key not in tile_assignments:
+        starts = range(0, n, tile_size)
+        tiles = [(i, min(i + tile_size, n), j, min(j + tile_size, n)) for i in starts for j in starts if j >= i]
+
+        # Diagonal tiles only hold half their pairs
+        costs = [(i1 - i0) * (j1 - j0) / (2 if i0 == j0 else 1) for i0, i1, j0, j1 in tiles]
+
+        loads = [0.0] * workers
+        assignment = [[] for _ in range(workers)]
+        for cost, tile in sorted(zip(costs, tiles), reverse=True):
+            worker = loads.index(min(loads))
+            loads[worker] += cost
+            assignment[worker].append(tile)
+
+        tile_assignments[key] = assignment
+
+    return tile_assignments[key]
+
+
+# Add the interactions of one tile to accelerations, for both its row and its column bodies, softened by adding
+# softening_sq to every squared separation
+def accumulate_tile(positions, masses, accelerations, tile, softening_sq=0.0):
+    i0, i1, j0, j1 = tile
+
+    delta = positions[np.newaxis, j0:j1] - positions[i0:i1, np.newaxis]
+    distance_sq = np.einsum('ijk,ijk->ij', delta, delta)
+    if softening_sq:
+        distance_sq += softening_sq
+
+    if i0 == j0:
+        # Pad the lower triangle of a diagonal tile so self pairs don't divide by zero, then mask it out
+        upper, lower = upper_triangle_mask(i1 - i0)
+        scaler = G * (distance_sq + lower) ** -1.5 * upper
+    else:
+        scaler = G * distance_sq ** -1.5
+
+    accelerations[i0:i1] += np.einsum('ij,ijk->ik', scaler * masses[j0:j1], delta)
+    accelerations[j0:j1] -= np.einsum('ij,ijk->jk', scaler * masses[i0:i1, np.newaxis], delta)
+
+# endregion
+
+
+# region Worker Processes
+
+# Attach to the pool's shared arrays, given as (name, shape) pairs
+def attach_arrays(specs):
+    blocks = [shared_memory.SharedMemory(name=name) for name, _ in specs]
+    arrays = [np.ndarray(shape, dtype=float, buffer=block.buf) for block, (_, shape) in zip(blocks, specs)]
+
+    return blocks, arrays
+
+
+# Loop of one pool worker. The pool sends small messages only, the arrays themselves are shared:
+#   ("attach", specs)             attach to new shared position, mass, and partial acceleration arrays
+#   ("tiles", n, tile_size, softening)     add this worker's tiles into its own row of the partial accelerations
+#   ("targets", start, end, n, softening)  write the acceleration of targets[start:end] into the first row of the
+#                                          partials
+#   None                          exit
+def run_force_worker(index, workers, conn):
+    blocks, arrays = [], []
+
+    try:
+        while True:
+            message = conn.recv()
+
+            if message is None:
+                break
+
+            if message[0] == "attach":
+                arrays = []
+                for block in blocks:
+                    block.close()
+
+                blocks, arrays = attach_arrays(message[1])
+
+            elif message[0] == "tiles":
+                _, n, tile_size, softening = message
+                positions, masses, partials, _ = arrays
+
+                accelerations = partials[index, :n]
+                accelerations[:] = 0
+
+                for tile in assign_tiles(n, tile_size, workers)[index]:
+                    accumulate_tile(positions[:n], masses[:n], accelerations, tile, softening * softening)
+
+            elif message[0] == "targets":
+                _, start, end, n, softening = message
+                positions, masses, partials, targets = arrays
+
+                rows = targets[start:end].astype(int)
+                partials[0, start:end] = n_body_accel_targets(positions[:n], masses[:n], rows, softening)
+
+            conn.send(True)
+    finally:
+        arrays = []
+        for block in blocks:
+            block.close()
+        conn.close()
+
+# endregion
+
+
+# region Force Pool
+
+# Pool of persistent worker processes that evaluate the direct sum together. Positions and masses are copied into
+# shared memory once per evaluation, every worker adds its tiles into its own row of a shared (workers, N, 3) partial
+# acceleration array, and the rows are summed here, so no arrays are pickled
+class ForcePool:
+    def __init__(self, workers=None):
+        self.workers = max(int(workers or os.cpu_count() or 1), 1)
+        self.capacity = 0
+        self.blocks = []
+        self.arrays = []
+
+        self.connections = []
+        self.processes = []
+        for index in range(self.workers):
+            parent_conn, child_conn = pool_context.Pipe()
+            process = pool_context.Process(target=run_force_worker, args=(index, self.workers, child_conn),
+                                           daemon=True)
+            process.start()
+            child_conn.close()
+
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+    # Make sure the shared arrays can hold n bodies, growing them (and re-attaching the workers) if they can't
+    def reserve(self, n):
+        if n <= self.capacity:
+            return
+
+        self.release_arrays()
+        self.capacity = max(n, self.capacity * 2)
+
+        shapes = [(self.capacity, 3), (self.capacity,), (self.workers, self.capacity, 3), (self.capacity,)]
+        self.blocks = [shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8) for shape in shapes]
+        self.arrays = [np.ndarray(shape, dtype=float, buffer=block.buf) for block, shape in zip(self.blocks, shapes)]
+
+        self.broadcast([("attach", [(block.name, shape) for block, shape in zip(self.blocks, shapes)])])
+
+    # Send one message to each worker and wait until all of them are done
+    def broadcast(self, messages):
+        if len(messages) == 1:
+            messages = messages * self.workers
+
+        for conn, message in zip(self.connections, messages):
+            conn.send(message)
+
+        for conn in self.connections:
+            conn.recv()
+
+    def accel(self, positions, masses, targets=None, tile_size=default_tile_size, softening=0.0):
+        n = len(masses)
+        self.reserve(n)
+
+        shared_positions, shared_masses, partials, shared_targets = self.arrays
+        shared_positions[:n] = positions
+        shared_masses[:n] = masses
+
+        if targets is not None:
+            shared_targets[:len(targets)] = targets
+            bounds = np.linspace(0, len(targets), self.workers + 1).astype(int)
+            self.broadcast([("targets", start, end, n, softening) for start, end in zip(bounds[:-1], bounds[1:])])
+
+            return partials[0, :len(targets)].copy()
+
+        self.broadcast([("tiles", n, tile_size, softening)])
+
+        return partials[:, :n].sum(axis=0)
+
+    def release_arrays(self):
+        self.arrays = []
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+        self.blocks = []
+
+    def close(self):
+        for conn, process in zip(self.connections, self.processes):
+            if process.is_alive():
+                conn.send(None)
+
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+
+        self.release_arrays()
+
+
+# Pool with the given number of workers, started on first use and kept until the program exits
+def get_force_pool(workers=None):
+    workers = max(int(workers or os.cpu_count() or 1), 1)
+
+    if workers not in force_pools:
+        force_pools[workers] = ForcePool(workers)
+
+    return force_pools[workers]
+
+
+def close_force_pools():
+    for pool in force_pools.values():
+        pool.close()
+
+    force_pools.clear()
+
+
+atexit.register(close_force_pools)
+
+
+# Direct sum force solver evaluated across a pool of worker processes (os.cpu_count() of them by default). Small
+# systems are evaluated in-process, where the pool's messaging would cost more than it saves. The force is softened
+# over a length of softening (see gravity_sim.n_body_accel_array)
+def parallel_accel(positions, masses, targets=None, workers=None, tile_size=default_tile_size, softening=0.0):
+    if len(masses) < parallel_min_n:
+        return n_body_accel_array(positions, masses, targets, softening)
+
+    return get_force_pool(workers).accel(positions, masses, targets, tile_size, softening)
+
+# endregion
@@ -0,0 +1,119 @@
+import time
+from gravity_sim import Checkpoint, TrajectoryBuffer, bodies_to_arrays, checkpoint_accel_func, default_sim_time, \
+    default_step_size, default_test_particle_mass, get_integrator, gravitating_masses, integrate, \
+    test_particle_mask
+
+# region Global Definitions and Variables
+
+# Levels a preview is refined through, from the coarsest to the finest, as (step multiplier, share of the run). Each
+# level takes steps that many times the run's step size over that share of the run, so the first is done in a few
+# hundred steps and every later one takes about four times as long as the one before
+preview_levels = [(64, 0.25), (16, 0.5), (4, 1.0), (1, 1.0)]
+
+# Most steps a level takes, its horizon is shortened to fit
+preview_level_steps = 100000
+
+# Most points kept of each body's trajectory at every level, enough for a smooth line however long the level is
+preview_points = 2048
+
+# The preview is meant to be run in the caller's own thread, so the parallel solver's worker pool is swapped for the
+# direct sum, keeping only the options both share
+preview_solvers = {"parallel": ("direct", ["softening"])}
+
+# endregion
+
+
+# region Preview
+
+# Trajectory of a set of bodies computed a little at a time and refined progressively, for drawing a quick preview
+# while the bodies are being moved. advance(budget) integrates for at most budget seconds and can be called once a
+# frame. The first level takes coarse steps over a short horizon, and once it is done each later one starts over at a
+# finer step and a longer horizon (see preview_levels). buffer holds the positions of the finest level finished so
+# far, as a TrajectoryBuffer, or None until the first is done. A preview of bodies that have moved since is simply
+# dropped, which cancels the rest of its work
+class Preview:
+    def __init__(self, bodies, step_size=default_step_size, sim_time=default_sim_time, solver="direct",
+                 solver_options=None, integrator="verlet", integrator_options=None, levels=preview_levels,
+                 max_points=preview_points, test_particle_mass=default_test_particle_mass):
+        if isinstance(bodies, dict):
+            bodies = bodies.values()
+
+        if solver in preview_solvers:
+            solver, kept_options = preview_solvers[solver]
+            solver_options = {key: value for key, value in (solver_options or {}).items() if key in kept_options}
+
+        bodies = list(bodies)
+        self.ids, names, self.positions, self.velocities, self.masses = bodies_to_arrays(bodies)
+        start = Checkpoint(self.ids, names, self.masses, step_size, 0, self.positions, self.velocities, None, solver,
+                           solver_options, integrator, integrator_options, {},
+                           test_particle_mask(bodies, self.masses, test_particle_mass))
+
+        self.accel_func = checkpoint_accel_func(start)
+        self.gravitating = gravitating_masses(self.masses, start.test_particles)
+        self.step_func = get_integrator(integrator, integrator_options)
+        self.max_points = max(int(max_points), 1)
+
+        # Step size and number of steps of every level, leaving out levels that would repeat the one before
+        self.levels = []
+        for multiplier, share in levels:
+            steps = max(min(int(sim_time * share / multiplier), preview_level_steps), 1) + 1
+            level = (step_size * multiplier, steps)
+            if not self.levels or level != self.levels[-1]:
+                self.levels.append(level)
+
+        self.level = -1  # Level being computed, the last one finished is level - 1
+        self.buffer = None
+        self.steps = None
+        self.start_level(0)
+
+    # Start computing a level from the bodies' initial state
+    def start_level(self, level):
+        self.level = level
+        if level >= len(self.levels):
+            self.steps = None
+            return
+
+        dt, steps = self.levels[level]
+
+        # The stride is rounded up so the last step of the level is always kept
+        stride = -(-(steps - 1) // self.max_points)
+        steps = -(-(steps - 1) // stride) * stride + 1
+
+        self.building = TrajectoryBuffer(len(self.ids), stride, (steps - 1) // stride + 1)
+        self.steps = integrate(self.positions, self.velocities, self.gravitating, dt, steps, self.accel_func,
+                               self.step_func)
+
+    # Integrate for at most budget seconds, returning whether a level was finished, which replaces buffer
+    def advance(self, budget):
+        deadline = time.perf_counter() + budget
+        finished = False
+
+        while self.steps is not None:
+            stride = self.building.stride
+
+            for i, position, _, _ in self.steps:
+                if i % stride == 0:
+                    self.building.extend(position[None], i + 1, i)
+
+                if time.perf_counter() >= deadline:
+                    return finished
+
+            self.buffer = self.building
+            self.start_level(self.level + 1)
+            finished = True
+
+        return finished
+
+    # Whether every level has been finished
+    def is_done(self):
+        return self.steps is None
+
+    # Simulated time in seconds covered by the finest level finished so far
+    def horizon(self):
+        if self.level <= 0:
+            return 0.0
+
+        dt, _ = self.levels[self.level - 1]
+        return (self.buffer.next_step - self.buffer.stride) * dt
+
+# endregion
@@ -0,0 +1,602 @@
+import heapq
+import importlib
+import inspect
+import io
+import itertools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import error as url_error, request as url_request
+from gravity_cache import ResultCache, cache_key
+from gravity_sim import force_solvers, integrators, load_trajectory, save_trajectory, scenario_from_dict, \
+    scenario_to_dict
+from gravity_worker import SimulationWorker
+
+# region Global Definitions and Variables
+
+# Address the job server listens on by default. It only accepts connections from this machine
+default_host = "127.0.0.1"
+default_port = 8765
+default_server_url = f"http://{default_host}:{default_port}"
+
+# Most jobs run at once by default, each in a worker process of its own, the rest wait in the queue
+default_max_jobs = max((os.cpu_count() or 1) // 2, 1)
+
+# How often in seconds the scheduler checks on running jobs, and how often a job's event stream sends its progress
+scheduler_interval = 0.1
+
+# A job is queued, then running, and ends up in one of the finished states
+finished_states = ("done", "cancelled", "failed")
+
+# Arguments every force solver and integrator step function takes before its options, see gravity_sim
+solver_arguments = 3
+integrator_arguments = 7
+
+# endregion
+
+
+# region Jobs
+
+# Names of the options a force solver or integrator of gravity_sim takes after its first arguments arguments, or None
+# if it takes any keyword. Registry entries given as "module:function" are imported
+def accepted_options(entry, arguments):
+    if isinstance(entry, str):
+        module_name, function_name = entry.split(":")
+        entry = getattr(importlib.import_module(module_name), function_name)
+
+    parameters = list(inspect.signature(entry).parameters.values())
+    if any(parameter.kind == inspect.Parameter.VAR_KEYWORD for parameter in parameters):
+        return None
+
+    return [parameter.name for parameter in parameters[arguments:]]
+
+
+# Check a job request's solver or integrator (kind) against its registry, and its options against the ones the
+# function takes, raising ValueError for an unknown name or option. Jobs are checked before they are queued, so a typo
+# is reported to the client rather than failing in a worker process
+def check_setting(kind, name, options, registry, arguments):
+    if name not in registry:
+        raise ValueError(f"job request: unknown {kind} '{name}', expected one of {', '.join(registry)}")
+
+    if options is None:
+        return
+    if not isinstance(options, dict):
+        raise ValueError(f"job request: {kind}_options must be an object")
+
+    accepted = accepted_options(registry[name], arguments)
+    unknown = [option for option in options if accepted is not None and option not in accepted]
+    if unknown:
+        raise ValueError(f"job request: unknown {kind} option{'s' if len(unknown) > 1 else ''} "
+                         f"{', '.join(unknown)} for {name}, expected {', '.join(accepted) or 'none'}")
+
+
+# Whole-number entry of a job request, or default if it is missing. Raises ValueError naming the entry if it is not a
+# number, such as null, a list, or an object, which int() would otherwise reject with a TypeError
+def request_int(request, entry, default):
+    try:
+        return int(request.get(entry, default))
+    except (TypeError, ValueError):
+        raise ValueError(f"job request: {entry} must be a number")
+
+
+# One simulation job: the bodies and settings it runs, how far it has got, and how many submitters are waiting for it.
+# Identical jobs submitted while one is queued or running share it, and it is only cancelled once every one of them
+# has cancelled it
+class Job:
+    def __init__(self, job_id, key, scenario, settings, priority):
+        self.id = job_id
+        self.key = key
+        self.scenario = scenario
+        self.settings = settings
+        self.priority = priority
+        self.submitters = 1
+        self.status = "queued"
+        self.worker = None
+        self.steps_done = 0
+        self.stats = None
+        self.error = None
+        self.submitted = time.time()
+
+    # Plain dictionary of the job's state, ready for json.dumps
+    def summary(self):
+        sim_time = self.settings["sim_time"]
+
+        return {"id": self.id,
+                "key": self.key,
+                "name": self.scenario.name,
+                "status": self.status,
+                "priority": self.priority,
+                "submitters": self.submitters,
+                "steps_done": self.steps_done,
+                "sim_time": sim_time,
+                "progress": min(self.steps_done / max(sim_time, 1), 1.0),
+                "stats": self.stats,
+                "error": self.error,
+                "submitted": self.submitted}
+
+
+# Queue of simulation jobs run on a bounded pool of worker processes, highest priority first and in the order they
+# were submitted within a priority. Results go to a ResultCache, so a job whose result is cached finishes as soon as
+# it is submitted, and results can be fetched until the cache evicts them. A scheduler thread starts queued jobs and
+# collects the progress and results of running ones
+class JobServer:
+    def __init__(self, max_jobs=default_max_jobs, cache=None):
+        self.max_jobs = max(int(max_jobs), 1)
+        self.cache = ResultCache() if cache is None else cache
+        self.cache_lock = threading.Lock()  # The cache is used by the scheduler and every request thread
+        self.jobs = {}
+        self.active = {}  # Cache key -> queued or running job, for deduplication
+        self.queue = []  # Heap of (-priority, order, job id), stale entries are skipped
+        self.order = itertools.count()
+        self.lock = threading.Condition()
+        self.stopping = False
+        self.thread = threading.Thread(target=self.schedule, daemon=True)
+        self.thread.start()
+
+    # Queue a job from a request laid out like a JSON scenario file, with optional step_size, sim_time, save_stride,
+    # solver, solver_options, integrator, integrator_options, and priority entries. Returns the job and whether an
+    # identical job was already queued or running and is shared instead. Raises ValueError for a bad request
+    def submit(self, request):
+        try:
+            scenario = scenario_from_dict(request, "job", "job request")
+        except (KeyError, TypeError) as error:
+            raise ValueError(f"job request: missing or malformed {error}")
+
+        settings = {"step_size": request_int(request, "step_size", scenario.step_size),
+                    "sim_time": request_int(request, "sim_time", scenario.sim_time),
+                    "save_stride": max(request_int(request, "save_stride", 1), 1),
+                    "solver": request.get("solver", "direct"),
+                    "solver_options": request.get("solver_options"),
+                    "integrator": request.get("integrator", "verlet"),
+                    "integrator_options": request.get("integrator_options")}
+        priority = request_int(request, "priority", 0)
+
+        if not scenario.bodies:
+            raise ValueError("job request: no bodies")
+        if settings["sim_time"] < 1:
+            raise ValueError("job request: sim_time must be at least 1")
+
+        check_setting("solver", settings["solver"], settings["solver_options"], force_solvers, solver_arguments)
+        check_setting("integrator", settings["integrator"], settings["integrator_options"], integrators,
+                      integrator_arguments)
+
+        key = cache_key(scenario.bodies, **settings)
+
+        # Checked before taking the lock, as the scheduler holds the cache while it copies a result into it
+        with self.cache_lock:
+            cached = key in self.cache
+
+        with self.lock:
+            job = self.active.get(key)
+            if job is not None:
+                job.submitters += 1
+                if priority > job.priority:
+                    job.priority = priority
+                    if job.status == "queued":
+                        heapq.heappush(self.queue, (-priority, next(self.order), job.id))
+
+                return job, True
+
+            job = Job(f"{len(self.jobs) + 1}-{key[:12]}", key, scenario, settings, priority)
+            self.jobs[job.id] = job
+
+            if cached:
+                job.status = "done"
+                job.steps_done = settings["sim_time"]
+            else:
+                self.active[key] = job
+                heapq.heappush(self.queue, (-priority, next(self.order), job.id))
+
+            self.lock.notify_all()
+
+        return job, False
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def summaries(self):
+        with self.lock:
+            return [job.summary() for job in self.jobs.values()]
+
+    # Withdraw one submitter from a job, cancelling it once none are left. A queued job is dropped straight away, a
+    # running one is stopped by its worker
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.status in finished_states:
+                return job
+
+            job.submitters -= 1
+            if job.submitters > 0:
+                return job
+
+            if job.status == "queued":
+                job.status = "cancelled"
+                del self.active[job.key]
+            else:
+                job.worker.cancel()
+
+            self.lock.notify_all()
+            return job
+
+    # Finished job's trajectory from the cache, or None if it isn't done or its result has been evicted since
+    def result(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.status != "done":
+            return None
+
+        with self.cache_lock:
+            return self.cache.get(job.key)
+
+    # Wait until the job's state may have changed, or timeout seconds have passed
+    def wait(self, timeout=scheduler_interval):
+        with self.lock:
+            self.lock.wait(timeout)
+
+    # Scheduler loop: collect the progress of running jobs, move the results of finished ones into the cache, and
+    # start the highest priority queued jobs while there are free workers
+    def schedule(self):
+        while True:
+            with self.lock:
+                if self.stopping:
+                    return
+
+                running = [job for job in self.active.values() if job.status == "running"]
+                for job in running:
+                    job.steps_done = job.worker.steps_available()
+                    job.stats = job.worker.collect_stats() or job.stats
+
+                stopped = [job for job in running if not job.worker.is_running()]
+
+            # Caching copies the job's store, which is done without holding the lock
+            for job in stopped:
+                status, error = "done", None
+                if job.worker.is_finished():
+                    with self.cache_lock:
+                        self.cache.put_store(job.key, job.worker.store_path)
+                elif job.worker.cancel_event.is_set():
+                    status = "cancelled"
+                else:
+                    status, error = "failed", f"worker exited with code {job.worker.process.exitcode}"
+
+                job.worker.close()
+
+                with self.lock:
+                    job.status, job.error = status, error
+                    job.steps_done = job.worker.steps_available() if status != "done" else job.settings["sim_time"]
+                    del self.active[job.key]
+                    self.lock.notify_all()
+
+            with self.lock:
+                running_count = sum(job.status == "running" for job in self.active.values())
+                starting = []
+
+                while self.queue and running_count + len(starting) < self.max_jobs:
+                    negative_priority, _, job_id = heapq.heappop(self.queue)
+                    job = self.jobs[job_id]
+                    if job.status != "queued" or -negative_priority != job.priority:
+                        continue
+
+                    starting.append(job)
+
+            # Starting a worker process can be slow, so it is done without holding the lock
+            for job in starting:
+                self.start_job(job)
+
+            with self.lock:
+                if not self.stopping:
+                    self.lock.wait(scheduler_interval)
+
+    # Start a job taken off the queue in a worker process, which streams its trajectory to a temporary store until it
+    # is cached. Called without holding the lock, the job stays queued until its worker has started, and a job
+    # cancelled in the meantime has its worker closed straight away
+    def start_job(self, job):
+        settings = job.settings
+
+        try:
+            worker = SimulationWorker(job.scenario.bodies, settings["step_size"], settings["sim_time"],
+                                      settings["solver"], settings["solver_options"],
+                                      plot_stride=settings["sim_time"], save_stride=settings["save_stride"],
+                                      integrator=settings["integrator"],
+                                      integrator_options=settings["integrator_options"])
+        except (OSError, ValueError) as error:
+            with self.lock:
+                if job.status == "queued":
+                    job.status, job.error = "failed", str(error)
+                    del self.active[job.key]
+                    self.lock.notify_all()
+            return
+
+        with self.lock:
+            if job.status == "queued":
+                job.worker, job.status = worker, "running"
+                self.lock.notify_all()
+                return
+
+        worker.close()
+
+    # Stop the scheduler and every running job
+    def close(self):
+        with self.lock:
+            self.stopping = True
+            self.lock.notify_all()
+
+        self.thread.join()
+
+        for job in list(self.active.values()):
+            if job.worker is not None:
+                job.worker.close()
+            job.status = "cancelled"
+
+        self.active.clear()
+
+# endregion
+
+
+# region HTTP Interface
+
+# Requests of the job server, all JSON apart from results, which are sent as .npz files (see save_trajectory):
+#   POST   /jobs              submit a job, returns its summary and whether it was deduplicated
+#   GET    /jobs              summaries of every job
+#   GET    /jobs/<id>         summary of one job
+#   GET    /jobs/<id>/events  one summary per line whenever the job progresses, until it has finished
+#   GET    /jobs/<id>/result  the finished job's trajectory
+#   DELETE /jobs/<id>         cancel the job for this submitter
+class JobRequestHandler(BaseHTTPRequestHandler):
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Job named by the path, or None after sending a 404 if there is no such job
+    def path_job(self, parts):
+        job = self.server.jobs.get(parts[1]) if len(parts) >= 2 else None
+        if job is None:
+            self.send_json(404, {"error": f"no job at {self.path}"})
+
+        return job
+
+    def do_POST(self):
+        if self.path.strip("/") != "jobs":
+            return self.send_json(404, {"error": f"no resource at {self.path}"})
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            job, deduplicated = self.server.jobs.submit(request)
+        except ValueError as error:
+            return self.send_json(400, {"error": str(error)})
+
+        self.send_json(200, dict(job.summary(), deduplicated=deduplicated))
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts[0] != "jobs" or len(parts) > 3:
+            return self.send_json(404, {"error": f"no resource at {self.path}"})
+
+        if len(parts) == 1:
+            return self.send_json(200, self.server.jobs.summaries())
+
+        job = self.path_job(parts)
+        if job is None:
+            return
+
+        if len(parts) == 2:
+            return self.send_json(200, job.summary())
+
+        if parts[2] == "events":
+            return self.send_events(job)
+
+        if parts[2] == "result":
+            return self.send_result(job)
+
+        self.send_json(404, {"error": f"no resource at {self.path}"})
+
+    def do_DELETE(self):
+        job = self.path_job(self.path.strip("/").split("/"))
+        if job is not None:
+            self.server.jobs.cancel(job.id)
+            self.send_json(200, job.summary())
+
+    # Stream the job's summary as a line of JSON every time its state or progress changes. The connection is closed
+    # after the last line, once the job has finished
+    def send_events(self, job):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        last = None
+        while True:
+            summary = job.summary()
+            if summary != last:
+                try:
+                    self.wfile.write((json.dumps(summary) + "\n").encode())
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client stopped following the job, which keeps running for as long as it is wanted
+                    return
+
+                last = summary
+
+            if summary["status"] in finished_states:
+                return
+
+            self.server.jobs.wait()
+
+    def send_result(self, job):
+        trajectory = self.server.jobs.result(job.id)
+        if trajectory is None:
+            status = 410 if job.status == "done" else 409
+            return self.send_json(status, {"error": f"job {job.id} has no result ({job.status})"})
+
+        buffer = io.BytesIO()
+        save_trajectory(buffer, trajectory)
+        body = buffer.getvalue()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Requests are logged by the caller if at all, not to stderr
+    def log_message(self, format, *args):
+        pass
+
+
+# HTTP server of a JobServer, serving each request on a thread of its own
+class JobHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=(default_host, default_port), jobs=None):
+        super().__init__(address, JobRequestHandler)
+        self.jobs = JobServer() if jobs is None else jobs
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+# Start a job server in a background thread of this process, returning it. Port 0 picks a free port, see its url
+def start_server(host=default_host, port=default_port, max_jobs=default_max_jobs, cache=None):
+    server = JobHTTPServer((host, port), JobServer(max_jobs, cache))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+    server.jobs.close()
+
+# endregion
+
+
+# region Client
+
+# Send a request to the job server at url and return its decoded JSON reply. Errors the server reports are raised as
+# ValueError with its message
+def server_request(url, path, method="GET", data=None, timeout=10):
+    body = None if data is None else json.dumps(data).encode()
+    request = url_request.Request(f"{url}{path}", data=body, method=method,
+                                  headers={"Content-Type": "application/json"})
+
+    try:
+        with url_request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except url_error.HTTPError as error:
+        raise ValueError(json.loads(error.read()).get("error", str(error)))
+
+
+# Submit the bodies as a job with the given settings, returning its summary, which includes its id and whether an
+# identical job already running was shared
+def submit_job(url, bodies, step_size, sim_time, save_stride=1, solver="direct", solver_options=None,
+               integrator="verlet", integrator_options=None, priority=0):
+    if isinstance(bodies, dict):
+        bodies = bodies.values()
+
+    request = dict(scenario_to_dict(list(bodies), step_size, sim_time), save_stride=save_stride, solver=solver,
+                   solver_options=solver_options, integrator=integrator, integrator_options=integrator_options,
+                   priority=priority)
+
+    return server_request(url, "/jobs", "POST", request)
+
+
+def job_status(url, job_id):
+    return server_request(url, f"/jobs/{job_id}")
+
+
+def cancel_job(url, job_id):
+    return server_request(url, f"/jobs/{job_id}", "DELETE")
+
+
+# Generator of the job's summaries as it progresses, ending with the one in which it has finished
+def job_events(url, job_id, timeout=None):
+    with url_request.urlopen(f"{url}/jobs/{job_id}/events", timeout=timeout) as response:
+        for line in response:
+            yield json.loads(line)
+
+
+# Trajectory of a finished job
+def fetch_result(url, job_id, timeout=60):
+    try:
+        with url_request.urlopen(f"{url}/jobs/{job_id}/result", timeout=timeout) as response:
+            return load_trajectory(io.BytesIO(response.read()))
+    except url_error.HTTPError as error:
+        raise ValueError(json.loads(error.read()).get("error", str(error)))
+
+# endregion
+
+
+# region Command Line Interface
+
+# Either serve jobs until interrupted, or submit scenario files to a running server, print their progress, and save
+# their results as .npz files
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a local simulation job server, or submit jobs to one.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="serve jobs until interrupted")
+    serve_parser.add_argument("--host", default=default_host, help="address to listen on")
+    serve_parser.add_argument("--port", type=int, default=default_port, help="port to listen on")
+    serve_parser.add_argument("--max-jobs", type=int, default=default_max_jobs, help="most jobs run at once")
+    serve_parser.add_argument("--cache-dir", help="directory of the result cache (default: ~/.cache/gravity_sim)")
+
+    submit_parser = subparsers.add_parser("submit", help="submit scenario files and wait for their results")
+    submit_parser.add_argument("scenarios", nargs="+", help="JSON scenario files to run")
+    submit_parser.add_argument("--url", default=default_server_url, help="address of the job server")
+    submit_parser.add_argument("-o", "--out-dir", default="results", help="directory the .npz results are written to")
+    submit_parser.add_argument("--sim-time", type=int, help="override the number of steps of every scenario")
+    submit_parser.add_argument("--integrator", default="verlet", help="integrator")
+    submit_parser.add_argument("--save-stride", type=int, default=1, help="save every n-th step of the trajectory")
+    submit_parser.add_argument("--priority", type=int, default=0, help="priority of the jobs, highest runs first")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        cache = ResultCache() if args.cache_dir is None else ResultCache(args.cache_dir)
+        server = JobHTTPServer((args.host, args.port), JobServer(args.max_jobs, cache))
+        print(f"Serving jobs on {server.url} with {server.jobs.max_jobs} workers")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.jobs.close()
+        return
+
+    from gravity_sim import load_scenario
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    jobs = []
+    for path in args.scenarios:
+        scenario = load_scenario(path)
+        summary = submit_job(args.url, scenario.bodies, scenario.step_size, args.sim_time or scenario.sim_time,
+                             args.save_stride, integrator=args.integrator, priority=args.priority)
+        print(f"{path}: job {summary['id']}{' (shared with an identical job)' if summary['deduplicated'] else ''}")
+        jobs.append((scenario.name, summary["id"]))
+
+    for name, job_id in jobs:
+        for summary in job_events(args.url, job_id):
+            print(f"\r{name}: {summary['status']} {summary['progress']:.0%}", end="", flush=True)
+        print()
+
+        if summary["status"] == "done":
+            out_path = os.path.join(args.out_dir, f"{name}.npz")
+            save_trajectory(out_path, fetch_result(args.url, job_id))
+            print(f"{name}: saved {out_path}")
+
+
+if __name__ == "__main__":
+    main()
+
+# endregion
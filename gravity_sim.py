@@ -0,0 +1,1071 @@
+import csv
+import importlib
+import itertools
+import json
+import os
+import time
+import numpy as np
+from collections import namedtuple
+
+# region Global Definitions and Variables
+
+# Named tuples acting as sudo-classes for ease of data storage and manipulation
+Body = namedtuple('Body', ['id', 'name', 'position', 'velocity', 'mass', 'color', 'test_particle'], defaults=[False])
+Vec2 = namedtuple('Vector2', ['x', 'y'])
+Vec3 = namedtuple('Vector3', ['x', 'y', 'z'])
+
+# Result of a simulation, positions and velocities are (steps, N, 3) arrays ordered the same as ids
+Trajectory = namedtuple('Trajectory', ['ids', 'names', 'masses', 'step_size', 'times', 'positions', 'velocities'])
+
+# Bodies and simulation settings read from a scenario file
+Scenario = namedtuple('Scenario', ['name', 'bodies', 'step_size', 'sim_time'])
+
+# Everything needed to continue a run from one of its steps: the bodies, their state at that step, and the solver
+# and integrator settings along with the integrator's state dictionary. test_particles masks the bodies that are test
+# particles, or is None if none are
+Checkpoint = namedtuple('Checkpoint', ['ids', 'names', 'masses', 'step_size', 'step', 'positions', 'velocities',
+                                       'accelerations', 'solver', 'solver_options', 'integrator',
+                                       'integrator_options', 'integrator_state', 'test_particles'], defaults=[None])
+
+# Default simulation settings, matching the defaults of the GUI
+default_step_size = 500
+default_sim_time = 64000
+
+# Bodies no heavier than this are test particles even when they aren't flagged as one
+default_test_particle_mass = 0.0
+
+# How many steps apart checkpoints are written, when a run is given a checkpoint path
+default_checkpoint_freq = 10000
+
+# How many positions of each body a streaming run keeps, see stream
+default_stream_window = 4096
+
+# Directory results and measurements kept between sessions are written to, the result cache's stores (see
+# gravity_cache) and the compute backends' crossovers (see gravity_backends)
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "gravity_sim")
+
+# Gravitational constant in m^3 kg^-1 s^-2 (CODATA 2018, unchanged in 2022), kept as a plain float rather than read
+# from astropy.constants, whose import alone took longer than a short run
+G = 6.6743e-11
+
+
+# Bodies are keyed by an id derived from their name
+def body_id_from_name(name):
+    return f"{name.lower().replace(' ', '_')}"
+
+# endregion
+
+
+# region Physical Models and Calculations
+
+# Calculate the total acceleration of a body based on the summed forced of n other bodies, with the force softened
+# over a length of softening (see n_body_accel_array)
+def n_body_accel(body, n_bodies, softening=0.0):
+    accel_sum_x = 0
+    accel_sum_y = 0
+    accel_sum_z = 0
+
+    for n_body in n_bodies:
+        distance = np.sqrt((body.position.x - n_body.position.x) ** 2
+                           + (body.position.y - n_body.position.y) ** 2
+                           + (body.position.z - n_body.position.z) ** 2
+                           + softening ** 2)
+
+        scaler = -(G * n_body.mass) / distance ** 3
+
+        accel_sum_x += (body.position.x - n_body.position.x) * scaler
+        accel_sum_y += (body.position.y - n_body.position.y) * scaler
+        accel_sum_z += (body.position.z - n_body.position.z) * scaler
+
+    return Vec3(accel_sum_x, accel_sum_y, accel_sum_z)
+
+
+# Number of bodies per row block in the array acceleration kernel, bounding the size of its temporary arrays
+accel_block_size = 256
+
+# Below this many bodies the kernel's cost is call overhead rather than arithmetic, so each pair is simply evaluated twice
+accel_small_n = 32
+
+# Cache of the identity and strictly upper triangular masks used by the acceleration kernel, keyed by size
+identity_masks = {}
+upper_triangle_masks = {}
+
+
+def identity_mask(size):
+    if size not in identity_masks:
+        identity_masks[size] = np.identity(size)
+
+    return identity_masks[size]
+
+
+def upper_triangle_mask(size):
+    if size not in upper_triangle_masks:
+        upper = np.triu(np.ones((size, size)), 1)
+        upper_triangle_masks[size] = (upper, 1 - upper)
+
+    return upper_triangle_masks[size]
+
+
+# Calculate the acceleration of every body at once from an (N, 3) position array and an (N,) mass array, or only of
+# the target bodies (an index array) if they are given. A softening length above zero replaces every separation r by
+# sqrt(r^2 + softening^2) (Plummer softening), which bounds the force of close pairs instead of letting it spike
+def n_body_accel_array(positions, masses, targets=None, softening=0.0):
+    if targets is not None:
+        return n_body_accel_targets(positions, masses, targets, softening)
+
+    n = len(masses)
+
+    if n <= accel_small_n:
+        delta = positions[np.newaxis, :] - positions[:, np.newaxis]
+
+        # Self pairs have zero separation, padding their distance keeps them at zero acceleration without dividing by zero
+        distance_sq = np.einsum('ijk,ijk->ij', delta, delta) + identity_mask(n)
+        if softening:
+            distance_sq += softening * softening
+        scaler = (G * masses) * distance_sq ** -1.5
+
+        return np.einsum('ij,ijk->ik', scaler, delta)
+
+    accelerations = np.zeros((n, 3))
+
+    # Each pair is only evaluated once and applied to both bodies with opposite signs (Newton's third law)
+    for start in range(0, n, accel_block_size):
+        end = min(start + accel_block_size, n)
+        upper, lower = upper_triangle_mask(end - start)
+
+        # Separation of every body in the block from itself and every body after it
+        delta = positions[np.newaxis, start:] - positions[start:end, np.newaxis]
+        distance_sq = np.einsum('ijk,ijk->ij', delta, delta)
+        if softening:
+            distance_sq += softening * softening
+
+        # Pad the lower triangle of the diagonal block so self pairs don't divide by zero, then mask it out
+        distance_sq[:, :end - start] += lower
+        scaler = G * distance_sq ** -1.5
+        scaler[:, :end - start] *= upper
+
+        accelerations[start:end] += np.einsum('ij,ijk->ik', scaler * masses[start:], delta)
+        accelerations[start:] -= np.einsum('ij,ijk->jk', scaler * masses[start:end, np.newaxis], delta)
+
+    return accelerations
+
+
+# Calculate the acceleration of only the target bodies (an index array), from every body
+def n_body_accel_targets(positions, masses, targets, softening=0.0):
+    accelerations = np.zeros((len(targets), 3))
+
+    for start in range(0, len(targets), accel_block_size):
+        rows = targets[start:start + accel_block_size]
+
+        delta = positions[np.newaxis, :] - positions[rows, np.newaxis]
+        distance_sq = np.einsum('ijk,ijk->ij', delta, delta)
+        if softening:
+            distance_sq += softening * softening
+
+        # Self pairs have zero separation, padding their distance keeps them at zero acceleration without dividing by zero
+        distance_sq[np.arange(len(rows)), rows] = 1
+        scaler = (G * masses) * distance_sq ** -1.5
+
+        accelerations[start:start + len(rows)] = np.einsum('ij,ijk->ik', scaler, delta)
+
+    return accelerations
+
+
+# Calculate the acceleration at each of the given (M, 3) points from the bodies at positions, as felt by test
+# particles there. A few bodies are summed one at a time over coordinate arrays of every point, more are taken in
+# blocks of points of about accel_block_size^2 pairs, so the temporaries stay small either way
+def n_body_accel_points(points, positions, masses, softening=0.0):
+    softening_sq = softening * softening
+
+    if len(masses) <= accel_small_n:
+        x, y, z = np.ascontiguousarray(points.T)
+        accel_x, accel_y, accel_z = np.zeros((3, len(points)))
+
+        for j in range(len(masses)):
+            delta_x, delta_y, delta_z = positions[j, 0] - x, positions[j, 1] - y, positions[j, 2] - z
+            distance_sq = delta_x * delta_x + delta_y * delta_y + delta_z * delta_z + softening_sq
+            scaler = (G * masses[j]) * distance_sq ** -1.5
+
+            accel_x += delta_x * scaler
+            accel_y += delta_y * scaler
+            accel_z += delta_z * scaler
+
+        return np.stack((accel_x, accel_y, accel_z), axis=1)
+
+    accelerations = np.zeros((len(points), 3))
+    block_size = max(accel_block_size * accel_block_size // max(len(masses), 1), 1)
+
+    for start in range(0, len(points), block_size):
+        delta = positions[np.newaxis, :] - points[start:start + block_size, np.newaxis]
+        distance_sq = np.einsum('ijk,ijk->ij', delta, delta) + softening_sq
+        scaler = (G * masses) * distance_sq ** -1.5
+
+        accelerations[start:start + block_size] = np.einsum('ij,ijk->ik', scaler, delta)
+
+    return accelerations
+
+
+# Acceleration solvers selectable by name, each called as solver(positions, masses, targets=None, **options), and
+# returning the accelerations of the target bodies only when targets is given. Solvers living in other modules are
+# given as "module:function" and only imported once they are used. The direct sum is evaluated by the compute backend
+# given as its "backend" option, or by the fastest one for the number of bodies (see gravity_backends)
+force_solvers = {"direct": "gravity_backends:direct_accel",
+                 "barnes_hut": "gravity_tree:barnes_hut_accel",
+                 "parallel": "gravity_parallel:parallel_accel"}
+
+
+# Look up a solver by name, returning a function of (positions, masses, targets=None) with the solver's options bound
+# to it
+def get_accel_func(solver="direct", solver_options=None):
+    if solver not in force_solvers:
+        raise ValueError(f"Unknown force solver '{solver}', expected one of {', '.join(force_solvers)}")
+
+    accel_func = force_solvers[solver]
+
+    if isinstance(accel_func, str):
+        module_name, function_name = accel_func.split(":")
+        accel_func = getattr(importlib.import_module(module_name), function_name)
+
+    if solver_options:
+        return lambda positions, masses, targets=None: accel_func(positions, masses, targets, **solver_options)
+
+    return accel_func
+
+
+# Mask of the bodies (a dictionary or any iterable of them, in the order of masses) that are test particles: flagged
+# as one, or no heavier than test_particle_mass. None if no body is one
+def test_particle_mask(bodies, masses, test_particle_mass=default_test_particle_mass):
+    if isinstance(bodies, dict):
+        bodies = bodies.values()
+
+    mask = np.array([body.test_particle for body in bodies], dtype=bool).reshape(-1) | (masses <= test_particle_mass)
+
+    return mask if mask.any() else None
+
+
+# Masses the bodies attract others with, zero for test particles
+def gravitating_masses(masses, test_particles):
+    return masses if test_particles is None else np.where(test_particles, 0.0, masses)
+
+
+# Wrap a force solver so test particles feel the massive bodies but exert no force. The solver only sees the massive
+# bodies, and the test particles' accelerations come from n_body_accel_points, so a step costs
+# O(N_massive * (N_massive + N_test)) rather than O(N^2). softening is the solver's, so test particles feel the same
+# softened force as the massive bodies. Arrays of a subset of the bodies, like the bodies in a close encounter (see
+# gravity_encounters), are passed straight to the solver, as the run's test particles already have a mass of 0 there
+def with_test_particles(accel_func, test_particles, softening=0.0):
+    massive = np.flatnonzero(~test_particles)
+    test = np.flatnonzero(test_particles)
+    massive_rank = np.cumsum(~test_particles) - 1
+
+    def accel(positions, masses, targets=None):
+        if len(masses) != len(test_particles):
+            return accel_func(positions, masses, targets)
+
+        massive_positions, massive_masses = positions[massive], masses[massive]
+
+        if targets is None:
+            accelerations = np.zeros((len(masses), 3))
+
+            if len(massive):
+                accelerations[massive] = accel_func(massive_positions, massive_masses)
+                accelerations[test] = n_body_accel_points(positions[test], massive_positions, massive_masses,
+                                                          softening)
+
+            return accelerations
+
+        accelerations = np.zeros((len(targets), 3))
+        target_test = test_particles[targets]
+
+        if len(massive):
+            if not target_test.all():
+                accelerations[~target_test] = accel_func(massive_positions, massive_masses,
+                                                         massive_rank[targets[~target_test]])
+            accelerations[target_test] = n_body_accel_points(positions[targets[target_test]], massive_positions,
+                                                             massive_masses, softening)
+
+        return accelerations
+
+    return accel
+
+
+# Force solver of a run starting from a checkpoint, with its solver options and test particles applied
+def checkpoint_accel_func(start):
+    accel_func = get_accel_func(start.solver, start.solver_options)
+
+    if start.test_particles is not None and start.test_particles.any():
+        accel_func = with_test_particles(accel_func, np.asarray(start.test_particles, dtype=bool),
+                                         (start.solver_options or {}).get("softening", 0.0))
+
+    return accel_func
+
+
+# One step of the Verlet Integration, the default integrator. Every integrator is called as
+# step(position, velocity, accel, masses, dt, accel_func, state, **options) and returns the new position, velocity,
+# and acceleration arrays. state is a dictionary kept for the whole run that integrators can store their own data in
+def verlet_step(position, velocity, accel, masses, dt, accel_func, state):
+    # Calculate the new positions based on the previous velocities and accelerations
+    # p(t + dt) = p(t) + v(t) * dt + a(t) * dt^2 * 0.5
+    position = position + velocity * dt + accel * ((dt ** 2) / 2)
+
+    # Next calculate the new accelerations based on the new positions, and solve for the velocities at those positions
+    new_accel = accel_func(position, masses)
+    velocity = velocity + (accel + new_accel) * (dt / 2)
+
+    return position, velocity, new_accel
+
+
+# Integrators selectable by name, given the same way as the force solvers
+integrators = {"verlet": verlet_step,
+               "yoshida4": "gravity_integrators:yoshida4_step",
+               "adaptive": "gravity_integrators:adaptive_step",
+               "block": "gravity_integrators:block_step",
+               "wisdom_holman": "gravity_integrators:wisdom_holman_step",
+               "encounter": "gravity_encounters:encounter_step"}
+
+
+# Look up an integrator by name, returning its step function with the integrator's options bound to it
+def get_integrator(integrator="verlet", integrator_options=None):
+    if integrator not in integrators:
+        raise ValueError(f"Unknown integrator '{integrator}', expected one of {', '.join(integrators)}")
+
+    step_func = integrators[integrator]
+
+    if isinstance(step_func, str):
+        module_name, function_name = step_func.split(":")
+        step_func = getattr(importlib.import_module(module_name), function_name)
+
+    if integrator_options:
+        return lambda *args: step_func(*args, **integrator_options)
+
+    return step_func
+
+
+# Advance the state arrays one step of step_size at a time with the given integrator step function, yielding the step
+# index and the new positions, velocities, and accelerations of every body, up to step sim_time - 1, or with no end if
+# sim_time is None. The starting state is yielded first as start_step, which is 0 unless a run is being continued, in
+# which case its accelerations can be passed in too. state is the integrator's state dictionary, which a caller can pass
+# in to inspect it or to continue from it
+def integrate(positions, velocities, masses, step_size, sim_time, accel_func=n_body_accel_array,
+              step_func=verlet_step, state=None, start_step=0, accelerations=None):
+    position = np.array(positions, dtype=float)
+    velocity = np.array(velocities, dtype=float)
+    accel = accel_func(position, masses) if accelerations is None else np.array(accelerations, dtype=float)
+    state = {} if state is None else state
+
+    yield start_step, position, velocity, accel
+
+    steps = itertools.count(start_step + 1) if sim_time is None else range(start_step + 1, sim_time)
+
+    for i in steps:
+        position, velocity, accel = step_func(position, velocity, accel, masses, step_size, accel_func, state)
+
+        yield i, position, velocity, accel
+
+# endregion
+
+
+# region Simulation API
+
+# Split a dictionary (or any iterable) of bodies into lists of ids and names, and position, velocity, and mass arrays
+def bodies_to_arrays(bodies):
+    if isinstance(bodies, dict):
+        bodies = bodies.values()
+
+    bodies = list(bodies)
+
+    ids = [body.id for body in bodies]
+    names = [body.name for body in bodies]
+    positions = np.array([body.position for body in bodies], dtype=float).reshape(-1, 3)
+    velocities = np.array([body.velocity for body in bodies], dtype=float).reshape(-1, 3)
+    masses = np.array([body.mass for body in bodies], dtype=float)
+
+    return ids, names, positions, velocities, masses
+
+
+# Total kinetic plus potential energy of the system, used to measure how well an integrator conserves it
+def total_energy(positions, velocities, masses):
+    kinetic = 0.5 * np.sum(masses * np.einsum('ij,ij->i', velocities, velocities))
+
+    rows, cols = np.triu_indices(len(masses), 1)
+    distances = np.linalg.norm(positions[rows] - positions[cols], axis=1)
+    potential = -G * np.sum(masses[rows] * masses[cols] / distances)
+
+    return kinetic + potential
+
+
+# Solve the trajectories of the given bodies for sim_time steps of step_size seconds, using the named force solver
+# (see force_solvers) and integrator (see integrators) with the given options. If a callback is given it is called as
+# callback(i, trajectory) every callback_freq steps, with the trajectory filled up to and including step i. With a
+# checkpoint path, a checkpoint of the run is written there every checkpoint_freq steps and at its last step. With a
+# gravity_stats.RunStats, the run's phase times, counters, and conservation drift are recorded in it. Bodies flagged
+# as test particles, or no heavier than test_particle_mass, feel the other bodies' gravity but exert none
+def simulate(bodies, step_size=default_step_size, sim_time=default_sim_time, callback=None, callback_freq=1000,
+             solver="direct", solver_options=None, save_stride=1, store=None, chunk_steps=None,
+             integrator="verlet", integrator_options=None, checkpoint=None, checkpoint_freq=default_checkpoint_freq,
+             stats=None, test_particle_mass=default_test_particle_mass):
+    if isinstance(bodies, dict):
+        bodies = bodies.values()
+
+    bodies = list(bodies)
+    ids, names, positions, velocities, masses = bodies_to_arrays(bodies)
+    start = Checkpoint(ids, names, masses, step_size, 0, positions, velocities, None, solver, solver_options,
+                       integrator, integrator_options, {}, test_particle_mask(bodies, masses, test_particle_mass))
+
+    return run_from(start, sim_time, False, callback, callback_freq, save_stride, store, chunk_steps, checkpoint,
+                    checkpoint_freq, stats)
+
+
+# Continue a run from a checkpoint (a Checkpoint or the path of one) for sim_time more steps, without recomputing
+# the steps before it. If store is the path of the run's trajectory store the new steps are appended to it, after
+# dropping any steps it holds past the checkpoint, and the whole run is returned. Otherwise only the new steps are
+# returned. Unless given, the solver and integrator are the ones of the checkpoint, and the checkpoint is updated as
+# the run goes on if it was given as a path
+def resume(checkpoint, sim_time, callback=None, callback_freq=1000, save_stride=1, store=None, chunk_steps=None,
+           solver=None, solver_options=None, integrator=None, integrator_options=None,
+           checkpoint_freq=default_checkpoint_freq, stats=None):
+    checkpoint_path = checkpoint if isinstance(checkpoint, (str, os.PathLike)) else None
+    start = load_checkpoint(checkpoint) if checkpoint_path is not None else checkpoint
+    start = replace_settings(start, solver, solver_options, integrator, integrator_options)
+
+    return run_from(start, start.step + 1 + sim_time, True, callback, callback_freq, save_stride, store, chunk_steps,
+                    checkpoint_path, checkpoint_freq, stats)
+
+
+# Run the system with no end, for watching it evolve rather than for a trajectory of a set length. A generator that
+# yields (i, ring) every yield_freq steps, ring being a TrajectoryRing of every stride-th position of the last window
+# of them, updated in place as the run goes on, so memory use stays the same however long it runs. With a store path,
+# every save_stride-th step is also spilled to a trajectory store on disk, which is closed when the generator is
+# closed. Solver, integrator, and test particle settings are the same as simulate's
+def stream(bodies, step_size=default_step_size, window=default_stream_window, stride=1, yield_freq=1000,
+           solver="direct", solver_options=None, integrator="verlet", integrator_options=None, save_stride=1,
+           store=None, chunk_steps=None, test_particle_mass=default_test_particle_mass):
+    if isinstance(bodies, dict):
+        bodies = bodies.values()
+
+    bodies = list(bodies)
+    ids, names, positions, velocities, masses = bodies_to_arrays(bodies)
+    start = Checkpoint(ids, names, masses, step_size, 0, positions, velocities, None, solver, solver_options,
+                       integrator, integrator_options, {}, test_particle_mask(bodies, masses, test_particle_mass))
+
+    accel_func = checkpoint_accel_func(start)
+    step_func = get_integrator(integrator, integrator_options)
+    ring = TrajectoryRing(len(ids), stride, window)
+    save_stride = max(int(save_stride), 1)
+    gravitating = gravitating_masses(masses, start.test_particles)
+
+    if store is not None:
+        from gravity_store import TrajectoryStore
+        trajectory_store = TrajectoryStore.create(store, ids, names, masses, step_size, save_stride, chunk_steps)
+
+    try:
+        for i, position, velocity, accel in integrate(positions, velocities, gravitating, step_size, None,
+                                                      accel_func, step_func):
+            ring.extend(position[np.newaxis], i + 1, i)
+
+            if store is not None and i % save_stride == 0:
+                trajectory_store.append(i * float(step_size), position, velocity)
+
+            if i % yield_freq == 0:
+                yield i, ring
+    finally:
+        if store is not None:
+            trajectory_store.close()
+
+
+# Copy of a checkpoint with the given solver and integrator settings, keeping the checkpoint's own where none is given
+def replace_settings(checkpoint, solver=None, solver_options=None, integrator=None, integrator_options=None):
+    if solver is not None:
+        checkpoint = checkpoint._replace(solver=solver, solver_options=solver_options)
+
+    # The integrator state only means something to the integrator that wrote it
+    if integrator is not None and integrator != checkpoint.integrator:
+        checkpoint = checkpoint._replace(integrator=integrator, integrator_options=integrator_options,
+                                         integrator_state={})
+    elif integrator_options is not None:
+        checkpoint = checkpoint._replace(integrator_options=integrator_options)
+
+    return checkpoint
+
+
+# Integrate from the state of a checkpoint up to step end_step - 1, saving every save_stride-th step. A continued run
+# doesn't save its starting step again, as the run it continues already has
+def run_from(start, end_step, continued, callback, callback_freq, save_stride, store, chunk_steps, checkpoint,
+             checkpoint_freq, stats=None):
+    ids, names, masses, step_size = start.ids, start.names, start.masses, start.step_size
+    accel_func = checkpoint_accel_func(start)
+    step_func = get_integrator(start.integrator, start.integrator_options)
+    state = dict(start.integrator_state)
+    # Test particles are integrated with a mass of 0, so integrators that weigh bodies by their mass leave them out
+    gravitating = gravitating_masses(masses, start.test_particles)
+
+    # A step's time includes the time of its force evaluations
+    if stats is not None:
+        accel_func = stats.timed("force", accel_func)
+        step_func = stats.timed("step", step_func)
+
+    # With a store path the trajectory is streamed to memory-mapped chunk files instead of being held in memory
+    if store is not None:
+        from gravity_store import TrajectoryStore
+
+        if continued and os.path.exists(os.path.join(store, "meta.json")):
+            trajectory_store = TrajectoryStore.open(store, writable=True)
+            save_stride = trajectory_store.save_stride
+            trajectory_store.truncate(start.step // save_stride + 1)
+        else:
+            trajectory_store = TrajectoryStore.create(store, ids, names, masses, step_size, save_stride, chunk_steps)
+
+        trajectory = trajectory_store.trajectory()
+
+    save_stride = max(int(save_stride), 1)
+    first_saved = (start.step // save_stride + 1) * save_stride if continued else start.step
+
+    if store is None:
+        times = np.arange(first_saved, end_step, save_stride) * float(step_size)
+        trajectory = Trajectory(ids, names, masses, step_size, times,
+                                np.zeros((len(times), len(ids), 3)), np.zeros((len(times), len(ids), 3)))
+
+    try:
+        for i, position, velocity, accel in integrate(start.positions, start.velocities, gravitating, step_size,
+                                                      end_step, accel_func, step_func, state, start.step,
+                                                      start.accelerations):
+            if stats is not None and (i % stats.sample_freq == 0 or i == end_step - 1 or i == start.step):
+                stats.sample(position, velocity, gravitating)
+
+            if continued and i == start.step:
+                continue
+
+            if i % save_stride == 0:
+                if store is None:
+                    trajectory.positions[(i - first_saved) // save_stride] = position
+                    trajectory.velocities[(i - first_saved) // save_stride] = velocity
+                else:
+                    trajectory_store.append(i * float(step_size), position, velocity)
+
+            if checkpoint is not None and (i % checkpoint_freq == 0 or i == end_step - 1):
+                # The store is flushed first, so it always holds at least every step up to the checkpoint
+                if store is not None:
+                    trajectory_store.flush()
+
+                save_checkpoint(checkpoint, start._replace(step=i, positions=position, velocities=velocity,
+                                                           accelerations=accel, integrator_state=state))
+
+            if callback is not None and i % callback_freq == 0:
+                callback(i, trajectory)
+    finally:
+        if store is not None:
+            trajectory_store.close()
+
+    return trajectory
+
+
+def save_trajectory(path, trajectory):
+    np.savez(path, ids=np.array(trajectory.ids), names=np.array(trajectory.names), masses=trajectory.masses,
+             step_size=trajectory.step_size, times=trajectory.times,
+             positions=trajectory.positions, velocities=trajectory.velocities)
+
+
+def load_trajectory(path):
+    with np.load(path) as data:
+        return Trajectory([str(body_id) for body_id in data["ids"]], [str(name) for name in data["names"]], data["masses"], data["step_size"].item(),
+                          data["times"], data["positions"], data["velocities"])
+
+
+# Positions of every body at a time between a trajectory's saved steps, by cubic Hermite interpolation from the
+# positions and velocities of the saved steps either side of it. The curve matches both the positions and velocities
+# at the saved steps, so even with a large save stride the bodies move smoothly along their orbits. Only those two
+# steps are read, which keeps it cheap for a store of any length. Times outside the trajectory are clamped to it, and
+# the saved steps must be evenly spaced, as those of every run are
+def interpolate_positions(trajectory, time):
+    if len(trajectory.times) < 2:
+        return np.asarray(trajectory.positions[0], dtype=float)
+
+    start = float(trajectory.times[0])
+    spacing = float(trajectory.times[1]) - start
+
+    offset = min(max((time - start) / spacing, 0.0), len(trajectory.times) - 1.0)
+    row = min(int(offset), len(trajectory.times) - 2)
+    s = offset - row
+
+    positions = np.asarray(trajectory.positions[row:row + 2], dtype=float)
+    velocities = np.asarray(trajectory.velocities[row:row + 2], dtype=float) * spacing
+
+    # Hermite basis functions of the start and end positions and tangents
+    return (2 * s ** 3 - 3 * s ** 2 + 1) * positions[0] + (s ** 3 - 2 * s ** 2 + s) * velocities[0] + \
+        (3 * s ** 2 - 2 * s ** 3) * positions[1] + (s ** 3 - s ** 2) * velocities[1]
+
+
+# Write a checkpoint as a single .npz file. Settings and the integrator state's plain values are stored as JSON, the
+# integrator state's arrays as arrays. The file is replaced in one step, so a crash never leaves half a checkpoint
+def save_checkpoint(path, checkpoint):
+    state_arrays = {key: value for key, value in checkpoint.integrator_state.items() if isinstance(value, np.ndarray)}
+    state_values = {key: value for key, value in checkpoint.integrator_state.items() if key not in state_arrays}
+
+    settings = {"solver": checkpoint.solver,
+                "solver_options": checkpoint.solver_options,
+                "integrator": checkpoint.integrator,
+                "integrator_options": checkpoint.integrator_options,
+                "integrator_state": state_values}
+
+    with open(f"{path}.tmp", "wb") as file:
+        np.savez(file, ids=np.array(checkpoint.ids), names=np.array(checkpoint.names), masses=checkpoint.masses,
+                 step_size=checkpoint.step_size, step=checkpoint.step, positions=checkpoint.positions,
+                 velocities=checkpoint.velocities, accelerations=checkpoint.accelerations,
+                 settings=json.dumps(settings),
+                 **({} if checkpoint.test_particles is None else {"test_particles": checkpoint.test_particles}),
+                 **{f"state_{key}": value for key, value in state_arrays.items()})
+
+    os.replace(f"{path}.tmp", path)
+
+
+def load_checkpoint(path):
+    with np.load(path) as data:
+        settings = json.loads(data["settings"].item())
+
+        state = settings["integrator_state"]
+        state.update({key[len("state_"):]: data[key] for key in data.files if key.startswith("state_")})
+
+        return Checkpoint([str(body_id) for body_id in data["ids"]], [str(name) for name in data["names"]],
+                          data["masses"], data["step_size"].item(), int(data["step"]), data["positions"],
+                          data["velocities"], data["accelerations"], settings["solver"], settings["solver_options"],
+                          settings["integrator"], settings["integrator_options"], state,
+                          data["test_particles"] if "test_particles" in data.files else None)
+
+# endregion
+
+
+# region Trajectory Buffers
+
+# Decimated, plot-ready copy of a trajectory that only ever grows by appending. Points are stored as (N, 3, capacity)
+# so the x, y, and z history of each body is a contiguous array that can be handed to a plot without copying
+class TrajectoryBuffer:
+    def __init__(self, body_count, stride, capacity=1024):
+        self.stride = max(int(stride), 1)
+        self.points = np.zeros((body_count, 3, max(int(capacity), 1)))
+        self.length = 0
+        self.next_step = 0  # Next trajectory step to be appended, always a multiple of stride
+
+    # Append every stride-th step below steps_available from a (steps, N, 3) position array, returning how many
+    # points were added. Only the new steps are read, so the cost doesn't depend on how much is already buffered. If
+    # the array only holds the steps from offset on, positions[0] is taken to be step offset
+    def extend(self, positions, steps_available, offset=0):
+        new_points = positions[self.next_step - offset:steps_available - offset:self.stride]
+
+        if len(new_points) == 0:
+            return 0
+
+        if self.length + len(new_points) > self.points.shape[2]:
+            capacity = max(self.points.shape[2] * 2, self.length + len(new_points))
+            points = np.zeros(self.points.shape[:2] + (capacity,))
+            points[:, :, :self.length] = self.points[:, :, :self.length]
+            self.points = points
+
+        self.points[:, :, self.length:self.length + len(new_points)] = np.transpose(new_points, (1, 2, 0))
+        self.length += len(new_points)
+        self.next_step += len(new_points) * self.stride
+
+        return len(new_points)
+
+    # Drop every point from length on
+    def truncate(self, length):
+        self.length = min(self.length, length)
+        self.next_step = self.length * self.stride
+
+    # Zero-copy view of one coordinate (0, 1, or 2 for x, y, or z) of a body's buffered points
+    def view(self, body_index, axis, start=0, stop=None):
+        stop = self.length if stop is None else min(stop, self.length)
+        return self.points[body_index, axis, start:stop]
+
+
+# Trajectory buffer of fixed capacity that only keeps the latest capacity points, for runs with no end. It is used
+# like a TrajectoryBuffer, with point 0 being the oldest point kept. Every point is stored twice, capacity columns
+# apart, so the kept points are always one contiguous run of columns starting at head and views stay zero-copy
+class TrajectoryRing:
+    def __init__(self, body_count, stride, capacity=default_stream_window):
+        self.stride = max(int(stride), 1)
+        self.capacity = max(int(capacity), 1)
+        self.points = np.zeros((body_count, 3, 2 * self.capacity))
+        self.head = 0
+        self.length = 0
+        self.next_step = 0  # Next trajectory step to be appended, always a multiple of stride
+
+    # Append every stride-th step below steps_available from a (steps, N, 3) position array whose first row is step
+    # offset, returning how many points were added. Points past capacity push out the oldest ones. If the array
+    # starts after the next step, the steps in between are lost and the points kept so far are dropped, so the line
+    # doesn't jump across the gap
+    def extend(self, positions, steps_available, offset=0):
+        if offset > self.next_step:
+            self.head = self.length = 0
+            self.next_step = -(-offset // self.stride) * self.stride
+
+        new_points = positions[self.next_step - offset:steps_available - offset:self.stride]
+        added = len(new_points)
+
+        if added == 0:
+            return 0
+
+        self.next_step += added * self.stride
+        new_points = np.transpose(new_points[-self.capacity:], (1, 2, 0))
+
+        columns = (self.head + self.length + np.arange(new_points.shape[2])) % self.capacity
+        self.points[:, :, columns] = new_points
+        self.points[:, :, columns + self.capacity] = new_points
+
+        self.length += new_points.shape[2]
+        if self.length > self.capacity:
+            self.head = (self.head + self.length - self.capacity) % self.capacity
+            self.length = self.capacity
+
+        return added
+
+    # Drop every point of a trajectory step from length * stride on, keeping the older ones
+    def truncate(self, length):
+        dropped = min(max(self.next_step // self.stride - length, 0), self.length)
+        self.length -= dropped
+        self.next_step = min(self.next_step, length * self.stride)
+
+    # Zero-copy view of one coordinate (0, 1, or 2 for x, y, or z) of a body's points, oldest first
+    def view(self, body_index, axis, start=0, stop=None):
+        stop = self.length if stop is None else min(stop, self.length)
+        return self.points[body_index, axis, self.head + start:self.head + max(stop, start)]
+
+# endregion
+
+
+# region Scenario Files
+
+# Columns of scenario CSV files, optionally followed by r, g, b, and a color columns and a test_particle column
+scenario_csv_columns = ["name", "x", "y", "z", "vx", "vy", "vz", "mass"]
+scenario_csv_colors = ["r", "g", "b", "a"]
+
+
+# Dictionary of bodies keyed by id built from arrays of names, (N, 3) positions and velocities, masses, and optional
+# (N, 4) colors and test particle flags, in one pass without any per-body parsing
+def bodies_from_arrays(names, positions, velocities, masses, colors=None, test_particles=None, source="bodies"):
+    names = [str(name) for name in names]
+    ids = [body_id_from_name(name) for name in names]
+
+    if len(set(ids)) != len(ids):
+        seen = set()
+        duplicate = next(name for body_id, name in zip(ids, names) if body_id in seen or seen.add(body_id))
+        raise ValueError(f"{source}: duplicate body '{duplicate}'")
+
+    positions = map(Vec3._make, np.asarray(positions, dtype=float).reshape(-1, 3).tolist())
+    velocities = map(Vec3._make, np.asarray(velocities, dtype=float).reshape(-1, 3).tolist())
+    masses = np.asarray(masses, dtype=float).tolist()
+    colors = [None] * len(ids) if colors is None else [None if color is None else list(color) for color in colors]
+    test_particles = [False] * len(ids) if test_particles is None else [bool(flag) for flag in test_particles]
+
+    return {body_id: Body(body_id, name, position, velocity, mass, color, test_particle)
+            for body_id, name, position, velocity, mass, color, test_particle in zip(ids, names, positions,
+                                                                                      velocities, masses, colors,
+                                                                                      test_particles)}
+
+
+# Scenario JSON files are objects holding optional step_size and sim_time settings and a list of bodies, e.g.
+# {"step_size": 500, "sim_time": 64000,
+#  "bodies": [{"name": "Sun", "position": [0, 0, 0], "velocity": [0, 0, 0], "mass": 1.9885e30}, ...]}
+# where bodies can also have a color and be flagged as a test particle with "test_particle": true
+def load_scenario_json(path):
+    with open(path) as file:
+        data = json.load(file)
+
+    return scenario_from_dict(data, os.path.splitext(os.path.basename(path))[0], path)
+
+
+# Scenario from a dictionary laid out like a JSON scenario file, named name unless it has a name of its own. source
+# names where it came from in error messages
+def scenario_from_dict(data, name="scenario", source="scenario"):
+    body_data = data["bodies"]
+    bodies = bodies_from_arrays([body["name"] for body in body_data], [body["position"] for body in body_data],
+                                [body["velocity"] for body in body_data], [body["mass"] for body in body_data],
+                                [body.get("color") for body in body_data],
+                                [body.get("test_particle", False) for body in body_data], source)
+
+    return Scenario(data.get("name", name), bodies, data.get("step_size", default_step_size),
+                    data.get("sim_time", default_sim_time))
+
+
+# Scenario CSV files hold one body per row under a header of scenario_csv_columns, optionally followed by r, g, b,
+# and a columns and a test_particle column of 0 or 1, and use the default step size and sim time
+def load_scenario_csv(path):
+    with open(path, newline="") as file:
+        rows = list(csv.reader(file))
+
+    header = [column.strip() for column in rows[0]]
+    if header[:len(scenario_csv_columns)] != scenario_csv_columns:
+        raise ValueError(f"{path}: expected the columns {', '.join(scenario_csv_columns)}")
+
+    rows = [row for row in rows[1:] if row]
+    names = [row[0] for row in rows]
+    values = np.array([row[1:len(scenario_csv_columns)] for row in rows], dtype=float).reshape(-1, 7)
+
+    colors = None
+    if all(column in header for column in scenario_csv_colors):
+        color_columns = [header.index(column) for column in scenario_csv_colors]
+        colors = [[int(float(row[column])) for column in color_columns]
+                  if all(row[column] for column in color_columns) else None for row in rows]
+
+    test_particles = None
+    if "test_particle" in header:
+        column = header.index("test_particle")
+        test_particles = [row[column].strip().lower() in ("1", "true") for row in rows]
+
+    bodies = bodies_from_arrays(names, values[:, 0:3], values[:, 3:6], values[:, 6], colors, test_particles, path)
+
+    return Scenario(os.path.splitext(os.path.basename(path))[0], bodies, default_step_size, default_sim_time)
+
+
+# Scenario .npz files hold names, (N, 3) positions and velocities, and masses arrays, with optional (N, 4) colors,
+# (N,) test_particles flags, step_size, sim_time, and name entries
+def load_scenario_npz(path):
+    with np.load(path) as data:
+        colors = data["colors"].tolist() if "colors" in data.files else None
+        test_particles = data["test_particles"] if "test_particles" in data.files else None
+        bodies = bodies_from_arrays(data["names"], data["positions"], data["velocities"], data["masses"], colors,
+                                    test_particles, path)
+
+        name = str(data["name"]) if "name" in data.files else os.path.splitext(os.path.basename(path))[0]
+        step_size = data["step_size"].item() if "step_size" in data.files else default_step_size
+        sim_time = data["sim_time"].item() if "sim_time" in data.files else default_sim_time
+
+    return Scenario(name, bodies, step_size, sim_time)
+
+
+# Test particle flags are only written for bodies that are one, so files without any stay as they were
+def save_scenario_json(path, bodies, step_size, sim_time):
+    with open(path, "w") as file:
+        json.dump(scenario_to_dict(bodies, step_size, sim_time), file, indent=2)
+
+
+# Dictionary laid out like a JSON scenario file, ready for json.dumps
+def scenario_to_dict(bodies, step_size, sim_time):
+    return {"step_size": step_size,
+            "sim_time": sim_time,
+            "bodies": [dict({"name": body.name,
+                             "position": list(body.position),
+                             "velocity": list(body.velocity),
+                             "mass": body.mass,
+                             "color": body.color}, **({"test_particle": True} if body.test_particle else {}))
+                       for body in bodies]}
+
+
+def save_scenario_csv(path, bodies, step_size, sim_time):
+    colors = any(body.color is not None for body in bodies)
+    test_particles = any(body.test_particle for body in bodies)
+
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(scenario_csv_columns + (scenario_csv_colors if colors else []) +
+                        (["test_particle"] if test_particles else []))
+        writer.writerows([body.name, *(repr(float(value)) for value in (*body.position, *body.velocity, body.mass))] +
+                         (list(body.color or ["", "", "", ""]) if colors else []) +
+                         ([int(body.test_particle)] if test_particles else []) for body in bodies)
+
+
+def save_scenario_npz(path, bodies, step_size, sim_time):
+    _, names, positions, velocities, masses = bodies_to_arrays(bodies)
+
+    # Colors are only kept when every body has one, as the array can't hold missing ones
+    extra = {}
+    if bodies and all(body.color is not None for body in bodies):
+        extra["colors"] = np.array([body.color for body in bodies], dtype=float)
+
+    if any(body.test_particle for body in bodies):
+        extra["test_particles"] = np.array([body.test_particle for body in bodies], dtype=bool)
+
+    np.savez(path, names=np.array(names), positions=positions, velocities=velocities, masses=masses,
+             step_size=step_size, sim_time=sim_time, **extra)
+
+
+# Scenario file readers and writers by file extension
+scenario_loaders = {".json": load_scenario_json, ".csv": load_scenario_csv, ".npz": load_scenario_npz}
+scenario_savers = {".json": save_scenario_json, ".csv": save_scenario_csv, ".npz": save_scenario_npz}
+
+
+def scenario_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in scenario_loaders:
+        raise ValueError(f"{path}: unknown scenario format '{extension}', expected one of "
+                         f"{', '.join(scenario_loaders)}")
+
+    return extension
+
+
+# Read a scenario from a JSON, CSV, or .npz file, chosen by its extension
+def load_scenario(path):
+    return scenario_loaders[scenario_format(path)](path)
+
+
+# Write bodies (a dictionary or any iterable of them) to a JSON, CSV, or .npz scenario file, chosen by its extension
+def save_scenario(path, bodies, step_size=default_step_size, sim_time=default_sim_time):
+    if isinstance(bodies, dict):
+        bodies = bodies.values()
+
+    scenario_savers[scenario_format(path)](path, list(bodies), step_size, sim_time)
+
+# endregion
+
+
+# region Command Line Interface
+
+# Options of the named solver given on the command line, laid over solver_options. --theta, --workers, and --backend
+# only apply to the solvers that have those options, --softening to all of them
+def command_line_solver_options(args, solver, solver_options=None):
+    solver_options = dict(solver_options or {})
+
+    if solver == "direct" and args.backend is not None:
+        solver_options["backend"] = args.backend
+    elif solver == "barnes_hut" and args.theta is not None:
+        solver_options["theta"] = args.theta
+    elif solver == "parallel" and args.workers is not None:
+        solver_options["workers"] = args.workers
+    if args.softening:
+        solver_options["softening"] = args.softening
+
+    # The auto backend is the default, so it isn't kept as an option
+    if solver_options.get("backend") == "auto":
+        del solver_options["backend"]
+
+    return solver_options or None
+
+
+# Options of the named integrator given on the command line, laid over integrator_options. --tolerance, --eta, and
+# --merge-radius only apply to the integrators that have those options
+def command_line_integrator_options(args, integrator, integrator_options=None):
+    integrator_options = dict(integrator_options or {})
+
+    if integrator == "adaptive" and args.tolerance is not None:
+        integrator_options["rtol"] = args.tolerance
+    elif integrator == "block" and args.eta is not None:
+        integrator_options["eta"] = args.eta
+    elif integrator == "encounter" and args.merge_radius is not None:
+        integrator_options["merge_radius"] = args.merge_radius
+
+    return integrator_options or None
+
+
+# Run every given scenario file in turn and write each result to <out-dir>/<scenario name>.npz
+def main(argv=None):
+    # Only the command line needs argparse, so importing the module for a script doesn't pay for it
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run n-body scenario files headlessly and save their trajectories.")
+    parser.add_argument("scenarios", nargs="+", help="scenario files (.json, .csv, or .npz) to run")
+    parser.add_argument("-o", "--out-dir", default="results", help="directory the .npz results are written to")
+    parser.add_argument("--step-size", type=int, help="override the step size (s) of every scenario")
+    parser.add_argument("--sim-time", type=int, help="override the number of steps of every scenario")
+    parser.add_argument("--solver", choices=force_solvers,
+                        help="force solver (default: direct, or the checkpoint's with --resume)")
+    parser.add_argument("--theta", type=float, help="opening angle of the barnes_hut solver")
+    parser.add_argument("--softening", type=float, help="Plummer softening length of the force, of any solver (m)")
+    parser.add_argument("--workers", type=int, help="worker processes of the parallel solver (default: all cores)")
+    parser.add_argument("--backend", help="compute backend of the direct solver: reference, numpy, numba, or auto "
+                                          "(default: auto, chosen by the number of bodies)")
+    parser.add_argument("--integrator", choices=integrators,
+                        help="integrator (default: verlet, or the checkpoint's with --resume)")
+    parser.add_argument("--tolerance", type=float, help="relative error tolerance of the adaptive integrator")
+    parser.add_argument("--eta", type=float, help="substep size of the block integrator, as a fraction of the "
+                                                  "dynamical time of each body")
+    parser.add_argument("--merge-radius", type=float, help="distance below which the encounter integrator merges two "
+                                                           "bodies (m)")
+    parser.add_argument("--save-stride", type=int, default=1, help="save every n-th step of the trajectory")
+    parser.add_argument("--store", action="store_true",
+                        help="stream each trajectory to a memory-mapped store directory instead of an .npz file")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="keep a checkpoint of each run next to its result, to continue it from with --resume")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue each run from its checkpoint for --sim-time more steps instead of starting over")
+    parser.add_argument("--cache", action="store_true",
+                        help="reuse the result of a scenario run before with the same settings (.npz results only)")
+    parser.add_argument("--cache-dir", help="directory of the result cache (default: ~/.cache/gravity_sim)")
+    parser.add_argument("--stats", help="JSON lines file a line of timings and conservation drift is appended to "
+                                        "for each run")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+
+    result_cache = None
+    if args.cache and not args.store:
+        from gravity_cache import ResultCache, default_cache_dir
+
+        result_cache = ResultCache(args.cache_dir or default_cache_dir)
+
+    for scenario_path in args.scenarios:
+        scenario = load_scenario(scenario_path)
+        step_size = args.step_size or scenario.step_size
+        sim_time = args.sim_time or scenario.sim_time
+
+        if args.store:
+            out_path = os.path.join(args.out_dir, scenario.name)
+        else:
+            out_path = os.path.join(args.out_dir, f"{scenario.name}.npz")
+
+        checkpoint_path = os.path.join(args.out_dir, f"{scenario.name}.checkpoint.npz")
+        checkpoint = checkpoint_path if args.checkpoint or args.resume else None
+
+        stats = None
+        if args.stats:
+            from gravity_stats import RunStats
+
+            stats = RunStats()
+
+        # A resumed run keeps the solver and integrator of its checkpoint, and their options, unless they are given
+        resumed = load_checkpoint(checkpoint_path) if args.resume and os.path.exists(checkpoint_path) else None
+        if resumed is None:
+            solver, solver_options = args.solver or "direct", None
+            integrator, integrator_options = args.integrator or "verlet", None
+        else:
+            solver = args.solver or resumed.solver
+            solver_options = None if args.solver else resumed.solver_options
+            integrator = args.integrator or resumed.integrator
+            integrator_options = None if args.integrator else resumed.integrator_options
+
+        solver_options = command_line_solver_options(args, solver, solver_options)
+        integrator_options = command_line_integrator_options(args, integrator, integrator_options)
+
+        start = time.perf_counter()
+        if resumed is not None:
+            resumed_step = resumed.step
+            trajectory = resume(checkpoint_path, sim_time, save_stride=args.save_stride,
+                                store=out_path if args.store else None, solver=solver,
+                                solver_options=solver_options, integrator=integrator,
+                                integrator_options=integrator_options, stats=stats)
+
+            # Only the new steps are returned without a store, so they are added to the saved steps up to the
+            # checkpoint. Both have to be saved with the same stride to line up
+            if not args.store and os.path.exists(out_path):
+                previous = load_trajectory(out_path)
+                kept = resumed_step // args.save_stride + 1
+                trajectory = trajectory._replace(
+                    times=np.concatenate((previous.times[:kept], trajectory.times)),
+                    positions=np.concatenate((previous.positions[:kept], trajectory.positions)),
+                    velocities=np.concatenate((previous.velocities[:kept], trajectory.velocities)))
+        elif result_cache is not None and checkpoint is None and stats is None:
+            trajectory = result_cache.simulate(scenario.bodies, step_size, sim_time, args.save_stride, solver,
+                                               solver_options, integrator, integrator_options)
+        else:
+            trajectory = simulate(scenario.bodies, step_size, sim_time, solver=solver,
+                                  solver_options=solver_options, save_stride=args.save_stride,
+                                  store=out_path if args.store else None, integrator=integrator,
+                                  integrator_options=integrator_options, checkpoint=checkpoint, stats=stats)
+        elapsed = time.perf_counter() - start
+
+        if not args.store:
+            save_trajectory(out_path, trajectory)
+
+        if stats is not None:
+            from gravity_stats import write_json_lines
+
+            write_json_lines(args.stats, [stats.snapshot(scenario=scenario.name, bodies=len(trajectory.ids),
+                                                         step_size=step_size, sim_time=sim_time, solver=solver,
+                                                         integrator=integrator)])
+
+        print(f"{scenario.name}: {len(trajectory.ids)} bodies, {sim_time} steps in {elapsed:.2f} s "
+              f"({sim_time / max(elapsed, 1e-9):.0f} steps/s) -> {out_path}")
+
+
+if __name__ == "__main__":
+    main()
+
+# endregion
@@ -0,0 +1,152 @@
+import json
+import os
+import sys
+import time
+import numpy as np
+from gravity_sim import G, accel_block_size, upper_triangle_mask
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, where peak memory isn't reported
+    resource = None
+
+# region Global Definitions and Variables
+
+# How many steps apart a run samples its energy, momentum, and angular momentum. A sample costs about one force
+# evaluation, so this keeps the diagnostics well under 1% of the run time
+default_sample_freq = 1024
+
+# endregion
+
+
+# region Conservation Diagnostics
+
+# Total energy, linear momentum, and angular momentum of the system. The potential energy is summed over blocks of
+# pairs like the force kernel, so it never builds an N x N array
+def conserved_quantities(positions, velocities, masses):
+    kinetic = 0.5 * np.sum(masses * np.einsum('ij,ij->i', velocities, velocities))
+    potential = 0.0
+
+    for start in range(0, len(masses), accel_block_size):
+        end = min(start + accel_block_size, len(masses))
+        upper, lower = upper_triangle_mask(end - start)
+
+        delta = positions[np.newaxis, start:] - positions[start:end, np.newaxis]
+        distance_sq = np.einsum('ijk,ijk->ij', delta, delta)
+        distance_sq[:, :end - start] += lower
+
+        inverse_distance = distance_sq ** -0.5
+        inverse_distance[:, :end - start] *= upper
+
+        potential -= G * np.sum(masses[start:end, np.newaxis] * masses[np.newaxis, start:] * inverse_distance)
+
+    momentum = masses @ velocities
+    angular_momentum = masses @ np.cross(positions, velocities)
+
+    return kinetic + potential, momentum, angular_momentum
+
+
+# Relative drift of the conserved quantities from their starting values. Momenta are measured against the sum of
+# the bodies' individual magnitudes, as the total of a system at rest in its centre of mass frame is zero
+def conservation_drift(start, current, positions, velocities, masses):
+    energy, momentum, angular_momentum = current
+    momentum_scale = np.sum(masses * np.linalg.norm(velocities, axis=1))
+    angular_scale = np.sum(masses * np.linalg.norm(np.cross(positions, velocities), axis=1))
+
+    return {"energy": abs(energy / start[0] - 1) if start[0] else abs(energy),
+            "momentum": float(np.linalg.norm(momentum - start[1]) / max(momentum_scale, 1e-300)),
+            "angular_momentum": float(np.linalg.norm(angular_momentum - start[2]) / max(angular_scale, 1e-300))}
+
+
+# Largest resident memory the process has used so far in MB, or None where it can't be read
+def peak_memory_mb():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+# endregion
+
+
+# region Run Statistics
+
+# Per-phase timers, counters, and conservation drift of one run, cheap enough to leave on: a phase costs two
+# perf_counter calls and the conserved quantities are only sampled every sample_freq steps
+class RunStats:
+    def __init__(self, sample_freq=default_sample_freq):
+        self.sample_freq = max(int(sample_freq), 1)
+        self.start_time = time.perf_counter()
+        self.phases = {}  # Phase name -> [seconds, calls]
+        self.counters = {}
+
+        self.start_quantities = None
+        self.drift = {}
+        self.max_drift = {}
+
+    def add_time(self, phase, seconds):
+        totals = self.phases.setdefault(phase, [0.0, 0])
+        totals[0] += seconds
+        totals[1] += 1
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    # Wrap a function so its calls are counted and timed as the given phase, e.g. a force solver. The wrapper adds to
+    # its phase's totals directly, as it runs every step
+    def timed(self, phase, func):
+        totals = self.phases.setdefault(phase, [0.0, 0])
+        perf_counter = time.perf_counter
+
+        def timed_func(*args):
+            start = perf_counter()
+            result = func(*args)
+            totals[0] += perf_counter() - start
+            totals[1] += 1
+            return result
+
+        return timed_func
+
+    # Measure the conserved quantities, the first sample being the reference the drift is measured from
+    def sample(self, positions, velocities, masses):
+        start = time.perf_counter()
+        quantities = conserved_quantities(positions, velocities, masses)
+
+        if self.start_quantities is None:
+            self.start_quantities = quantities
+
+        self.drift = conservation_drift(self.start_quantities, quantities, positions, velocities, masses)
+        for key, value in self.drift.items():
+            self.max_drift[key] = max(self.max_drift.get(key, 0.0), value)
+
+        self.add_time("diagnostics", time.perf_counter() - start)
+
+    # Plain dictionary of everything measured so far, ready for json.dumps. Counters include the calls of each phase,
+    # and rates are counts per second of run time
+    def snapshot(self, **extra):
+        elapsed = time.perf_counter() - self.start_time
+        counters = dict(self.counters, **{phase: calls for phase, (_, calls) in self.phases.items()})
+
+        return dict(extra,
+                    elapsed=elapsed,
+                    phase_times={phase: seconds for phase, (seconds, _) in self.phases.items()},
+                    counters=counters,
+                    rates={key: value / max(elapsed, 1e-9) for key, value in counters.items()},
+                    peak_memory_mb=peak_memory_mb(),
+                    drift=dict(self.drift),
+                    max_drift=dict(self.max_drift))
+
+
+# Append snapshots to a JSON lines file, one line each
+def write_json_lines(path, snapshots):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    with open(path, "a") as file:
+        for snapshot in snapshots:
+            file.write(json.dumps(snapshot) + "\n")
+
+# endregion
@@ -0,0 +1,271 @@
+import json
+import os
+import numpy as np
+from collections import OrderedDict
+from gravity_sim import Trajectory
+
+# region Global Definitions and Variables
+
+# Default size of one chunk file of positions, which bounds the memory a store maps at once while it is written
+default_chunk_bytes = 64 * 1024 * 1024
+
+# How many chunk files of each array a store keeps mapped while it is read
+open_chunk_limit = 2
+
+# Arrays held by a store and the shape of one of their rows, given the number of bodies
+store_arrays = {"times": lambda n: (),
+                "positions": lambda n: (n, 3),
+                "velocities": lambda n: (n, 3)}
+
+# endregion
+
+
+# region Chunked Arrays
+
+# Read-only array view over one of a store's arrays, reading only the chunk files that an index touches. Supports
+# integer and slice indexing along the step axis, optionally followed by indices into the remaining axes
+class ChunkedArray:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+        self.dtype = np.dtype(float)
+
+    @property
+    def shape(self):
+        return (len(self.store),) + store_arrays[self.name](len(self.store.ids))
+
+    def __len__(self):
+        return len(self.store)
+
+    def __array__(self, dtype=None, copy=None):
+        values = self[:]
+        return values if dtype is None else values.astype(dtype)
+
+    def __getitem__(self, index):
+        if not isinstance(index, tuple):
+            index = (index,)
+
+        step_index, rest = index[0], index[1:]
+
+        if isinstance(step_index, (int, np.integer)):
+            step = int(step_index) + len(self) if step_index < 0 else int(step_index)
+            if not 0 <= step < len(self):
+                raise IndexError(f"step {step_index} is out of range for a store of {len(self)} steps")
+
+            chunk, row = divmod(step, self.store.chunk_steps)
+            return self.store.chunk(self.name, chunk)[(row,) + rest]
+
+        steps = np.arange(len(self))[step_index]
+        chunks = steps // self.store.chunk_steps
+
+        # Split the requested steps into runs that fall in the same chunk file
+        parts = [np.empty((0,) + self.shape[1:])[(slice(None),) + rest]]
+        for run in np.split(np.arange(len(steps)), np.flatnonzero(np.diff(chunks)) + 1):
+            if len(run):
+                rows = steps[run] - chunks[run[0]] * self.store.chunk_steps
+                parts.append(self.store.chunk(self.name, chunks[run[0]])[(rows,) + rest])
+
+        return np.concatenate(parts)
+
+# endregion
+
+
+# region Trajectory Store
+
+# Trajectory kept on disk as a directory of memory-mapped .npy chunk files plus a meta.json describing them. Steps
+# are appended one at a time as the integration runs, and only the chunk being written is mapped, so memory use is
+# bounded by the chunk size rather than by the length of the run
+class TrajectoryStore:
+    def __init__(self, path, meta, writable):
+        self.path = path
+        self.ids = meta["ids"]
+        self.names = meta["names"]
+        self.masses = np.array(meta["masses"], dtype=float)
+        self.step_size = meta["step_size"]
+        self.save_stride = meta["save_stride"]
+        self.chunk_steps = meta["chunk_steps"]
+        self.length = meta["length"]
+        self.writable = writable
+
+        self.write_chunk = None
+        self.write_arrays = {}
+        self.read_chunks = OrderedDict()
+
+    # Create an empty store at path, which must not already hold one
+    @staticmethod
+    def create(path, ids, names, masses, step_size, save_stride=1, chunk_steps=None):
+        if chunk_steps is None:
+            chunk_steps = max(default_chunk_bytes // (max(len(ids), 1) * 3 * 8), 1)
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, "meta.json")):
+            raise FileExistsError(f"{path} already holds a trajectory store")
+
+        meta = {"ids": list(ids),
+                "names": list(names),
+                "masses": [float(mass) for mass in masses],
+                "step_size": step_size,
+                "save_stride": save_stride,
+                "chunk_steps": int(chunk_steps),
+                "length": 0}
+
+        store = TrajectoryStore(path, meta, True)
+        store.write_meta()
+        return store
+
+    # Open an existing store, for reading or, with writable set, for appending more steps
+    @staticmethod
+    def open(path, writable=False):
+        with open(os.path.join(path, "meta.json")) as file:
+            return TrajectoryStore(path, json.load(file), writable)
+
+    def __len__(self):
+        return self.length
+
+    def chunk_path(self, name, chunk):
+        return os.path.join(self.path, f"{name}_{chunk:05d}.npy")
+
+    def write_meta(self):
+        meta = {"ids": self.ids,
+                "names": self.names,
+                "masses": self.masses.tolist(),
+                "step_size": self.step_size,
+                "save_stride": self.save_stride,
+                "chunk_steps": self.chunk_steps,
+                "length": self.length}
+
+        # Replace the file in one step so a reader never sees a half written meta.json
+        with open(os.path.join(self.path, "meta.json.tmp"), "w") as file:
+            json.dump(meta, file)
+        os.replace(os.path.join(self.path, "meta.json.tmp"), os.path.join(self.path, "meta.json"))
+
+    # Map one chunk file of an array for reading, keeping the most recently used few mapped
+    def chunk(self, name, chunk):
+        if chunk == self.write_chunk:
+            return self.write_arrays[name]
+
+        key = (name, chunk)
+        if key in self.read_chunks:
+            self.read_chunks.move_to_end(key)
+        else:
+            self.read_chunks[key] = np.load(self.chunk_path(name, chunk), mmap_mode="r")
+
+            if len(self.read_chunks) > open_chunk_limit * len(store_arrays):
+                self.read_chunks.popitem(last=False)
+
+        return self.read_chunks[key]
+
+    def open_write_chunk(self, chunk):
+        self.close_write_chunk()
+        self.read_chunks = OrderedDict((key, value) for key, value in self.read_chunks.items() if key[1] != chunk)
+
+        for name, row_shape in store_arrays.items():
+            path = self.chunk_path(name, chunk)
+            shape = (self.chunk_steps,) + row_shape(len(self.ids))
+
+            if os.path.exists(path):
+                self.write_arrays[name] = np.lib.format.open_memmap(path, mode="r+")
+            else:
+                self.write_arrays[name] = np.lib.format.open_memmap(path, mode="w+", dtype=float, shape=shape)
+
+        self.write_chunk = chunk
+
+    def close_write_chunk(self):
+        for array in self.write_arrays.values():
+            array.flush()
+
+        self.write_arrays = {}
+        self.write_chunk = None
+
+    # Append the state of one saved step
+    def append(self, time, positions, velocities):
+        if not self.writable:
+            raise ValueError(f"{self.path} was opened read-only")
+
+        chunk, row = divmod(self.length, self.chunk_steps)
+
+        if chunk != self.write_chunk:
+            self.open_write_chunk(chunk)
+
+        self.write_arrays["times"][row] = time
+        self.write_arrays["positions"][row] = positions
+        self.write_arrays["velocities"][row] = velocities
+        self.length += 1
+
+        # A finished chunk is written out and unmapped straight away
+        if row == self.chunk_steps - 1:
+            self.close_write_chunk()
+            self.write_meta()
+
+    # Append many saved steps at once, a chunk file at a time
+    def extend(self, times, positions, velocities):
+        if not self.writable:
+            raise ValueError(f"{self.path} was opened read-only")
+
+        start = 0
+        while start < len(times):
+            chunk, row = divmod(self.length, self.chunk_steps)
+
+            if chunk != self.write_chunk:
+                self.open_write_chunk(chunk)
+
+            count = min(self.chunk_steps - row, len(times) - start)
+            self.write_arrays["times"][row:row + count] = times[start:start + count]
+            self.write_arrays["positions"][row:row + count] = positions[start:start + count]
+            self.write_arrays["velocities"][row:row + count] = velocities[start:start + count]
+            self.length += count
+            start += count
+
+            if row + count == self.chunk_steps:
+                self.close_write_chunk()
+                self.write_meta()
+
+    # Drop every step from length on, so appending continues from there
+    def truncate(self, length):
+        if not self.writable:
+            raise ValueError(f"{self.path} was opened read-only")
+
+        if length < self.length:
+            self.close_write_chunk()
+            self.read_chunks = OrderedDict()
+            self.length = length
+            self.write_meta()
+
+    # Shrink the files of the last, partly filled chunk to the steps they hold. Meant for finished stores that are
+    # kept around, as appending to a compacted store would need its last chunk files at full size again
+    def compact(self):
+        chunk, rows = divmod(self.length, self.chunk_steps)
+        if rows == 0:
+            return
+
+        self.close_write_chunk()
+        self.read_chunks = OrderedDict()
+
+        for name in store_arrays:
+            path = self.chunk_path(name, chunk)
+            values = np.load(path, mmap_mode="r")[:rows].copy()
+
+            with open(f"{path}.tmp", "wb") as file:
+                np.save(file, values)
+            os.replace(f"{path}.tmp", path)
+
+    def flush(self):
+        for array in self.write_arrays.values():
+            array.flush()
+
+        if self.writable:
+            self.write_meta()
+
+    def close(self):
+        if self.writable:
+            self.close_write_chunk()
+            self.write_meta()
+
+        self.read_chunks = OrderedDict()
+
+    # Lazy view of the store as a Trajectory, whose arrays read the chunk files on demand
+    def trajectory(self):
+        return Trajectory(self.ids, self.names, self.masses, self.step_size, ChunkedArray(self, "times"),
+                          ChunkedArray(self, "positions"), ChunkedArray(self, "velocities"))
+
+# endregion
@@ -1,15 +1,21 @@
 import dearpygui.dearpygui as dpg
+import itertools
+import os
 import numpy as np
-import astropy.constants as const
-from collections import namedtuple
+import threading
+import time
+from gravity_backends import compute_backends
+from gravity_cache import ResultCache, cache_key
+from gravity_lod import decimate_view, mask_runs, visible_mask
+from gravity_preview import Preview
+from gravity_sim import Body, TrajectoryBuffer, TrajectoryRing, Vec2, Vec3, body_id_from_name, interpolate_positions, \
+    load_scenario, save_scenario
+from gravity_stats import RunStats, write_json_lines
+from gravity_store import TrajectoryStore
+from gravity_worker import SimulationWorker
 
 # region Global Definitions and Variables
 
-# Named tuples acting as sudo-classes for ease of data storage and manipulation
-Body = namedtuple('Body', ['id', 'name', 'position', 'velocity', 'mass', 'color'])
-Vec2 = namedtuple('Vector2', ['x', 'y'])
-Vec3 = namedtuple('Vector3', ['x', 'y', 'z'])
-
 # Default settings for graph scale and center location
 default_graph_scale = 11.5
 graph_scale = 11.5
@@ -29,159 +35,862 @@ colors = [[68, 216, 0, 255],
           [0, 255, 206, 255],
           [255, 29, 206, 255]]
 
+# Force solvers selectable in the simulation settings, by their label
+force_solver_labels = {"Direct Sum": "direct",
+                       "Barnes-Hut": "barnes_hut",
+                       "Parallel Direct Sum": "parallel"}
+
+# Compute backends of the direct sum selectable in the simulation settings, by their label, Auto choosing the fastest
+# for the number of bodies. Backends that aren't installed aren't offered
+backend_labels = {label: backend for label, backend in {"Auto": "auto",
+                                                         "Reference": "reference",
+                                                         "NumPy": "numpy",
+                                                         "Numba": "numba"}.items()
+                  if backend == "auto" or backend in compute_backends}
+
+# Integrators selectable in the simulation settings, by their label
+integrator_labels = {"Verlet": "verlet",
+                     "Yoshida 4th Order": "yoshida4",
+                     "Adaptive DOPRI5": "adaptive",
+                     "Block Timesteps": "block",
+                     "Wisdom-Holman": "wisdom_holman",
+                     "Close Encounters": "encounter"}
+
 # Keep track of how many bodies are created and what default color will be selected in the creation menu
 body_count = 1
 body_color = colors[0]
 
-# Main dictionary holding all created bodies
+# Main dictionary holding all created bodies, along with maps from body name to id and from id to position in bodies
 bodies = {}
+body_ids_by_name = {}
+body_indices = {}
 
 # List of body names for use in body selection menu
 body_names = []
 
+# Only the first drag_point_limit bodies, and any body selected since, get drag points of their own, the rest are
+# drawn by one scatter series per view so loading a large scenario doesn't create thousands of plot items
+drag_point_limit = 64
+drag_point_ids = set()
+
 selected_body = Body(0, "", Vec3(0, 0, 0), Vec3(0, 0, 0), 0, [0, 0, 0, 0])
 
 # Reset flag that prevents the editing of bodies before a simulation is reset and the trajectories are cleared
 reset = True
 
+# Background simulation that is running or has finished, and the last of its steps that has been plotted
+simulation_worker = None
+plotted_step = -1
+
+# Decimated copy of the simulation's positions shown on the graph. Each body's trajectory is drawn as a run of line
+# series holding plot_chunk_size points each, so a graph update only has to resend the newest, unfinished chunk. A
+# run with no end (Run Forever) is held in a TrajectoryRing of its last Trail steps instead, whose chunks are all
+# resent on every update as the trail moves
+trajectory_buffer = None
+trajectory_ids = []
+plot_chunk_size = 2048
+plot_chunks = 0
+
+# Level of detail: the first lod_length buffered points are drawn by one line series per body and view, decimated for
+# the current view, and the chunks only hold the points after them. lod_dirty is set when the view changes and the
+# decimation is redone at most every lod_interval seconds, or less often if it takes longer than that
+lod_length = 0
+lod_dirty = False
+lod_next_refresh = 0.0
+lod_interval = 0.05
+
+# Full resolution positions of the trajectory once it is complete, as (positions, save_stride, point_stride) where
+# positions holds every save_stride-th step and the buffer every point_stride-th. When zoomed in, the visible parts of
+# the trajectory are drawn from these, as long as they hold fewer than lod_detail_limit positions
+lod_source = None
+lod_detail_limit = 2000000
+
+# Size of the plots in pixels before they have been drawn
+default_graph_size = (600, 400)
+
+# Results of earlier runs, so running a configuration again shows its trajectories straight away. simulation_key is
+# the cache key of the running simulation, which is cached once it finishes, by copying its store in cache_thread
+result_cache = ResultCache()
+simulation_key = None
+cache_thread = None
+
+# Timings of the GUI's side of the current run, the worker's own statistics come from its stats queue
+gui_stats = RunStats()
+
+# Directory exported run statistics are written to, as one JSON lines file per run
+stats_export_dir = "run_stats"
+
+# Job of the last run when it was submitted to a job server (Use Job Server, see gravity_server.py) rather than run
+# by a local worker. A background thread follows the job, filling in its latest summary and, once it has finished, its
+# trajectory or the error it failed with
+server_job = None
+
+# Playback of the stored trajectory of a stopped run: the trajectory, the simulated time in seconds the bodies are
+# shown at, whether it is playing, and when the last frame was drawn. Positions between the saved steps are
+# interpolated, so only the two steps either side of the time shown are read from the store
+playback_trajectory = None
+playback_time = 0.0
+playback_playing = False
+playback_last_frame = 0.0
+
+# Live preview of the orbits while bodies are dragged or edited, drawn as faint ghost lines for the bodies in
+# preview_ids. It is computed in the frame loop for at most preview_budget seconds a frame, coarse first and refined
+# while the bodies are left alone, and moving a body again replaces it, dropping the rest of its work
+preview = None
+preview_ids = []
+preview_budget = 0.02
+
+# Opacity of the ghost lines, out of 255
+preview_alpha = 96
 
-# Method used for copying a body but with a different position and velocity
-def copy_body(body, position, velocity):
-    return Body(body.id, body.name, position, velocity, body.mass, body.color)
 
 # endregion
 
 
-# region Physical Models and Calculations
-
-# Calculate the total acceleration of a body based on the summed forced of n other bodies
-def n_body_accel(body, n_bodies):
-    accel_sum_x = 0
-    accel_sum_y = 0
-    accel_sum_z = 0
+# region Simulation
 
-    for n_body in n_bodies:
-        distance = np.sqrt((body.position.x - n_body.position.x) ** 2
-                           + (body.position.y - n_body.position.y) ** 2
-                           + (body.position.z - n_body.position.z) ** 2)
+# Force solver and integrator chosen in the settings, along with their options
+def simulation_settings():
+    solver = force_solver_labels[dpg.get_value("force_solver")]
+    solver_options = None
+    if solver == "barnes_hut":
+        solver_options = {"theta": dpg.get_value("solver_theta")}
+    elif solver == "parallel":
+        solver_options = {"workers": dpg.get_value("solver_workers")}
+    elif backend_labels[dpg.get_value("compute_backend")] != "auto":
+        solver_options = {"backend": backend_labels[dpg.get_value("compute_backend")]}
+    if dpg.get_value("solver_softening") > 0:
+        solver_options = dict(solver_options or {}, softening=dpg.get_value("solver_softening"))
 
-        scaler = -(const.G.value * n_body.mass) / distance ** 3
+    integrator = integrator_labels[dpg.get_value("integrator")]
+    integrator_options = None
+    if integrator == "adaptive":
+        integrator_options = {"rtol": dpg.get_value("integrator_tolerance")}
+    elif integrator == "encounter" and dpg.get_value("merge_radius") > 0:
+        integrator_options = {"merge_radius": dpg.get_value("merge_radius")}
 
-        accel_sum_x += (body.position.x - n_body.position.x) * scaler
-        accel_sum_y += (body.position.y - n_body.position.y) * scaler
-        accel_sum_z += (body.position.z - n_body.position.z) * scaler
+    return solver, solver_options, integrator, integrator_options
 
-    return Vec3(accel_sum_x, accel_sum_y, accel_sum_z)
 
-
-# Using the Verlet Integration, solve for the new position, velocity, and acceleration of each body
+# Start solving the trajectories of the current bodies in a background worker, the frame loop plots them as they arrive
 def calculate_trajectories():
     reset_trajectories()
+    clear_preview()
 
     global reset
     reset = False
 
     step_size = dpg.get_value("step_size")  # Size of time step for use in integration (dt, or h)
     sim_time = dpg.get_value("sim_time")  # Length of simulation based on time step
-    update_freq = dpg.get_value("update_freq")  # Used to improve performance by only updating graph every x time steps
 
-    body_positions = {}
-    body_velocities = {}
-    body_accelerations = {}
+    solver, solver_options, integrator, integrator_options = simulation_settings()
+    save_stride = dpg.get_value("save_stride")
+
+    global gui_stats
+    gui_stats = RunStats()
 
-    # Fill dictionaries with empty lists containing zeroed positional, velocity,
-    # and acceleration data for each body based on sim_time
-    for body_key, body_value in bodies.items():
-        body_positions[body_key] = [Vec3(0, 0, 0) for _ in range(0, sim_time)]
-        # Insert starting position
-        body_positions[body_key][0] = body_value.position
+    if dpg.get_value("run_forever"):
+        start_endless_run(step_size, solver, solver_options, save_stride, integrator, integrator_options)
+        return
 
-        body_velocities[body_key] = [Vec3(0, 0, 0) for _ in range(0, sim_time)]
-        # Insert starting velocity
-        body_velocities[body_key][0] = body_value.velocity
+    if sim_time < 1:
+        return
 
-        body_accelerations[body_key] = [Vec3(0, 0, 0) for _ in range(0, sim_time)]
-        n_bodies = [value for key, value in bodies.items() if key != body_key]
+    global simulation_key
+    simulation_key = cache_key(bodies, step_size, sim_time, save_stride, solver, solver_options, integrator,
+                               integrator_options)
 
-        # Calculate and insert starting acceleration
-        body_accelerations[body_key][0] = n_body_accel(body_value, n_bodies)
+    trajectory = result_cache.get(simulation_key)
+    if trajectory is not None:
+        show_cached_trajectory(trajectory, save_stride, dpg.get_value("update_freq"))
+        simulation_key = None
+        return
 
-    # For each time step, calculate the next position, velocity, and acceleration values for each body
-    for i in range(0, sim_time - 1):
-        # First calculate all the new positions (t + dt) of the bodies
-        for body_key, body_value in bodies.items():
-            body = copy_body(body_value, body_positions[body_key][i], body_velocities[body_key][i])
+    if dpg.get_value("use_server"):
+        start_server_job(step_size, sim_time, save_stride, solver, solver_options, integrator, integrator_options)
+        return
 
-            accel = body_accelerations[body_key][i]
+    # The worker only shares every update_freq-th position with the GUI, the full trajectory is streamed to disk
+    global simulation_worker
+    simulation_worker = SimulationWorker(bodies, step_size, sim_time, solver, solver_options,
+                                         plot_stride=dpg.get_value("update_freq"), save_stride=save_stride,
+                                         integrator=integrator, integrator_options=integrator_options)
 
-            # Calculate the new position based on the previous velocity and acceleration
-            # p(t + dt) = p(t) + v(t) * dt + a(t) * dt^2 * 0.5
-            x = body.position.x + body.velocity.x * step_size + accel.x * ((step_size ** 2) / 2)
-            y = body.position.y + body.velocity.y * step_size + accel.y * ((step_size ** 2) / 2)
-            z = body.position.z + body.velocity.z * step_size + accel.z * ((step_size ** 2) / 2)
-            new_position = Vec3(x, y, z)
+    global trajectory_buffer, trajectory_ids
+    trajectory_buffer = TrajectoryBuffer(len(bodies), 1, len(simulation_worker.plot_positions))
+    trajectory_ids = simulation_worker.ids
+    add_trajectory_themes(trajectory_ids)
 
-            body_positions[body_key][i + 1] = new_position
+    dpg.set_value("sim_progress", 0)
+    dpg.configure_item("pause_button", label="Pause")
 
-        # Next calculate the new acceleration based on the new positions, and solve for the velocity at that position
-        for body_key, body_value in bodies.items():
-            body = copy_body(body_value, body_positions[body_key][i + 1], body_velocities[body_key][i])
-            n_bodies = [copy_body(value, body_positions[key][i + 1], body_velocities[key][i]) for key, value in bodies.items() if key != body_key]
 
-            accel = body_accelerations[body_key][i]
-            new_accel = n_body_accel(body, n_bodies)
+# Submit the current bodies to the job server at the Job Server address instead of running them here. The trajectory
+# is shown once the job is done, and a job that is already queued or running for someone else is shared
+def start_server_job(step_size, sim_time, save_stride, solver, solver_options, integrator, integrator_options):
+    global server_job
+    server_job = {"url": dpg.get_value("server_url").rstrip("/"), "save_stride": save_stride,
+                  "update_freq": dpg.get_value("update_freq"), "id": None, "shared": False, "summary": None,
+                  "trajectory": None, "error": None, "cancelled": False}
 
-            # Calculate the new velocity
-            vx = body.velocity.x + (accel.x + new_accel.x) * (step_size / 2)
-            vy = body.velocity.y + (accel.y + new_accel.y) * (step_size / 2)
-            vz = body.velocity.z + (accel.z + new_accel.z) * (step_size / 2)
-            new_velocity = Vec3(vx, vy, vz)
+    request = (list(bodies.values()), step_size, sim_time, save_stride, solver, solver_options, integrator,
+               integrator_options)
+    threading.Thread(target=follow_server_job, args=(server_job, request), daemon=True).start()
 
-            body_velocities[body_key][i + 1] = new_velocity
-            body_accelerations[body_key][i + 1] = new_accel
+    dpg.set_value("sim_progress", 0)
+    dpg.set_value("server_status", "Submitting")
 
-            # Update the graph every n frame based on update_freq
-            if i % update_freq == 0:
-                x_pos = [r.x for r in body_positions[body_key][0:i + 1]]
-                y_pos = [r.y for r in body_positions[body_key][0:i + 1]]
-                z_pos = [r.z for r in body_positions[body_key][0:i + 1]]
 
-                dpg.set_value(f"td_line_{body_key}", [x_pos[::update_freq], y_pos[::update_freq]])
-                dpg.set_value(f"side_line_{body_key}", [x_pos[::update_freq], z_pos[::update_freq]])
+# Submit a job and follow it until it has finished, downloading its trajectory if it is done. Run in a background
+# thread, handing its results to the frame loop through the job's dictionary
+def follow_server_job(job, request):
+    from gravity_server import cancel_job, fetch_result, job_events, submit_job
 
-                dpg.set_value(f"td_drag_{body_key}", [x_pos[i], y_pos[i]])
-                dpg.set_value(f"side_drag_{body_key}", [x_pos[i], z_pos[i]])
+    try:
+        summary = submit_job(job["url"], *request)
+        job["id"], job["shared"], job["summary"] = summary["id"], summary["deduplicated"], summary
 
-                if selected_body.id == body.id:
+        if job["cancelled"]:
+            cancel_job(job["url"], job["id"])
+            return
 
-                    global graph_center_x
-                    graph_center_x = x_pos[i]
+        for summary in job_events(job["url"], job["id"]):
+            job["summary"] = summary
+            if job["cancelled"]:
+                return
 
-                    global graph_center_y
-                    graph_center_y = y_pos[i] / 0.559
+        if summary["status"] == "done":
+            job["trajectory"] = fetch_result(job["url"], job["id"])
+        elif summary["status"] == "failed":
+            job["error"] = summary["error"]
+    except (OSError, ValueError) as error:
+        job["error"] = str(error)
 
-                    global graph_center_z
-                    graph_center_z = z_pos[i]
 
-                    update_graph_position()
+# Withdraw from the job on the job server, which cancels it unless someone else is waiting for it too
+def cancel_server_job():
+    global server_job
+    if server_job is None:
+        return
 
-        dpg.set_value("sim_progress", i / (sim_time - 1))
+    job, server_job = server_job, None
+    job["cancelled"] = True
 
+    if job["id"] is not None:
+        from gravity_server import cancel_job
+        threading.Thread(target=lambda: cancel_job(job["url"], job["id"]), daemon=True).start()
 
-# endregion
+    dpg.set_value("server_status", "Cancelled")
 
 
-# region GUI Setup and Logic
+# Called every frame, shows the progress of the job on the job server, and its trajectory once it has arrived
+def poll_server_job():
+    global server_job, simulation_key
+    if server_job is None:
+        return
+
+    summary = server_job["summary"]
+    if summary is not None:
+        dpg.set_value("sim_progress", summary["progress"])
+        dpg.set_value("server_status", f"Job {summary['id']}: {summary['status']}"
+                                       f"{' (shared)' if server_job['shared'] else ''}")
+
+    if server_job["error"] is not None:
+        dpg.set_value("server_status", f"Job server: {server_job['error']}")
+        server_job = None
+    elif server_job["trajectory"] is not None:
+        trajectory = server_job["trajectory"]
+        if simulation_key is not None:
+            result_cache.put(simulation_key, trajectory)
+            simulation_key = None
+
+        show_cached_trajectory(trajectory, server_job["save_stride"], server_job["update_freq"])
+        server_job = None
+    elif summary is not None and summary["status"] == "cancelled":
+        server_job = None
+
+
+# Start a run with no end, which goes on until it is cancelled. Only the last Trail steps are plotted, every Update
+# Freq-th one, and its steps are only kept on disk if Spill to Disk is checked, so memory and disk use stay flat
+# however long it runs. Such a run is never cached
+def start_endless_run(step_size, solver, solver_options, save_stride, integrator, integrator_options):
+    update_freq = max(dpg.get_value("update_freq"), 1)
+
+    global simulation_worker
+    simulation_worker = SimulationWorker(bodies, step_size, None, solver, solver_options, plot_stride=update_freq,
+                                         save_stride=save_stride, integrator=integrator,
+                                         integrator_options=integrator_options,
+                                         window=max(dpg.get_value("trail_length") // update_freq, 2),
+                                         spill=dpg.get_value("spill_to_disk"))
+
+    global trajectory_buffer, trajectory_ids
+    trajectory_buffer = TrajectoryRing(len(bodies), 1, simulation_worker.window)
+    trajectory_ids = simulation_worker.ids
+    add_trajectory_themes(trajectory_ids)
+
+    dpg.set_value("sim_progress", 0)
+    dpg.configure_item("pause_button", label="Pause")
+
+
+# Extend the finished or cancelled run by Sim Time more steps, from the checkpoint its worker left in its store, with
+# the solver and integrator currently chosen. The trajectories already plotted are kept. A cancelled run with no end
+# goes on with no end again, keeping the same trail
+def continue_trajectories():
+    global simulation_worker
+    if simulation_worker is None or simulation_worker.is_running() or \
+            not SimulationWorker.can_continue(simulation_worker.store_path):
+        return
+
+    sim_time = None if simulation_worker.is_endless() else dpg.get_value("sim_time")
+    if sim_time is not None and sim_time < 1:
+        return
+
+    # Plot whatever the old worker calculated before it stopped, and let it finish caching its store
+    poll_simulation()
+    wait_for_cache()
+    set_playback_trajectory(None)
+
+    global simulation_key
+    simulation_key = None
+
+    global gui_stats
+    gui_stats = RunStats()
+
+    # The store is handed over to the new worker
+    previous_worker = simulation_worker
+    owns_store = previous_worker.owns_store
+    previous_worker.owns_store = False
+    previous_worker.close()
+
+    solver, solver_options, integrator, integrator_options = simulation_settings()
+    simulation_worker = SimulationWorker.continue_run(previous_worker.store_path, sim_time,
+                                                      previous_worker.plot_stride, solver, solver_options,
+                                                      integrator, integrator_options, owns_store,
+                                                      previous_worker.window, previous_worker.spill)
+
+    # Points past the checkpoint are dropped, as they will be calculated again
+    global plotted_step
+    plotted_step = simulation_worker.start_step
+
+    global lod_source
+    lod_source = None
+
+    trajectory_buffer.truncate(simulation_worker.first_row)
+    refresh_lod()
+
+    dpg.set_value("sim_progress", 0)
+    dpg.configure_item("pause_button", label="Pause")
+
+
+# Called every frame, plots the steps calculated by the worker once update_freq new ones are available
+def poll_simulation():
+    if simulation_worker is None:
+        return
+
+    update_freq = simulation_worker.plot_stride  # Used to improve performance by only updating graph every x time steps
+    last_step = simulation_worker.steps_available() - 1
+
+    # A run with no end shows how much of its trail has been filled
+    start_step = simulation_worker.start_step
+    if simulation_worker.is_endless():
+        dpg.set_value("sim_progress", trajectory_buffer.length / trajectory_buffer.capacity)
+    else:
+        dpg.set_value("sim_progress",
+                      max(last_step - start_step, 0) / max(simulation_worker.end_step - 1 - start_step, 1))
+
+    # Always plot the final steps once the worker has stopped, whether it finished or was cancelled
+    global plotted_step
+    if last_step > plotted_step and (last_step - plotted_step >= update_freq or not simulation_worker.is_running() or
+                                     simulation_worker.is_finished()):
+        plotted_step = last_step
+        update_trajectory_plots(last_step)
+
+    stats = simulation_worker.collect_stats()
+    if stats is not None:
+        update_diagnostics(stats)
+
+    # A finished run is cached in the background once its worker has closed its store, a cancelled or continued one
+    # isn't
+    global simulation_key, cache_thread
+    if simulation_key is not None and plotted_step == last_step and simulation_worker.is_finished() and \
+            not simulation_worker.is_running():
+        cache_thread = threading.Thread(target=result_cache.put_store,
+                                        args=(simulation_key, simulation_worker.store_path), daemon=True)
+        cache_thread.start()
+        simulation_key = None
+
+    # Once the run has stopped, its store can be played back
+    if playback_trajectory is None and plotted_step == last_step and not simulation_worker.is_running():
+        set_playback_trajectory(TrajectoryStore.open(simulation_worker.store_path).trajectory())
+
+    # Once the run has stopped, its store is read for the detail of zoomed in views. The trail of a run with no end
+    # doesn't start at the store's first step, so it is only ever drawn from its own points
+    global lod_source, lod_dirty
+    if lod_source is None and plotted_step == last_step and not simulation_worker.is_running() and \
+            not simulation_worker.is_endless():
+        store = TrajectoryStore.open(simulation_worker.store_path)
+        lod_source = (store.trajectory().positions, store.save_stride, simulation_worker.plot_stride)
+        lod_dirty = True
+
+
+# Show a cached trajectory the way a worker's run would be shown, with every plot_stride-th step drawn
+def show_cached_trajectory(trajectory, save_stride, plot_stride):
+    save_stride = max(save_stride, 1)
+    row_stride = max(plot_stride // save_stride, 1)
+    rows = np.asarray(trajectory.positions[::row_stride])
+
+    global trajectory_buffer, trajectory_ids, lod_source
+    trajectory_buffer = TrajectoryBuffer(len(trajectory.ids), 1, len(rows))
+    trajectory_buffer.extend(rows, len(rows))
+    trajectory_ids = trajectory.ids
+    lod_source = (trajectory.positions, save_stride, row_stride * save_stride)
+    add_trajectory_themes(trajectory_ids)
+    set_playback_trajectory(trajectory)
+
+    refresh_lod()
+    move_drag_points(trajectory.ids, trajectory.positions[-1])
+
+    dpg.set_value("sim_progress", 1)
+
+
+# Make a trajectory the one played back, or stop playback with None. Playback starts out paused at its last step,
+# where the run left the bodies
+def set_playback_trajectory(trajectory):
+    global playback_trajectory, playback_time, playback_playing
+    playback_trajectory = trajectory
+    playback_playing = False
+    dpg.configure_item("play_button", label="Play")
+
+    if trajectory is None or len(trajectory.times) == 0:
+        dpg.configure_item("playback_slider", max_value=0)
+        dpg.set_value("playback_slider", 0)
+        return
+
+    playback_time = float(trajectory.times[len(trajectory.times) - 1])
+    dpg.configure_item("playback_slider", min_value=float(trajectory.times[0]) / 86400, max_value=playback_time / 86400)
+    dpg.set_value("playback_slider", playback_time / 86400)
+
+
+# Move the bodies to where they were at playback_time, which also keeps the graph centered on the selected body
+def show_playback_frame():
+    move_drag_points(playback_trajectory.ids, interpolate_positions(playback_trajectory, playback_time))
+    dpg.set_value("playback_slider", playback_time / 86400)
+
+
+# Play or pause the playback of the last run, starting over once it has reached the end
+def toggle_playback():
+    global playback_playing, playback_time, playback_last_frame
+    if playback_trajectory is None or len(playback_trajectory.times) == 0:
+        return
+
+    playback_playing = not playback_playing
+    dpg.configure_item("play_button", label="Pause" if playback_playing else "Play")
+
+    end_time = float(playback_trajectory.times[len(playback_trajectory.times) - 1])
+    if playback_playing and playback_time >= end_time:
+        playback_time = float(playback_trajectory.times[0])
+
+    playback_last_frame = time.perf_counter()
+
+
+# Show the moment of the last run picked with the playback slider, in days
+def scrub_playback(_, value):
+    global playback_time
+    if playback_trajectory is None or len(playback_trajectory.times) == 0:
+        return
+
+    playback_time = value * 86400
+    show_playback_frame()
+
+
+# Called every frame, moves a playing playback on by Playback Speed steps per second of real time, pausing at the end
+def advance_playback():
+    global playback_time, playback_playing, playback_last_frame
+    if not playback_playing:
+        return
+
+    now = time.perf_counter()
+    end_time = float(playback_trajectory.times[len(playback_trajectory.times) - 1])
+    playback_time = min(playback_time + (now - playback_last_frame) * dpg.get_value("playback_speed") *
+                        playback_trajectory.step_size, end_time)
+    playback_last_frame = now
+
+    if playback_time >= end_time:
+        playback_playing = False
+        dpg.configure_item("play_button", label="Play")
+
+    show_playback_frame()
+
+
+# Wait until the store of the last run has been copied into the cache, before it is changed or deleted
+def wait_for_cache():
+    if cache_thread is not None:
+        cache_thread.join()
+
+
+# Update the graph with the trajectory calculated up to step i. Only the new points are appended to the buffer and
+# only the chunks they fall in are resent, so the cost of an update doesn't grow as the run goes on. The trail of a
+# run with no end moves with every update, so all of its chunks are resent, which costs at most Trail points a body
+def update_trajectory_plots(i):
+    update_start = time.perf_counter()
+    first_new_point = trajectory_buffer.length
+    first_row, rows = simulation_worker.plot_rows(trajectory_buffer.next_step, i // simulation_worker.plot_stride + 1)
+    trajectory_buffer.extend(rows, first_row + len(rows), first_row)
+
+    # Neighbouring chunks share a point so the line stays connected, the first chunk starts at the last point drawn
+    # by the level of detail series
+    base = max(lod_length - 1, 0)
+    first_chunk = max(first_new_point - 1 - base, 0) // plot_chunk_size
+    if simulation_worker.is_endless():
+        first_chunk = 0
+    last_chunk = max(trajectory_buffer.length - 2 - base, 0) // plot_chunk_size
+
+    refresh_chunks(simulation_worker.ids, first_chunk, last_chunk)
+    move_drag_points(simulation_worker.ids, simulation_worker.latest_position)
+
+    gui_stats.add_time("plot_update", time.perf_counter() - update_start)
+
+
+# Move the drag points of the bodies to their latest positions, recentering the graph on the selected body
+def move_drag_points(ids, positions):
+    rows = [body_index for body_index, body_key in enumerate(ids) if body_key in drag_point_ids]
+    move_body_markers(ids, positions, rows)
+
+    for body_index in rows:
+        body_key = ids[body_index]
+        x, y, z = positions[body_index]
+        dpg.set_value(f"td_drag_{body_key}", [x, y])
+        dpg.set_value(f"side_drag_{body_key}", [x, z])
+
+        if selected_body.id == body_key:
+
+            global graph_center_x
+            graph_center_x = x
+
+            global graph_center_y
+            graph_center_y = y / 0.559
+
+            global graph_center_z
+            graph_center_z = z
+
+            update_graph_position()
+
+
+# Move the markers of the bodies without drag points, every row of positions but the given drag point rows
+def move_body_markers(ids, positions, drag_point_rows):
+    markers = np.ones(len(ids), dtype=bool)
+    markers[drag_point_rows] = False
+    x_pos, y_pos, z_pos = np.asarray(positions, dtype=float).reshape(-1, 3)[markers].T.copy()
+
+    dpg.set_value("td_body_markers", [x_pos, y_pos])
+    dpg.set_value("side_body_markers", [x_pos, z_pos])
+
+
+# Resend the buffered points of chunks first_chunk to last_chunk (every chunk from first_chunk on by default) to the
+# line series of the bodies with the given ids, adding the series of chunks that don't have one yet
+def refresh_chunks(ids, first_chunk, last_chunk=None):
+    refresh_start = time.perf_counter()
+
+    global plot_chunks
+    last_chunk = plot_chunks - 1 if last_chunk is None else last_chunk
+
+    for body_index, body_key in enumerate(ids):
+        for chunk in range(first_chunk, last_chunk + 1):
+            if chunk >= plot_chunks:
+                add_trajectory_series(body_key, chunk)
+
+            start = max(lod_length - 1, 0) + chunk * plot_chunk_size
+            stop = start + plot_chunk_size + 1
+
+            x_pos = trajectory_buffer.view(body_index, 0, start, stop)
+            y_pos = trajectory_buffer.view(body_index, 1, start, stop)
+            z_pos = trajectory_buffer.view(body_index, 2, start, stop)
+
+            dpg.set_value(f"td_line_{body_key}_{chunk}", [x_pos, y_pos])
+            dpg.set_value(f"side_line_{body_key}_{chunk}", [x_pos, z_pos])
+
+    plot_chunks = max(plot_chunks, last_chunk + 1)
+    gui_stats.add_time("set_value", time.perf_counter() - refresh_start)
+
+
+# Plotted ranges of both views, as (view, vertical axis, x range, vertical range, width, height) with the axis being
+# 1 for y or 2 for z and the size in pixels
+def graph_views():
+    views = []
+    for view, axis, vertical_center, vertical_scale in (("td", 1, graph_center_y, 0.559),
+                                                         ("side", 2, graph_center_z, 0.383)):
+        width, height = dpg.get_item_rect_size(f"{view}_graph")
+        if width <= 0 or height <= 0:
+            width, height = default_graph_size
+
+        x_range = (graph_center_x - 10 ** graph_scale, graph_center_x + 10 ** graph_scale)
+        vertical_range = ((vertical_center - 10 ** graph_scale) * vertical_scale,
+                          (vertical_center + 10 ** graph_scale) * vertical_scale)
+        views.append((view, axis, x_range, vertical_range, width, height))
+
+    return views
+
+
+# Positions of the parts of the trajectory visible in the given views at full resolution, as a (N, 3, points) array
+# like the buffer's with NaN columns between the parts, or None if lod_source has no more detail than the buffer or
+# the visible parts hold too many positions
+def lod_detail(points, views):
+    positions, save_stride, point_stride = lod_source
+    if point_stride <= save_stride:
+        return None
+
+    mask = np.zeros(points.shape[2], dtype=bool)
+    for _, axis, x_range, vertical_range, _, _ in views:
+        mask |= visible_mask(points[:, 0], points[:, axis], x_range, vertical_range).any(axis=0)
+
+    starts, ends = mask_runs(mask)
+    first_rows = starts * point_stride // save_stride
+    last_rows = np.minimum((ends - 1) * point_stride // save_stride + 1, len(positions))
+
+    if len(starts) == 0 or np.sum(last_rows - first_rows) * points.shape[0] > lod_detail_limit:
+        return None
+
+    gap = np.full(points.shape[:2] + (1,), np.nan)
+    parts = []
+    for first_row, last_row in zip(first_rows, last_rows):
+        if parts:
+            parts.append(gap)
+        parts.append(np.transpose(np.asarray(positions[first_row:last_row]), (1, 2, 0)))
+
+    return np.concatenate(parts, axis=2)
+
+
+# Draw every buffered point with the level of detail series, decimated for the current view, and empty the chunks.
+# The next refresh is put off for five times as long as this one took, so large trajectories don't stall the GUI. The
+# trail of a run with no end is left to the chunks, as its points shift on every update
+def refresh_lod():
+    refresh_start = time.perf_counter()
+
+    global lod_length, lod_dirty, lod_next_refresh
+    lod_dirty = False
+
+    if trajectory_buffer is None:
+        return
+
+    lod_length = 0 if isinstance(trajectory_buffer, TrajectoryRing) else trajectory_buffer.length
+    views = graph_views()
+
+    points = trajectory_buffer.points[:, :, :lod_length]
+    if lod_source is not None:
+        detail = lod_detail(points, views)
+        points = points if detail is None else detail
+
+    for body_index, body_key in enumerate(trajectory_ids):
+        for view, axis, x_range, vertical_range, width, height in views:
+            x_pos, vertical_pos = decimate_view(points[body_index, 0], points[body_index, axis], x_range,
+                                                vertical_range, width, height)
+            dpg.set_value(f"{view}_lod_{body_key}", [x_pos, vertical_pos])
+
+    # Chunks past the buffered points are emptied
+    refresh_chunks(trajectory_ids, 0, max(plot_chunks - 1, 0))
+
+    duration = time.perf_counter() - refresh_start
+    lod_next_refresh = time.perf_counter() + max(lod_interval, 5 * duration)
+    gui_stats.add_time("lod_refresh", duration)
+
+
+# Called every frame, redoes the level of detail once the view has changed and the last refresh has been put off long
+# enough
+def refresh_lod_if_due():
+    if lod_dirty and time.perf_counter() >= lod_next_refresh:
+        refresh_lod()
+
+
+# Show a statistics snapshot of the worker in the Diagnostics tab, along with the GUI's plot update time
+def update_diagnostics(stats):
+    phase_times = stats["phase_times"]
+    elapsed = max(stats["elapsed"], 1e-9)
+
+    plot_seconds, plot_updates = gui_stats.phases.get("plot_update", (0.0, 0))
+
+    dpg.set_value("diag_steps_rate", f"{stats['rates'].get('step', 0):,.0f}")
+    dpg.set_value("diag_force_rate", f"{stats['rates'].get('force', 0):,.0f}")
+    dpg.set_value("diag_force_share", f"{100 * phase_times.get('force', 0) / elapsed:.1f} %")
+    dpg.set_value("diag_store_share",
+                  f"{100 * (phase_times.get('store', 0) + phase_times.get('checkpoint', 0)) / elapsed:.1f} %")
+    dpg.set_value("diag_plot_time", f"{1000 * plot_seconds / max(plot_updates, 1):.2f} ms")
+    dpg.set_value("diag_peak_memory", "-" if stats["peak_memory_mb"] is None else f"{stats['peak_memory_mb']:.0f} MB")
+
+    drift, max_drift = stats["drift"], stats["max_drift"]
+    dpg.set_value("diag_energy_drift", f"{drift.get('energy', 0):.2e}")
+    dpg.set_value("diag_max_energy_drift", f"{max_drift.get('energy', 0):.2e}")
+    dpg.set_value("diag_momentum_drift", f"{drift.get('momentum', 0):.2e}")
+    dpg.set_value("diag_angular_drift", f"{drift.get('angular_momentum', 0):.2e}")
+
+
+# Write the statistics of the last run to a new JSON lines file: every snapshot the worker sent, then one line of the
+# GUI's timings along with the run's settings
+def export_stats():
+    snapshots = []
+    if simulation_worker is not None:
+        simulation_worker.collect_stats()
+        snapshots = [dict(stats, source="worker") for stats in simulation_worker.stats_history]
 
-# Mac Scale? width=1265, height=680
-dpg.create_context()
-dpg.create_viewport(title='Gravity Tool', width=1280, height=720, resizable=False)
-dpg.setup_dearpygui()
+    solver, _, integrator, _ = simulation_settings()
+    snapshots.append(gui_stats.snapshot(source="gui", step_size=dpg.get_value("step_size"),
+                                        sim_time=dpg.get_value("sim_time"), update_freq=dpg.get_value("update_freq"),
+                                        save_stride=dpg.get_value("save_stride"), solver=solver,
+                                        integrator=integrator, bodies=len(bodies)))
 
+    path = os.path.join(stats_export_dir, f"run_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+    write_json_lines(path, snapshots)
+    dpg.set_value("stats_export_path", path)
+
+
+# Start a new preview of the current bodies with the simulation settings, in place of any earlier one
+def start_preview():
+    global preview
+    if not dpg.get_value("live_preview") or not bodies:
+        return
+
+    solver, solver_options, integrator, integrator_options = simulation_settings()
+    preview = Preview(bodies, dpg.get_value("step_size"), max(dpg.get_value("sim_time"), 1), solver, solver_options,
+                      integrator, integrator_options)
+
+
+# Called every frame, works on the preview for at most preview_budget seconds and draws it whenever it has been
+# refined
+def advance_preview():
+    if preview is None or preview.is_done():
+        return
+
+    preview_start = time.perf_counter()
+    if preview.advance(preview_budget):
+        show_preview()
+
+    gui_stats.add_time("preview", time.perf_counter() - preview_start)
+
+
+# Draw the finest level of the preview finished so far as the ghost lines, adding the lines of bodies that don't have
+# one yet
+def show_preview():
+    global preview_ids
+    if preview_ids != preview.ids:
+        clear_preview_series()
+        preview_ids = preview.ids
+
+        for body_key in preview_ids:
+            add_preview_series(body_key)
+
+    for body_index, body_key in enumerate(preview_ids):
+        x_pos = preview.buffer.view(body_index, 0)
+        y_pos = preview.buffer.view(body_index, 1)
+        z_pos = preview.buffer.view(body_index, 2)
+
+        dpg.set_value(f"td_ghost_{body_key}", [x_pos, y_pos])
+        dpg.set_value(f"side_ghost_{body_key}", [x_pos, z_pos])
+
+
+# Stop the preview and remove its ghost lines
+def clear_preview():
+    global preview
+    preview = None
+    clear_preview_series()
+
+
+def clear_preview_series():
+    global preview_ids
+    for body_key in preview_ids:
+        for item in (f"td_ghost_{body_key}", f"side_ghost_{body_key}", f"ghost_theme_{body_key}"):
+            if dpg.does_item_exist(item):
+                dpg.delete_item(item)
+
+    preview_ids = []
+
+
+def add_preview_series(body_key):
+    with dpg.theme(tag=f"ghost_theme_{body_key}"):
+        with dpg.theme_component(dpg.mvLineSeries):
+            dpg.add_theme_color(dpg.mvPlotCol_Line, list(bodies[body_key].color[:3]) + [preview_alpha],
+                                category=dpg.mvThemeCat_Plots)
+
+    dpg.add_line_series([], [], parent="td_y_axis", tag=f"td_ghost_{body_key}")
+    dpg.add_line_series([], [], parent="side_z_axis", tag=f"side_ghost_{body_key}")
+
+    dpg.bind_item_theme(f"td_ghost_{body_key}", f"ghost_theme_{body_key}")
+    dpg.bind_item_theme(f"side_ghost_{body_key}", f"ghost_theme_{body_key}")
+
+
+# Line themes and level of detail series of the bodies with the given ids, created when a run starts rather than with
+# the bodies, the chunk series are added by refresh_chunks as they fill
+def add_trajectory_themes(ids):
+    for body_key in ids:
+        with dpg.theme(tag=f"line_theme_{body_key}"):
+            with dpg.theme_component(dpg.mvLineSeries):
+                dpg.add_theme_color(dpg.mvPlotCol_Line, bodies[body_key].color, category=dpg.mvThemeCat_Plots)
+
+        add_lod_series(body_key)
+
+
+def add_lod_series(body_key):
+    dpg.add_line_series([], [], parent="td_y_axis", tag=f"td_lod_{body_key}")
+    dpg.add_line_series([], [], parent="side_z_axis", tag=f"side_lod_{body_key}")
+
+    dpg.bind_item_theme(f"td_lod_{body_key}", f"line_theme_{body_key}")
+    dpg.bind_item_theme(f"side_lod_{body_key}", f"line_theme_{body_key}")
+
+
+def add_trajectory_series(body_key, chunk):
+    dpg.add_line_series([], [], parent="td_y_axis", tag=f"td_line_{body_key}_{chunk}")
+    dpg.add_line_series([], [], parent="side_z_axis", tag=f"side_line_{body_key}_{chunk}")
+
+    dpg.bind_item_theme(f"td_line_{body_key}_{chunk}", f"line_theme_{body_key}")
+    dpg.bind_item_theme(f"side_line_{body_key}_{chunk}", f"line_theme_{body_key}")
+
+
+def toggle_pause_simulation():
+    if simulation_worker is None or not simulation_worker.is_running():
+        return
+
+    if simulation_worker.is_paused():
+        simulation_worker.resume()
+        dpg.configure_item("pause_button", label="Pause")
+    else:
+        simulation_worker.pause()
+        dpg.configure_item("pause_button", label="Resume")
+
+
+def cancel_simulation():
+    cancel_server_job()
+
+    if simulation_worker is not None:
+        simulation_worker.cancel()
+        dpg.configure_item("pause_button", label="Pause")
+
+
+def stop_simulation_worker():
+    wait_for_cache()
+    set_playback_trajectory(None)
+    cancel_server_job()
+
+    global lod_source
+    lod_source = None
+
+    global simulation_worker
+    if simulation_worker is not None:
+        simulation_worker.close()
+        simulation_worker = None
+
+    global plotted_step
+    plotted_step = -1
+
+
+# endregion
+
+
+# region GUI Setup and Logic
 
 # region Item Update Wrapper Methods
 
 def update_graph_position():
+    global lod_dirty
+    lod_dirty = True
+
     dpg.set_axis_limits("td_x_axis", graph_center_x - 10 ** graph_scale, graph_center_x + 10 ** graph_scale)
     dpg.set_axis_limits("td_y_axis", (graph_center_y - 10 ** graph_scale) * 0.559, (graph_center_y + 10 ** graph_scale) * 0.559)
 
@@ -268,6 +977,14 @@ def reset_create_body_input():
     dpg.set_value("create_mass_input", 0)
     dpg.set_value("create_name_input", f"Body {body_count}")
     dpg.set_value("create_color_input", body_color)
+    dpg.set_value("create_test_particle_input", False)
+
+
+# Draw the bodies without drag points at their current positions
+def update_body_markers():
+    ids = list(bodies)
+    positions = [body.position for body in bodies.values()]
+    move_body_markers(ids, positions, [body_indices[body_key] for body_key in drag_point_ids])
 
 
 def reset_selected_body():
@@ -276,28 +993,37 @@ def reset_selected_body():
 
 
 def reset_trajectories():
-    for body_key, body_value in bodies.items():
-        if dpg.does_item_exist(f"td_line_{body_key}"):
-            dpg.delete_item(f"td_line_{body_key}")
+    stop_simulation_worker()
+
+    # Only the bodies of the last run have trajectory series, including any deleted since
+    global plot_chunks, lod_length, trajectory_buffer, trajectory_ids
+    for body_key in trajectory_ids:
+        for chunk in range(plot_chunks):
+            if dpg.does_item_exist(f"td_line_{body_key}_{chunk}"):
+                dpg.delete_item(f"td_line_{body_key}_{chunk}")
 
-        if dpg.does_item_exist(f"side_line_{body_key}"):
-            dpg.delete_item(f"side_line_{body_key}")
+            if dpg.does_item_exist(f"side_line_{body_key}_{chunk}"):
+                dpg.delete_item(f"side_line_{body_key}_{chunk}")
+
+        for view in ("td", "side"):
+            if dpg.does_item_exist(f"{view}_lod_{body_key}"):
+                dpg.delete_item(f"{view}_lod_{body_key}")
 
         if dpg.does_item_exist(f"line_theme_{body_key}"):
             dpg.delete_item(f"line_theme_{body_key}")
 
-        dpg.set_value(f"td_drag_{body_key}", Vec2(body_value.position.x, body_value.position.y))
-        dpg.set_value(f"side_drag_{body_key}", Vec2(body_value.position.x, body_value.position.z))
+    for body_key in drag_point_ids:
+        body = bodies[body_key]
+        dpg.set_value(f"td_drag_{body_key}", Vec2(body.position.x, body.position.y))
+        dpg.set_value(f"side_drag_{body_key}", Vec2(body.position.x, body.position.z))
 
-        with dpg.theme(tag=f"line_theme_{body_key}"):
-            with dpg.theme_component(dpg.mvLineSeries):
-                dpg.add_theme_color(dpg.mvPlotCol_Line, body_value.color, category=dpg.mvThemeCat_Plots)
+    update_body_markers()
 
-        dpg.add_line_series([], [], parent="td_y_axis", tag=f"td_line_{body_key}")
-        dpg.add_line_series([], [], parent="side_z_axis", tag=f"side_line_{body_key}")
+    plot_chunks = 0
 
-        dpg.bind_item_theme(f"td_line_{body_key}", f"line_theme_{body_key}")
-        dpg.bind_item_theme(f"side_line_{body_key}", f"line_theme_{body_key}")
+    lod_length = 0
+    trajectory_buffer = None
+    trajectory_ids = []
 
     global reset
     reset = True
@@ -335,24 +1061,30 @@ def drag_body(raw_body_id):
 
     body_position = Vec3(body_x, body_y, body_z)
 
-    edited_body = Body(body.id, body.name, body_position, body.velocity, body.mass, body.color)
+    edited_body = body._replace(position=body_position)
     bodies[body_id] = edited_body
 
     global selected_body
     selected_body = edited_body
 
     update_selected_body_group()
+    start_preview()
 
 
 def select_body(item_tag):
     body_name = dpg.get_value(item_tag)
 
-    body_id = next(i for i in bodies if bodies[i].name == body_name)
+    body_id = body_ids_by_name[body_name]
 
     global selected_body
     selected_body = bodies[body_id]
     print(selected_body)
 
+    # A body drawn as a marker gets drag points once selected, so it can be dragged
+    if body_id not in drag_point_ids:
+        add_drag_points(selected_body)
+        update_body_markers()
+
     update_selected_body_group()
 
 
@@ -368,34 +1100,71 @@ def edit_body():
     body_position = Vec3(body_x, body_y, body_z)
     body_velocity = Vec3(body_vx, body_vy, body_vz)
 
-    body = Body(selected_body.id, selected_body.name, body_position, body_velocity, body_mass, selected_body.color)
+    body = selected_body._replace(position=body_position, velocity=body_velocity, mass=body_mass)
 
     bodies[selected_body.id] = body
 
     dpg.set_value(f"td_drag_{body.id}", Vec2(body.position.x, body.position.y))
     dpg.set_value(f"side_drag_{body.id}", Vec2(body.position.x, body.position.z))
 
+    start_preview()
 
-def create_body_manual(name, position, velocity, mass, color):
-    body_id = f"{name.lower().replace(' ', '_')}"
-    dpg.add_drag_point(tag=f"td_drag_{body_id}", label=name, parent="td_graph", default_value=Vec2(position.x, position.y), color=color, callback=drag_body)
-    dpg.add_drag_point(tag=f"side_drag_{body_id}", label=name, parent="side_graph", default_value=Vec2(position.x, position.z), color=color, callback=drag_body)
 
-    body = Body(body_id, name, position, velocity, mass, color)
+def add_drag_points(body):
+    dpg.add_drag_point(tag=f"td_drag_{body.id}", label=body.name, parent="td_graph", default_value=Vec2(body.position.x, body.position.y), color=body.color, callback=drag_body)
+    dpg.add_drag_point(tag=f"side_drag_{body.id}", label=body.name, parent="side_graph", default_value=Vec2(body.position.x, body.position.z), color=body.color, callback=drag_body)
+    drag_point_ids.add(body.id)
 
-    global body_names
-    body_names = list(np.append(body_names, name))
 
-    global bodies
-    bodies[body_id] = body
+# Add any number of bodies in one go, updating the lookup maps and the body markers once rather than per body. Bodies
+# without a color are given the default colors in turn, and bodies whose id or name is taken are renamed (see
+# unique_body). Returns the bodies as they were added
+def add_bodies(new_bodies):
+    global body_count, body_color
+    added = []
 
-    print("Added body:", body)
+    for body in new_bodies:
+        if body.color is None:
+            body = body._replace(color=body_color)
+
+        if body.id in bodies or body.name in body_ids_by_name:
+            body = unique_body(body)
+
+        body_ids_by_name[body.name] = body.id
+        body_indices[body.id] = len(bodies)
+        body_names.append(body.name)
+        bodies[body.id] = body
+
+        if len(drag_point_ids) < drag_point_limit:
+            add_drag_points(body)
+
+        body_count += 1
+        body_color = colors[(body_count - 1) % len(colors)]
+        added.append(body)
+
+    update_body_markers()
+    return added
+
+
+# Copy of a body named "<name> 2", "<name> 3", and so on, with the first name whose id and name are both free. Every
+# body needs an id of its own, as its index, drag points, and plot series are all found by it
+def unique_body(body):
+    for number in itertools.count(2):
+        name = f"{body.name} {number}"
+        body_id = body_id_from_name(name)
 
-    global body_count
-    body_count += 1
+        if body_id not in bodies and name not in body_ids_by_name:
+            return body._replace(id=body_id, name=name)
 
-    global body_color
-    body_color = colors[(body_count - 1) % len(colors)]
+
+def create_body_manual(name, position, velocity, mass, color, test_particle=False):
+    body_id = body_id_from_name(name)
+    body = add_bodies([Body(body_id, name, position, velocity, mass, color, test_particle)])[0]
+    if body.id not in drag_point_ids:
+        add_drag_points(body)
+        update_body_markers()
+
+    print("Added body:", body)
 
     global selected_body
     selected_body = body
@@ -414,223 +1183,471 @@ def create_body():
     body_vz = dpg.get_value("create_vz_input")
     body_mass = dpg.get_value("create_mass_input")
     color = dpg.get_value("create_color_input")
+    test_particle = dpg.get_value("create_test_particle_input")
 
     body_position = Vec3(body_x, body_y, body_z)
     body_velocity = Vec3(body_vx, body_vy, body_vz)
 
-    create_body_manual(body_name, body_position, body_velocity, body_mass, color)
+    create_body_manual(body_name, body_position, body_velocity, body_mass, color, test_particle)
 
 
 def delete_body():
+    clear_preview()
     bodies.pop(selected_body.id)
     body_names.remove(selected_body.name)
-    dpg.delete_item(f"td_drag_{selected_body.id}")
-    dpg.delete_item(f"side_drag_{selected_body.id}")
+    body_ids_by_name.pop(selected_body.name)
+
+    global body_indices
+    body_indices = {body_key: body_index for body_index, body_key in enumerate(bodies)}
+
+    if selected_body.id in drag_point_ids:
+        drag_point_ids.remove(selected_body.id)
+        dpg.delete_item(f"td_drag_{selected_body.id}")
+        dpg.delete_item(f"side_drag_{selected_body.id}")
+
+    update_body_markers()
     reset_selected_body()
     update_selected_body_group()
 
+
+# Replace every body with the bodies of the scenario file at the path in the Scenario tab, and take its step size and
+# sim time. The bodies are added in bulk and only the first drag_point_limit get drag points
+def load_scenario_file():
+    path = dpg.get_value("scenario_path")
+    load_start = time.perf_counter()
+
+    try:
+        scenario = load_scenario(path)
+    except (OSError, ValueError, KeyError) as error:
+        dpg.set_value("scenario_status", f"Could not load {path}: {error}")
+        return
+
+    reset_trajectories()
+    clear_preview()
+
+    for body_key in drag_point_ids:
+        dpg.delete_item(f"td_drag_{body_key}")
+        dpg.delete_item(f"side_drag_{body_key}")
+
+    drag_point_ids.clear()
+    bodies.clear()
+    body_ids_by_name.clear()
+    body_indices.clear()
+    body_names.clear()
+
+    add_bodies(scenario.bodies.values())
+
+    dpg.set_value("step_size", scenario.step_size)
+    dpg.set_value("sim_time", scenario.sim_time)
+
+    reset_selected_body()
+    update_selected_body_group()
+    reset_create_body_input()
+
+    dpg.set_value("scenario_status", f"Loaded {len(bodies)} bodies in {time.perf_counter() - load_start:.2f} s")
+
+
+# Write the current bodies, step size, and sim time to the scenario file at the path in the Scenario tab, as JSON,
+# CSV, or .npz by its extension
+def export_scenario_file():
+    path = dpg.get_value("scenario_path")
+
+    try:
+        save_scenario(path, bodies, dpg.get_value("step_size"), dpg.get_value("sim_time"))
+    except (OSError, ValueError) as error:
+        dpg.set_value("scenario_status", f"Could not export {path}: {error}")
+        return
+
+    dpg.set_value("scenario_status", f"Exported {len(bodies)} bodies to {path}")
+
 # endregion
 
 
 # region DearPyGui Item Initiation
 
-with dpg.window(label="Graph", width=681, height=681, no_resize=True, no_move=True, no_close=True, no_collapse=True):
-    with dpg.plot(label="Top-Down View", height=381, width=-1, tag="td_graph", anti_aliased=True):
-        dpg.add_plot_axis(dpg.mvXAxis, label="x (m)", tag="td_x_axis")
-        dpg.set_axis_limits(dpg.last_item(), graph_center_x - 10 ** default_graph_scale, graph_center_x + 10 ** default_graph_scale)
+def build_gui():
+    with dpg.window(label="Graph", width=681, height=681, no_resize=True, no_move=True, no_close=True, no_collapse=True):
+        with dpg.plot(label="Top-Down View", height=381, width=-1, tag="td_graph", anti_aliased=True):
+            dpg.add_plot_axis(dpg.mvXAxis, label="x (m)", tag="td_x_axis")
+            dpg.set_axis_limits(dpg.last_item(), graph_center_x - 10 ** default_graph_scale, graph_center_x + 10 ** default_graph_scale)
 
-        dpg.add_plot_axis(dpg.mvYAxis, label="y (m)", tag="td_y_axis")
-        dpg.set_axis_limits(dpg.last_item(), (graph_center_y - 10 ** default_graph_scale) * 0.559, (graph_center_y + 10 ** default_graph_scale) * 0.559)
+            dpg.add_plot_axis(dpg.mvYAxis, label="y (m)", tag="td_y_axis")
+            dpg.set_axis_limits(dpg.last_item(), (graph_center_y - 10 ** default_graph_scale) * 0.559, (graph_center_y + 10 ** default_graph_scale) * 0.559)
 
-    with dpg.plot(label="Side View", height=261, width=-1, tag="side_graph", anti_aliased=True):
-        dpg.add_plot_axis(dpg.mvXAxis, label="x (m)", tag="side_x_axis")
-        dpg.set_axis_limits(dpg.last_item(), graph_center_x - 10 ** default_graph_scale, graph_center_x + 10 ** default_graph_scale)
+            dpg.add_scatter_series([], [], parent="td_y_axis", tag="td_body_markers")
 
-        dpg.add_plot_axis(dpg.mvYAxis, label="z (m)", tag="side_z_axis")
-        dpg.set_axis_limits(dpg.last_item(), (graph_center_z - 10 ** default_graph_scale) * 0.383, (graph_center_z + 10 ** default_graph_scale) * 0.383)
+        with dpg.plot(label="Side View", height=261, width=-1, tag="side_graph", anti_aliased=True):
+            dpg.add_plot_axis(dpg.mvXAxis, label="x (m)", tag="side_x_axis")
+            dpg.set_axis_limits(dpg.last_item(), graph_center_x - 10 ** default_graph_scale, graph_center_x + 10 ** default_graph_scale)
 
-with dpg.window(label="Settings", width=583, height=681, pos=(681, 0), no_resize=True, no_move=True, no_close=True, no_collapse=True):
+            dpg.add_plot_axis(dpg.mvYAxis, label="z (m)", tag="side_z_axis")
+            dpg.set_axis_limits(dpg.last_item(), (graph_center_z - 10 ** default_graph_scale) * 0.383, (graph_center_z + 10 ** default_graph_scale) * 0.383)
 
-    # region Graph Position Child Window
+            dpg.add_scatter_series([], [], parent="side_z_axis", tag="side_body_markers")
 
-    with dpg.child_window(menubar=True, height=123):
-        with dpg.menu_bar():
-            dpg.add_text("Graph Controls")
+    with dpg.window(label="Settings", width=583, height=681, pos=(681, 0), no_resize=True, no_move=True, no_close=True, no_collapse=True):
 
-        # Graph Scale Settings
-        with dpg.group(horizontal=True):
-            dpg.add_text("Scale   ")
-            dpg.add_slider_float(width=435, min_value=0, max_value=14, default_value=default_graph_scale, callback=update_graph_scale, tag="scale_slider")
-            dpg.add_button(label="Reset", callback=lambda: reset_input_value("scale_slider", default_graph_scale, update_graph_scale))
+        # region Graph Position Child Window
 
-        with dpg.group(horizontal=True):
-            dpg.add_text("X Center")
-            dpg.add_input_float(width=435, default_value=0, callback=update_graph_center_x, tag="x_center_input")
-            dpg.add_button(label="Reset", callback=lambda: reset_input_value("x_center_input", 0, update_graph_center_x))
+        with dpg.child_window(menubar=True, height=123):
+            with dpg.menu_bar():
+                dpg.add_text("Graph Controls")
 
-        with dpg.group(horizontal=True):
-            dpg.add_text("Y Center")
-            dpg.add_input_float(width=435, default_value=0, callback=update_graph_center_y, tag="y_center_input")
-            dpg.add_button(label="Reset", callback=lambda: reset_input_value("y_center_input", 0, update_graph_center_y))
+            # Graph Scale Settings
+            with dpg.group(horizontal=True):
+                dpg.add_text("Scale   ")
+                dpg.add_slider_float(width=435, min_value=0, max_value=14, default_value=default_graph_scale, callback=update_graph_scale, tag="scale_slider")
+                dpg.add_button(label="Reset", callback=lambda: reset_input_value("scale_slider", default_graph_scale, update_graph_scale))
 
-        with dpg.group(horizontal=True):
-            dpg.add_text("Z Center")
-            dpg.add_input_float(width=435, default_value=0, callback=update_graph_center_z, tag="z_center_input")
-            dpg.add_button(label="Reset", callback=lambda: reset_input_value("z_center_input", 0, update_graph_center_z))
+            with dpg.group(horizontal=True):
+                dpg.add_text("X Center")
+                dpg.add_input_float(width=435, default_value=0, callback=update_graph_center_x, tag="x_center_input")
+                dpg.add_button(label="Reset", callback=lambda: reset_input_value("x_center_input", 0, update_graph_center_x))
 
-    # endregion
+            with dpg.group(horizontal=True):
+                dpg.add_text("Y Center")
+                dpg.add_input_float(width=435, default_value=0, callback=update_graph_center_y, tag="y_center_input")
+                dpg.add_button(label="Reset", callback=lambda: reset_input_value("y_center_input", 0, update_graph_center_y))
 
-    dpg.add_spacer()
+            with dpg.group(horizontal=True):
+                dpg.add_text("Z Center")
+                dpg.add_input_float(width=435, default_value=0, callback=update_graph_center_z, tag="z_center_input")
+                dpg.add_button(label="Reset", callback=lambda: reset_input_value("z_center_input", 0, update_graph_center_z))
 
-    # region Create Body Child Window
+        # endregion
 
-    with dpg.child_window(menubar=True, height=173):
-        with dpg.menu_bar():
-            dpg.add_text("Create Body")
+        dpg.add_spacer()
 
-        with dpg.group(horizontal=True, width=-1):
-            dpg.add_text("Name      ")
-            dpg.add_input_text(tag="create_name_input", default_value=f"Body {body_count}")
+        # region Body Child Window
 
-        with dpg.group(horizontal=True):
-            dpg.add_text("Position  ")
+        with dpg.child_window(height=183):
+            with dpg.tab_bar():
 
-            dpg.add_text("X")
-            dpg.add_input_float(tag="create_x_input", step=100, step_fast=1000, width=137)
+                # region Create Body Tab
 
-            dpg.add_text("Y")
-            dpg.add_input_float(tag="create_y_input", step=100, step_fast=1000, width=137)
+                with dpg.tab(label="Create Body"):
+                    with dpg.group(horizontal=True, width=-1):
+                        dpg.add_text("Name      ")
+                        dpg.add_input_text(tag="create_name_input", default_value=f"Body {body_count}")
 
-            dpg.add_text("z")
-            dpg.add_input_float(tag="create_z_input", step=100, step_fast=1000, width=137)
+                    with dpg.group(horizontal=True):
+                        dpg.add_text("Position  ")
 
-        with dpg.group(horizontal=True):
-            dpg.add_text("Velocity  ")
+                        dpg.add_text("X")
+                        dpg.add_input_float(tag="create_x_input", step=100, step_fast=1000, width=137)
 
-            dpg.add_text("X")
-            dpg.add_input_float(tag="create_vx_input", step=100, step_fast=1000, width=137)
+                        dpg.add_text("Y")
+                        dpg.add_input_float(tag="create_y_input", step=100, step_fast=1000, width=137)
 
-            dpg.add_text("Y")
-            dpg.add_input_float(tag="create_vy_input", step=100, step_fast=1000, width=137)
+                        dpg.add_text("z")
+                        dpg.add_input_float(tag="create_z_input", step=100, step_fast=1000, width=137)
 
-            dpg.add_text("z")
-            dpg.add_input_float(tag="create_vz_input", step=100, step_fast=1000, width=137)
+                    with dpg.group(horizontal=True):
+                        dpg.add_text("Velocity  ")
 
-        with dpg.group(horizontal=True, width=-1):
-            dpg.add_text("Mass      ")
-            dpg.add_input_float(tag="create_mass_input", step=100, step_fast=1000)
+                        dpg.add_text("X")
+                        dpg.add_input_float(tag="create_vx_input", step=100, step_fast=1000, width=137)
 
-        with dpg.group(horizontal=True, width=-1):
-            dpg.add_text("Color     ")
-            dpg.add_color_edit(tag="create_color_input", default_value=body_color)
+                        dpg.add_text("Y")
+                        dpg.add_input_float(tag="create_vy_input", step=100, step_fast=1000, width=137)
 
-        dpg.add_spacer()
+                        dpg.add_text("z")
+                        dpg.add_input_float(tag="create_vz_input", step=100, step_fast=1000, width=137)
+
+                    with dpg.group(horizontal=True, width=-1):
+                        dpg.add_text("Mass      ")
+                        dpg.add_input_float(tag="create_mass_input", step=100, step_fast=1000)
+
+                    # Test particles feel the other bodies' gravity but exert none, as do bodies with a mass of 0
+                    with dpg.group(horizontal=True, width=-1):
+                        dpg.add_text("Color     ")
+                        dpg.add_color_edit(tag="create_color_input", default_value=body_color, width=367)
+                        dpg.add_checkbox(label="Test Particle", tag="create_test_particle_input")
+
+                    dpg.add_spacer()
+
+                    with dpg.group(horizontal=True):
+                        dpg.add_button(label="Create Body", width=367, callback=create_body)
+                        dpg.add_button(label="Reset", width=175, callback=reset_create_body_input)
+
+                # endregion
 
-        with dpg.group(horizontal=True):
-            dpg.add_button(label="Create Body", width=367, callback=create_body)
-            dpg.add_button(label="Reset", width=175, callback=reset_create_body_input)
+                # region Edit Body Tab
 
-    # endregion
+                with dpg.tab(label="Edit Body"):
+                    with dpg.group(horizontal=True, tag="selected_body_group"):
+                        with dpg.drawlist(width=20, height=20, tag="selected_body_drawlist"):
+                            dpg.draw_circle((10, 9), 5, fill=selected_body.color, tag="selected_body_circle")
+                        dpg.add_combo(body_names, tag="selected_body_combo", callback=select_body)
 
-    dpg.add_spacer()
+                    with dpg.group(horizontal=True):
+                        dpg.add_text("Position  ")
 
-    # region Edit Body Child Window
+                        with dpg.group(horizontal=True, tag="selected_body_x_group"):
+                            dpg.add_text("X")
+                            dpg.add_input_float(tag="selected_body_x_input", step=100, step_fast=1000, width=137, default_value=selected_body.position.x, callback=edit_body)
 
-    with dpg.child_window(menubar=True, height=147):
-        with dpg.menu_bar():
-            dpg.add_text("Edit Body")
+                        with dpg.group(horizontal=True, tag="selected_body_y_group"):
+                            dpg.add_text("Y")
+                            dpg.add_input_float(tag="selected_body_y_input", step=100, step_fast=1000, width=137, default_value=selected_body.position.y, callback=edit_body)
 
-        with dpg.group(horizontal=True, tag="selected_body_group"):
-            with dpg.drawlist(width=20, height=20, tag="selected_body_drawlist"):
-                dpg.draw_circle((10, 9), 5, fill=selected_body.color, tag="selected_body_circle")
-            dpg.add_combo(body_names, tag="selected_body_combo", callback=select_body)
+                        with dpg.group(horizontal=True, tag="selected_body_z_group"):
+                            dpg.add_text("Z")
+                            dpg.add_input_float(tag="selected_body_z_input", step=100, step_fast=1000, width=137, default_value=selected_body.position.y, callback=edit_body)
 
-        with dpg.group(horizontal=True):
-            dpg.add_text("Position  ")
+                    with dpg.group(horizontal=True, tag="selected_body_velocity_group"):
+                        dpg.add_text("Velocity  ")
 
-            with dpg.group(horizontal=True, tag="selected_body_x_group"):
-                dpg.add_text("X")
-                dpg.add_input_float(tag="selected_body_x_input", step=100, step_fast=1000, width=137, default_value=selected_body.position.x, callback=edit_body)
+                        with dpg.group(horizontal=True, tag="selected_body_vx_group"):
+                            dpg.add_text("X")
+                            dpg.add_input_float(tag="selected_body_vx_input", step=100, step_fast=1000, width=137, default_value=selected_body.velocity.x, callback=edit_body)
 
-            with dpg.group(horizontal=True, tag="selected_body_y_group"):
-                dpg.add_text("Y")
-                dpg.add_input_float(tag="selected_body_y_input", step=100, step_fast=1000, width=137, default_value=selected_body.position.y, callback=edit_body)
+                        with dpg.group(horizontal=True, tag="selected_body_vy_group"):
+                            dpg.add_text("Y")
+                            dpg.add_input_float(tag="selected_body_vy_input", step=100, step_fast=1000, width=137, default_value=selected_body.velocity.y, callback=edit_body)
 
-            with dpg.group(horizontal=True, tag="selected_body_z_group"):
-                dpg.add_text("Z")
-                dpg.add_input_float(tag="selected_body_z_input", step=100, step_fast=1000, width=137, default_value=selected_body.position.y, callback=edit_body)
+                        with dpg.group(horizontal=True, tag="selected_body_vz_group"):
+                            dpg.add_text("Z")
+                            dpg.add_input_float(tag="selected_body_vz_input", step=100, step_fast=1000, width=137, default_value=selected_body.velocity.y, callback=edit_body)
 
-        with dpg.group(horizontal=True, tag="selected_body_velocity_group"):
-            dpg.add_text("Velocity  ")
+                    with dpg.group(horizontal=True, width=-1, tag="selected_body_mass_group"):
+                        dpg.add_text("Mass      ")
+                        dpg.add_input_float(tag="selected_body_mass_input", step=100, step_fast=1000, default_value=selected_body.mass, callback=edit_body)
 
-            with dpg.group(horizontal=True, tag="selected_body_vx_group"):
-                dpg.add_text("X")
-                dpg.add_input_float(tag="selected_body_vx_input", step=100, step_fast=1000, width=137, default_value=selected_body.velocity.x, callback=edit_body)
+                    with dpg.group(horizontal=True, width=-1):
+                        dpg.add_button(label="Delete Body", callback=delete_body)
 
-            with dpg.group(horizontal=True, tag="selected_body_vy_group"):
-                dpg.add_text("Y")
-                dpg.add_input_float(tag="selected_body_vy_input", step=100, step_fast=1000, width=137, default_value=selected_body.velocity.y, callback=edit_body)
+                # endregion
 
-            with dpg.group(horizontal=True, tag="selected_body_vz_group"):
-                dpg.add_text("Z")
-                dpg.add_input_float(tag="selected_body_vz_input", step=100, step_fast=1000, width=137, default_value=selected_body.velocity.y, callback=edit_body)
+                # region Scenario Tab
 
-        with dpg.group(horizontal=True, width=-1, tag="selected_body_mass_group"):
-            dpg.add_text("Mass      ")
-            dpg.add_input_float(tag="selected_body_mass_input", step=100, step_fast=1000, default_value=selected_body.mass, callback=edit_body)
+                # Load or export every body as a JSON, CSV, or .npz scenario file
+                with dpg.tab(label="Scenario"):
+                    with dpg.group(horizontal=True, width=-1):
+                        dpg.add_text("File      ")
+                        dpg.add_input_text(tag="scenario_path", default_value="scenarios/sun_earth_moon.json")
 
-        with dpg.group(horizontal=True, width=-1):
-            dpg.add_button(label="Delete Body", callback=delete_body)
+                    dpg.add_spacer()
 
-    # endregion
+                    with dpg.group(horizontal=True):
+                        dpg.add_button(label="Load", width=271, callback=load_scenario_file)
+                        dpg.add_button(label="Export", width=-1, callback=export_scenario_file)
 
-    dpg.add_spacer(height=41)
+                    dpg.add_text("", tag="scenario_status", wrap=540)
 
-    with dpg.group():
-        dpg.add_text("Simulation Progress")
-        dpg.add_progress_bar(tag="sim_progress", width=-1)
+                # endregion
 
-    # region Simulation Control
+                # region Diagnostics Tab
 
-    with dpg.group(horizontal=True):
-        with dpg.group(width=183):
-            dpg.add_text("Step Size (s)")
-            dpg.add_input_int(tag="step_size", default_value=500)
+                # Throughput, time shares, and conservation drift of the running simulation, as relative drifts from
+                # the start of the run
+                with dpg.tab(label="Diagnostics"):
+                    with dpg.table(header_row=False):
+                        for _ in range(4):
+                            dpg.add_table_column()
 
-        with dpg.group(width=184):
-            dpg.add_text("Sim Time (h)")
-            dpg.add_input_int(tag="sim_time", default_value=64000)
+                        with dpg.table_row():
+                            dpg.add_text("Steps / s")
+                            dpg.add_text("-", tag="diag_steps_rate")
+                            dpg.add_text("Force Evals / s")
+                            dpg.add_text("-", tag="diag_force_rate")
 
-        with dpg.group(width=183):
-            dpg.add_text("Update Freq (h)")
-            dpg.add_input_int(tag="update_freq", default_value=1000)
+                        with dpg.table_row():
+                            dpg.add_text("Force Time")
+                            dpg.add_text("-", tag="diag_force_share")
+                            dpg.add_text("Store Time")
+                            dpg.add_text("-", tag="diag_store_share")
 
-    dpg.add_spacer()
+                        with dpg.table_row():
+                            dpg.add_text("Plot Update")
+                            dpg.add_text("-", tag="diag_plot_time")
+                            dpg.add_text("Peak Memory")
+                            dpg.add_text("-", tag="diag_peak_memory")
 
-    with dpg.group(horizontal=True, width=-1):
-        dpg.add_button(label="Reset Trajectories", callback=reset_trajectories)
+                        with dpg.table_row():
+                            dpg.add_text("Energy Drift")
+                            dpg.add_text("-", tag="diag_energy_drift")
+                            dpg.add_text("Max Energy Drift")
+                            dpg.add_text("-", tag="diag_max_energy_drift")
 
-    with dpg.group(horizontal=True, width=-1):
-        dpg.add_button(label="Calculate Trajectories", callback=calculate_trajectories)
+                        with dpg.table_row():
+                            dpg.add_text("Momentum Drift")
+                            dpg.add_text("-", tag="diag_momentum_drift")
+                            dpg.add_text("Ang. Mom. Drift")
+                            dpg.add_text("-", tag="diag_angular_drift")
 
-    # endregion
+                    with dpg.group(horizontal=True):
+                        dpg.add_button(label="Export Stats", width=175, callback=export_stats)
+                        dpg.add_text("", tag="stats_export_path")
+
+                # endregion
+
+        # endregion
+
+        dpg.add_spacer()
+
+        # region Simulation Control Child Window
+
+        with dpg.child_window(menubar=True, height=-1):
+            with dpg.menu_bar():
+                dpg.add_text("Simulation Control")
+
+            with dpg.group(horizontal=True):
+                with dpg.group(width=131):
+                    dpg.add_text("Step Size (s)")
+                    dpg.add_input_int(tag="step_size", default_value=500, step=0)
+
+                with dpg.group(width=131):
+                    dpg.add_text("Sim Time (h)")
+                    dpg.add_input_int(tag="sim_time", default_value=64000, step=0)
+
+                with dpg.group(width=131):
+                    dpg.add_text("Update Freq (h)")
+                    dpg.add_input_int(tag="update_freq", default_value=1000, step=0)
+
+                # Only every save_stride-th step of the run is kept in the trajectory store on disk
+                with dpg.group(width=131):
+                    dpg.add_text("Save Stride (h)")
+                    dpg.add_input_int(tag="save_stride", default_value=1, min_value=1, min_clamped=True, step=0)
+
+            with dpg.group(horizontal=True):
+                with dpg.group(width=131):
+                    dpg.add_text("Force Solver")
+                    dpg.add_combo(list(force_solver_labels), tag="force_solver", default_value="Direct Sum")
+
+                with dpg.group(width=131):
+                    dpg.add_text("Opening Angle")
+                    dpg.add_input_float(tag="solver_theta", default_value=0.5, step=0, format="%.2f")
+
+                with dpg.group(width=131):
+                    dpg.add_text("Integrator")
+                    dpg.add_combo(list(integrator_labels), tag="integrator", default_value="Verlet")
+
+                # Relative error allowed per substep by the adaptive integrator
+                with dpg.group(width=131):
+                    dpg.add_text("Tolerance")
+                    dpg.add_input_double(tag="integrator_tolerance", default_value=1e-9, step=0, format="%.1e")
+
+            with dpg.group(horizontal=True):
+                # Worker processes of the parallel solver
+                with dpg.group(width=131):
+                    dpg.add_text("Workers")
+                    dpg.add_input_int(tag="solver_workers", default_value=os.cpu_count() or 1, min_value=1,
+                                      min_clamped=True, step=0)
+
+                # Compute backend of the direct sum
+                with dpg.group(width=131):
+                    dpg.add_text("Backend")
+                    dpg.add_combo(list(backend_labels), tag="compute_backend", default_value="Auto")
+
+                # Plummer softening length of the force, 0 for none
+                with dpg.group(width=131):
+                    dpg.add_text("Softening (m)")
+                    dpg.add_input_double(tag="solver_softening", default_value=0.0, min_value=0.0, min_clamped=True,
+                                         step=0, format="%.3g")
+
+                # Bodies closer than this are merged by the close encounter integrator, 0 for never
+                with dpg.group(width=131):
+                    dpg.add_text("Merge Radius (m)")
+                    dpg.add_input_double(tag="merge_radius", default_value=0.0, min_value=0.0, min_clamped=True, step=0,
+                                         format="%.3g")
+
+            with dpg.group(horizontal=True):
+                # A run with no end goes on until it is cancelled, drawing only the last Trail steps
+                with dpg.group(width=131):
+                    dpg.add_text("Run Forever")
+                    dpg.add_checkbox(tag="run_forever", default_value=False)
+
+                with dpg.group(width=131):
+                    dpg.add_text("Trail (h)")
+                    dpg.add_input_int(tag="trail_length", default_value=64000, min_value=1, min_clamped=True, step=0)
+
+                # Whether a run with no end keeps its steps in the trajectory store, which then grows without limit
+                with dpg.group(width=131):
+                    dpg.add_text("Spill to Disk")
+                    dpg.add_checkbox(tag="spill_to_disk", default_value=False)
+
+                # Preview the orbits as faint lines while bodies are dragged or edited
+                with dpg.group(width=131):
+                    dpg.add_text("Live Preview")
+                    dpg.add_checkbox(tag="live_preview", default_value=True, callback=clear_preview)
+
+            # Calculate Trajectories submits the run to a job server at this address instead of running it here
+            with dpg.group(horizontal=True):
+                dpg.add_checkbox(label="Use Job Server", tag="use_server", default_value=False)
+                dpg.add_input_text(tag="server_url", width=200, default_value="http://127.0.0.1:8765")
+                dpg.add_text("", tag="server_status")
+
+            dpg.add_spacer()
+
+            with dpg.group():
+                dpg.add_text("Simulation Progress")
+                dpg.add_progress_bar(tag="sim_progress", width=-1)
+
+            # Playback of the last run once it has stopped, the slider picking the day shown
+            with dpg.group(horizontal=True):
+                dpg.add_button(label="Play", width=60, tag="play_button", callback=toggle_playback)
+                dpg.add_slider_float(tag="playback_slider", width=250, min_value=0, max_value=0, format="Day %.2f",
+                                     callback=scrub_playback)
+                dpg.add_text("Speed (h/s)")
+                dpg.add_input_int(tag="playback_speed", width=-1, default_value=1000, min_value=1, min_clamped=True,
+                                  step=0)
+
+            dpg.add_spacer()
+
+            with dpg.group(horizontal=True, width=-1):
+                dpg.add_button(label="Reset Trajectories", callback=reset_trajectories)
+
+            with dpg.group(horizontal=True):
+                dpg.add_button(label="Calculate Trajectories", width=271, callback=calculate_trajectories)
+                dpg.add_button(label="Continue", width=92, callback=continue_trajectories)
+                dpg.add_button(label="Pause", width=83, tag="pause_button", callback=toggle_pause_simulation)
+                dpg.add_button(label="Cancel", width=-1, callback=cancel_simulation)
+
+        # endregion
 
 # endregion
 
-create_body_manual("Sun", Vec3(0, 0, 0), Vec3(0, 0, 0), 1988500E24, [249, 215, 28, 255])
-# create_body_manual("Mercury", Vec3(57.9E9, 0, 0), Vec3(0, 47900, 0), 0.330E24, [255, 0, 0, 255])
-# create_body_manual("Venus", Vec3(108.2E9, 0, 0), Vec3(0, 35000, 0), 4.87E24, [230, 230, 230, 255])
-create_body_manual("Earth", Vec3(152.1E9, 0, 0), Vec3(0, 29290, 0), 5.9722E24, [47, 106, 105, 255])
-create_body_manual("Moon", Vec3(152.1E9 - 0.4055E9, 0, 0), Vec3(0, 29290 + 970, 0), 0.07346E24, [254, 252, 215, 255])
-# create_body_manual("Mars", Vec3(228.0E9, 0, 0), Vec3(0, 24000, 0), 0.642E24, [153, 61, 0, 255])
-# create_body_manual("Jupiter", Vec3(778.5E9, 0, 0), Vec3(0, 13100, 0), 1898E24, [176, 127, 53, 255])
-# create_body_manual("Saturn", Vec3(1432.0E9, 0, 0), Vec3(0, 9690, 0), 568E24, [176, 143, 54, 255])
-# create_body_manual("Uranus", Vec3(2867.0E9, 0, 0), Vec3(0, 6810, 0), 86.8E24, [85, 128, 170, 255])
-# create_body_manual("Neptune", Vec3(4515.0E9, 0, 0), Vec3(0, 5430, 0), 102E24, [54, 104, 150, 255])
-# create_body_manual("Pluto", Vec3(7304.326E9, 0, 7304.326E9 * np.sin(2.995)), Vec3(0, 4670, 0), 0.01303E24, [54, 104, 150, 255])
-
-dpg.show_viewport()
-dpg.start_dearpygui()
-dpg.destroy_context()
+
+# Start the GUI. max_frames stops it after that many frames, which is only meant for timing its startup
+def main(max_frames=None):
+    # Mac Scale? width=1265, height=680
+    dpg.create_context()
+    dpg.create_viewport(title='Gravity Tool', width=1280, height=720, resizable=False)
+    dpg.setup_dearpygui()
+
+    build_gui()
+
+    create_body_manual("Sun", Vec3(0, 0, 0), Vec3(0, 0, 0), 1988500E24, [249, 215, 28, 255])
+    # create_body_manual("Mercury", Vec3(57.9E9, 0, 0), Vec3(0, 47900, 0), 0.330E24, [255, 0, 0, 255])
+    # create_body_manual("Venus", Vec3(108.2E9, 0, 0), Vec3(0, 35000, 0), 4.87E24, [230, 230, 230, 255])
+    create_body_manual("Earth", Vec3(152.1E9, 0, 0), Vec3(0, 29290, 0), 5.9722E24, [47, 106, 105, 255])
+    create_body_manual("Moon", Vec3(152.1E9 - 0.4055E9, 0, 0), Vec3(0, 29290 + 970, 0), 0.07346E24, [254, 252, 215, 255])
+    # create_body_manual("Mars", Vec3(228.0E9, 0, 0), Vec3(0, 24000, 0), 0.642E24, [153, 61, 0, 255])
+    # create_body_manual("Jupiter", Vec3(778.5E9, 0, 0), Vec3(0, 13100, 0), 1898E24, [176, 127, 53, 255])
+    # create_body_manual("Saturn", Vec3(1432.0E9, 0, 0), Vec3(0, 9690, 0), 568E24, [176, 143, 54, 255])
+    # create_body_manual("Uranus", Vec3(2867.0E9, 0, 0), Vec3(0, 6810, 0), 86.8E24, [85, 128, 170, 255])
+    # create_body_manual("Neptune", Vec3(4515.0E9, 0, 0), Vec3(0, 5430, 0), 102E24, [54, 104, 150, 255])
+    # create_body_manual("Pluto", Vec3(7304.326E9, 0, 7304.326E9 * np.sin(2.995)), Vec3(0, 4670, 0), 0.01303E24, [54, 104, 150, 255])
+
+    dpg.show_viewport()
+
+    # Render manually so the background simulation can be polled once per frame
+    frames = 0
+    while dpg.is_dearpygui_running() and (max_frames is None or frames < max_frames):
+        poll_simulation()
+        poll_server_job()
+        advance_playback()
+        advance_preview()
+        refresh_lod_if_due()
+        dpg.render_dearpygui_frame()
+        frames += 1
+
+    stop_simulation_worker()
+    dpg.destroy_context()
+
+
+if __name__ == "__main__":
+    main()
 
 # endregion
@@ -0,0 +1,294 @@
+import numpy as np
+from collections import namedtuple
+from gravity_sim import G, bodies_to_arrays, load_scenario, n_body_accel_targets
+
+# region Global Definitions and Variables
+
+# Linear octree stored as flat arrays over all nodes. Bodies are sorted by their Morton key (order maps sorted back to
+# original indices), so every node covers the contiguous range [start, end) of the sorted bodies. The children of a
+# node are the child_count nodes starting at child_first
+Octree = namedtuple('Octree', ['order', 'positions', 'masses', 'start', 'end', 'size', 'mass', 'com',
+                               'child_first', 'child_count', 'is_leaf'])
+
+# Default opening angle, nodes are approximated by their centre of mass when size / distance < theta
+default_theta = 0.5
+
+# Nodes holding at most this many bodies are not split further, their bodies are summed directly
+default_leaf_size = 4
+
+# Bits of each coordinate used in the Morton keys, which also bounds the depth of the tree
+morton_bits = 21
+
+# Targets are walked through the tree in groups of this size, bounding the memory used by the interaction lists
+walk_chunk_size = 4096
+
+# endregion
+
+
+# region Tree Construction
+
+# Spread the lowest 21 bits of each value so there are two zero bits between each of them
+def spread_bits(values):
+    values = values.astype(np.uint64) & np.uint64(0x1fffff)
+    values = (values | (values << np.uint64(32))) & np.uint64(0x1f00000000ffff)
+    values = (values | (values << np.uint64(16))) & np.uint64(0x1f0000ff0000ff)
+    values = (values | (values << np.uint64(8))) & np.uint64(0x100f00f00f00f00f)
+    values = (values | (values << np.uint64(4))) & np.uint64(0x10c30c30c30c30c3)
+    values = (values | (values << np.uint64(2))) & np.uint64(0x1249249249249249)
+    return values
+
+
+# Morton (z-order) key of each position inside the cube with corner origin and side length size
+def morton_keys(positions, origin, size):
+    cells = np.floor((positions - origin) / size * (1 << morton_bits))
+    cells = np.clip(cells, 0, (1 << morton_bits) - 1).astype(np.uint64)
+
+    return (spread_bits(cells[:, 0]) << np.uint64(2)) | (spread_bits(cells[:, 1]) << np.uint64(1)) | spread_bits(cells[:, 2])
+
+
+# Sum values over the disjoint, ordered [start, end) ranges with a single reduceat call, or reduce them with another
+# ufunc such as np.minimum
+def range_sums(values, start, end, ufunc=np.add):
+    padded = np.concatenate([values, np.zeros((1,) + values.shape[1:])])
+    return ufunc.reduceat(padded, np.ravel(np.column_stack([start, end])), axis=0)[::2]
+
+
+# Build the octree of the given bodies level by level. Only nodes holding more than leaf_size bodies are split
+def build_octree(positions, masses, leaf_size=default_leaf_size):
+    n = len(masses)
+    origin = positions.min(axis=0)
+    root_size = max(np.ptp(positions, axis=0).max(), 1.0) * (1 + 1e-9)
+
+    keys = morton_keys(positions, origin, root_size)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    positions = positions[order]
+    masses = masses[order]
+
+    # Each level's nodes, starting with the root
+    level_start = [np.array([0])]
+    level_end = [np.array([n])]
+    level_parent = [np.array([-1])]
+    splitting = np.array([n > leaf_size])
+
+    node_count = 1
+    level_offset = 0
+
+    for level in range(1, morton_bits + 1):
+        if not splitting.any():
+            break
+
+        # Bodies that belong to a node being split, they are regrouped by their key prefix at this level
+        parents = np.flatnonzero(splitting)
+        counts = level_end[-1][parents] - level_start[-1][parents]
+        body_parent = np.repeat(parents, counts)
+        bodies = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(level_start[-1][parents], counts)
+
+        prefixes = keys[bodies] >> np.uint64(3 * (morton_bits - level))
+        new_node = np.ones(len(bodies), dtype=bool)
+        new_node[1:] = (prefixes[1:] != prefixes[:-1]) | (body_parent[1:] != body_parent[:-1])
+
+        first = np.flatnonzero(new_node)
+        start = bodies[first]
+        end = np.append(bodies[first[1:] - 1] + 1, bodies[-1] + 1)
+
+        level_start.append(start)
+        level_end.append(end)
+        level_parent.append(body_parent[first] + level_offset)
+
+        level_offset += len(level_start[-2])
+        node_count += len(start)
+        splitting = (end - start > leaf_size) & (level < morton_bits)
+
+    start = np.concatenate(level_start)
+    end = np.concatenate(level_end)
+    parent = np.concatenate(level_parent)
+    size = np.concatenate([np.full(len(level), root_size / 2 ** depth) for depth, level in enumerate(level_start)])
+
+    # Children of a node are consecutive because nodes are created in key order
+    child_first = np.zeros(node_count, dtype=int)
+    child_count = np.zeros(node_count, dtype=int)
+    parents, first_child, counts = np.unique(parent[1:], return_index=True, return_counts=True)
+    child_first[parents] = first_child + 1
+    child_count[parents] = counts
+
+    # Mass and centre of mass of every node, summed level by level over its range of bodies
+    mass = np.zeros(node_count)
+    moment = np.zeros((node_count, 3))
+    offset = 0
+
+    for level_starts, level_ends in zip(level_start, level_end):
+        nodes = slice(offset, offset + len(level_starts))
+        mass[nodes] = range_sums(masses, level_starts, level_ends)
+        moment[nodes] = range_sums(positions * masses[:, np.newaxis], level_starts, level_ends)
+        offset += len(level_starts)
+
+    # Massless nodes have no centre of mass, their geometric position doesn't matter as they add no acceleration
+    com = moment / np.where(mass > 0, mass, 1)[:, np.newaxis]
+
+    return Octree(order, positions, masses, start, end, size, mass, com, child_first, child_count, child_count == 0)
+
+# endregion
+
+
+# region Tree Walk
+
+# Indices into groups of the given sizes: which group each element belongs to and its offset inside the group
+def expand_groups(counts):
+    group = np.repeat(np.arange(len(counts)), counts)
+    offset = np.arange(len(group)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return group, offset
+
+
+# Accumulate the acceleration on each target body from the given sources (bodies or node centres of mass), softened
+# by adding softening_sq to every squared separation
+def accumulate_accel(accelerations, targets, source_positions, source_masses, positions, softening_sq=0.0):
+    delta = source_positions - positions[targets]
+    distance_sq = np.einsum('ij,ij->i', delta, delta)
+
+    # Pairs with no separation (a body with itself) are skipped rather than dividing by zero
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scaler = np.where(distance_sq > 0, G * source_masses * (distance_sq + softening_sq) ** -1.5, 0)
+
+    for axis in range(3):
+        accelerations[:, axis] += np.bincount(targets, delta[:, axis] * scaler, len(accelerations))
+
+
+# Walk the tree for a group of leaves at once, adding the acceleration of their bodies into accelerations (which is
+# in sorted order). Each leaf walks the tree once on behalf of all its bodies: a node is accepted for the whole leaf
+# when it is far enough from the box bounding the leaf's bodies, and the (leaf, node) interaction list is then
+# expanded to every body in the leaf
+def walk_octree(tree, leaves, theta, accelerations, softening_sq=0.0):
+    leaf_start = tree.start[leaves]
+    leaf_end = tree.end[leaves]
+
+    # The leaves are ordered ranges of the sorted bodies, so their bounding boxes are a single reduceat each
+    leaf_low = range_sums(tree.positions, leaf_start, leaf_end, np.minimum)
+    leaf_high = range_sums(tree.positions, leaf_start, leaf_end, np.maximum)
+
+    leaf_center = (leaf_low + leaf_high) / 2
+    leaf_half = (leaf_high - leaf_low) / 2
+
+    pair_leaf = np.arange(len(leaves))
+    pair_node = np.zeros(len(leaves), dtype=int)
+
+    while len(pair_leaf):
+        # Distance from each node's centre of mass to the nearest point of the leaf's bounding box
+        gap = np.maximum(np.abs(tree.com[pair_node] - leaf_center[pair_leaf]) - leaf_half[pair_leaf], 0)
+        distance_sq = np.einsum('ij,ij->i', gap, gap)
+
+        # A node containing the leaf is always opened, so bodies are never approximated together with themselves
+        contains = (tree.start[pair_node] <= leaf_start[pair_leaf]) & (leaf_end[pair_leaf] <= tree.end[pair_node])
+        is_leaf = tree.is_leaf[pair_node]
+        accept = ~is_leaf & ~contains & (tree.size[pair_node] ** 2 < theta ** 2 * distance_sq)
+
+        if accept.any():
+            accepted_leaf = pair_leaf[accept]
+            accepted_node = pair_node[accept]
+            group, offset = expand_groups(leaf_end[accepted_leaf] - leaf_start[accepted_leaf])
+            sources = accepted_node[group]
+            accumulate_accel(accelerations, leaf_start[accepted_leaf][group] + offset,
+                             tree.com[sources], tree.mass[sources], tree.positions, softening_sq)
+
+        # Leaves are summed directly, every body of the walking leaf with every body of the source leaf
+        if is_leaf.any():
+            source_leaf = pair_node[is_leaf]
+            target_leaf = pair_leaf[is_leaf]
+            source_count = tree.end[source_leaf] - tree.start[source_leaf]
+            group, offset = expand_groups((leaf_end[target_leaf] - leaf_start[target_leaf]) * source_count)
+            targets = leaf_start[target_leaf][group] + offset // source_count[group]
+            sources = tree.start[source_leaf][group] + offset % source_count[group]
+            accumulate_accel(accelerations, targets, tree.positions[sources], tree.masses[sources], tree.positions,
+                             softening_sq)
+
+        # Everything else is replaced by its children
+        opened = ~accept & ~is_leaf
+        open_node = pair_node[opened]
+        group, offset = expand_groups(tree.child_count[open_node])
+        pair_leaf = pair_leaf[opened][group]
+        pair_node = tree.child_first[open_node][group] + offset
+
+
+# Calculate the acceleration of every body, or only of the target bodies, with a Barnes-Hut octree rebuilt from the
+# current positions, with the force softened over a length of softening (see gravity_sim.n_body_accel_array)
+def barnes_hut_accel(positions, masses, targets=None, theta=default_theta, leaf_size=default_leaf_size,
+                     softening=0.0):
+    tree = build_octree(np.asarray(positions, dtype=float), np.asarray(masses, dtype=float), leaf_size)
+    accelerations = np.zeros((len(masses), 3))
+
+    # Leaves, in the order of the bodies they hold, are walked in groups of about walk_chunk_size bodies
+    leaves = np.flatnonzero(tree.is_leaf)
+    leaves = leaves[np.argsort(tree.start[leaves])]
+
+    # With targets given only the leaves holding them are walked
+    if targets is not None:
+        sorted_index = np.empty(len(masses), dtype=int)
+        sorted_index[tree.order] = np.arange(len(masses))
+        targets = sorted_index[targets]
+
+        leaves = np.unique(leaves[np.searchsorted(tree.start[leaves], targets, side="right") - 1])
+
+    chunk = np.cumsum(tree.end[leaves] - tree.start[leaves]) // walk_chunk_size
+
+    for leaf_group in np.split(leaves, np.flatnonzero(np.diff(chunk)) + 1):
+        walk_octree(tree, leaf_group, theta, accelerations, softening * softening)
+
+    if targets is not None:
+        return accelerations[targets]
+
+    unsorted = np.empty_like(accelerations)
+    unsorted[tree.order] = accelerations
+
+    return unsorted
+
+# endregion
+
+
+# region Error Reporting
+
+# Compare the Barnes-Hut acceleration with the direct sum on a random sample of bodies, returning statistics of the
+# relative error |a_tree - a_direct| / |a_direct| of the sampled bodies
+def barnes_hut_error(positions, masses, theta=default_theta, sample=1000, seed=0):
+    positions = np.asarray(positions, dtype=float)
+    masses = np.asarray(masses, dtype=float)
+
+    targets = np.arange(len(masses))
+    if len(targets) > sample:
+        targets = np.sort(np.random.default_rng(seed).choice(len(masses), sample, replace=False))
+
+    approximate = barnes_hut_accel(positions, masses, targets, theta)
+    exact = n_body_accel_targets(positions, masses, targets)
+
+    error = np.linalg.norm(approximate - exact, axis=1) / np.maximum(np.linalg.norm(exact, axis=1), np.finfo(float).tiny)
+
+    return {"theta": theta,
+            "bodies": len(masses),
+            "sampled": len(targets),
+            "median": float(np.median(error)),
+            "p99": float(np.percentile(error, 99)),
+            "max": float(error.max()),
+            "rms": float(np.sqrt(np.mean(error ** 2)))}
+
+
+# Print the acceleration error of a scenario's initial conditions for a range of opening angles
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report the Barnes-Hut acceleration error of a scenario against the direct sum.")
+    parser.add_argument("scenario", help="scenario JSON file")
+    parser.add_argument("--theta", type=float, nargs="+", default=[0.2, 0.3, 0.5, 0.7, 1.0], help="opening angles to test")
+    parser.add_argument("--sample", type=int, default=1000, help="number of bodies compared against the direct sum")
+    args = parser.parse_args(argv)
+
+    _, _, positions, _, masses = bodies_to_arrays(load_scenario(args.scenario).bodies)
+
+    print(f"{'theta':>6} {'median':>10} {'p99':>10} {'max':>10} {'rms':>10}")
+    for theta in args.theta:
+        error = barnes_hut_error(positions, masses, theta, args.sample)
+        print(f"{theta:>6.2f} {error['median']:>10.2e} {error['p99']:>10.2e} {error['max']:>10.2e} {error['rms']:>10.2e}")
+
+
+if __name__ == "__main__":
+    main()
+
+# endregion
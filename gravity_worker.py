@@ -0,0 +1,288 @@
+import multiprocessing as mp
+import numpy as np
+import os
+import queue
+import shutil
+import tempfile
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from gravity_sim import Checkpoint, bodies_to_arrays, checkpoint_accel_func, default_stream_window, get_integrator, \
+    gravitating_masses, integrate, load_checkpoint, replace_settings, save_checkpoint, test_particle_mask
+from gravity_stats import RunStats
+from gravity_store import TrajectoryStore
+
+# region Global Definitions and Variables
+
+# How many steps the worker integrates between publishing its progress and checking for pause and cancel requests
+worker_check_freq = 64
+
+# How many steps apart the worker writes a checkpoint into its store, it also writes one when it stops
+worker_checkpoint_freq = 10000
+
+# Name of the checkpoint file inside a worker's store directory
+checkpoint_name = "checkpoint.npz"
+
+# Most statistics snapshots a worker handle keeps, the oldest are dropped past it so a run with no end doesn't grow
+stats_history_limit = 10000
+
+# Worker processes are spawned rather than forked so they never inherit the GUI's rendering context
+worker_context = mp.get_context("spawn")
+
+# endregion
+
+
+# region Worker Process
+
+# Integrate the system in a worker process from the state of start up to step end_step - 1, or until it is cancelled if
+# end_step is None. Every save_stride-th step is streamed to the trajectory store on disk, unless spill is cleared, and
+# every plot_stride-th position is written into the shared buffer, whose last row holds the latest position. The other
+# rows are used as a ring, which a run with an end never wraps around. A continued run skips its start step, which the
+# store already holds, and its buffer rows start at the first plot step after it. steps_done is only increased after a
+# step's positions are written, so the GUI can read any row below it at any time. A checkpoint is kept in the store as
+# the run goes on, and snapshots of the run's statistics are put on stats_queue every time its conserved quantities are
+# sampled
+def run_worker(buffer_name, shape, start, end_step, continued, plot_stride, spill, store_path, steps_done,
+               cancel_event, resume_event, stats_queue):
+    shared = shared_memory.SharedMemory(name=buffer_name)
+    buffer = np.ndarray(shape, dtype=float, buffer=shared.buf)
+    store = TrajectoryStore.open(store_path, writable=True)
+    state = dict(start.integrator_state)
+    # Test particles are integrated with a mass of 0, so integrators that weigh bodies by their mass leave them out
+    gravitating = gravitating_masses(start.masses, start.test_particles)
+
+    # A step's time includes the time of its force evaluations
+    stats = RunStats()
+    accel_func = stats.timed("force", checkpoint_accel_func(start))
+    step_func = stats.timed("step", get_integrator(start.integrator, start.integrator_options))
+
+    save_stride = store.save_stride
+    first_row = start.step // plot_stride + 1 if continued else 0
+    ring_rows = shape[0] - 1
+    last_step = None if end_step is None else end_step - 1
+    checkpoint_path = os.path.join(store_path, checkpoint_name)
+
+    # The store is flushed first, so it always holds at least every step up to the checkpoint
+    def write_checkpoint(i, position, velocity, accel):
+        checkpoint_start = time.perf_counter()
+        store.flush()
+        save_checkpoint(checkpoint_path, start._replace(step=i, positions=position, velocities=velocity,
+                                                        accelerations=accel, integrator_state=state))
+        stats.add_time("checkpoint", time.perf_counter() - checkpoint_start)
+
+    def publish_stats(i, position, velocity, final=False):
+        stats.sample(position, velocity, gravitating)
+        stats_queue.put(stats.snapshot(step=i, final=final))
+
+    try:
+        for i, position, velocity, accel in integrate(start.positions, start.velocities, gravitating,
+                                                      start.step_size, end_step, accel_func, step_func, state,
+                                                      start.step, start.accelerations):
+            if continued and i == start.step:
+                stats.sample(position, velocity, gravitating)
+                continue
+
+            if spill and i % save_stride == 0:
+                store_start = time.perf_counter()
+                store.append(i * float(start.step_size), position, velocity)
+                stats.add_time("store", time.perf_counter() - store_start)
+
+            if i % stats.sample_freq == 0:
+                publish_stats(i, position, velocity)
+
+            if i % plot_stride == 0:
+                buffer[(i // plot_stride - first_row) % ring_rows] = position
+
+            if i % worker_checkpoint_freq == 0 or i == last_step:
+                write_checkpoint(i, position, velocity, accel)
+
+            if i % worker_check_freq == 0:
+                buffer[-1] = position
+                steps_done.value = i + 1
+                resume_event.wait()
+
+                if cancel_event.is_set():
+                    write_checkpoint(i, position, velocity, accel)
+                    publish_stats(i, position, velocity, True)
+                    return
+
+        if end_step > start.step + continued:
+            buffer[-1] = position
+            publish_stats(i, position, velocity, True)
+        steps_done.value = end_step
+    finally:
+        store.close()
+        del buffer
+        shared.close()
+
+# endregion
+
+
+# region Worker Handle
+
+# Handle used by the GUI to start, pause, cancel, and poll a simulation running in a background process. Only the
+# decimated plot positions are shared with the GUI, the full trajectory goes to a store directory, which is a
+# temporary one removed by close() unless store_path is given or owns_store is cleared
+class SimulationWorker:
+    def __init__(self, bodies, step_size, sim_time, solver="direct", solver_options=None, plot_stride=1,
+                 save_stride=1, store_path=None, integrator="verlet", integrator_options=None, window=None,
+                 spill=True):
+        ids, names, positions, velocities, masses = bodies_to_arrays(bodies)
+        start = Checkpoint(ids, names, masses, step_size, 0, positions, velocities, None, solver, solver_options,
+                           integrator, integrator_options, {}, test_particle_mask(bodies, masses))
+
+        owns_store = store_path is None
+        store_path = tempfile.mkdtemp(prefix="gravity_store_") if store_path is None else store_path
+        TrajectoryStore.create(store_path, ids, names, masses, step_size, max(int(save_stride), 1))
+
+        self.start(start, sim_time, False, plot_stride, store_path, owns_store, window, spill)
+
+    # Continue the run whose store is at store_path for sim_time more steps, or with no end if sim_time is None, from
+    # the checkpoint its worker left there. Steps the store holds past the checkpoint are dropped. Unless given, the
+    # solver and integrator are the ones the run used. The new worker owns the store if owns_store is set
+    @classmethod
+    def continue_run(cls, store_path, sim_time, plot_stride=1, solver=None, solver_options=None, integrator=None,
+                     integrator_options=None, owns_store=False, window=None, spill=True):
+        start = load_checkpoint(os.path.join(store_path, checkpoint_name))
+        start = replace_settings(start, solver, solver_options, integrator, integrator_options)
+
+        store = TrajectoryStore.open(store_path, writable=True)
+        store.truncate(start.step // store.save_stride + 1)
+        store.close()
+
+        worker = cls.__new__(cls)
+        end_step = None if sim_time is None else start.step + 1 + sim_time
+        worker.start(start, end_step, True, plot_stride, store_path, owns_store, window, spill)
+
+        return worker
+
+    # Whether a store directory holds a checkpoint a run can be continued from
+    @staticmethod
+    def can_continue(store_path):
+        return store_path is not None and os.path.exists(os.path.join(store_path, checkpoint_name))
+
+    # With no end_step the run goes on until it is cancelled and only the last window plot rows are kept, window
+    # defaulting to default_stream_window. Only a run with no end can skip spilling its steps to the store
+    def start(self, start, end_step, continued, plot_stride, store_path, owns_store, window=None, spill=True):
+        self.ids, self.names = start.ids, start.names
+        self.step_size = start.step_size
+        self.plot_stride = max(int(plot_stride), 1)
+        self.start_step = start.step
+        self.end_step = end_step
+        self.owns_store = owns_store
+        self.store_path = store_path
+        self.spill = spill or end_step is not None
+
+        # Plot rows of a continued run start at the first plot step after its start step. A run with no end writes
+        # its rows around a ring, with room for the rows it writes between two updates of steps_done on top of the
+        # window, so the window's rows are never being overwritten while they are read
+        self.first_row = start.step // self.plot_stride + 1 if continued else 0
+        if end_step is None:
+            self.window = max(int(window or default_stream_window), 1)
+            rows = self.window + worker_check_freq // self.plot_stride + 1
+        else:
+            rows = max((end_step - 1) // self.plot_stride + 1 - self.first_row, 0)
+            self.window = rows
+
+        # Shared (plot rows + 1, N, 3) buffer holding every plot_stride-th position and, last, the latest position
+        shape = (rows + 1, len(self.ids), 3)
+        self.shared = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+        buffer = np.ndarray(shape, dtype=float, buffer=self.shared.buf)
+        self.plot_positions = buffer[:-1]
+        self.latest_position = buffer[-1]
+        self.latest_position[:] = start.positions
+
+        # Statistics snapshots sent back by the worker, see collect_stats
+        self.stats_queue = worker_context.Queue()
+        self.stats_history = deque(maxlen=stats_history_limit)
+
+        self.steps_done = worker_context.Value('q', start.step + 1 if continued else 0)
+        self.cancel_event = worker_context.Event()
+        self.resume_event = worker_context.Event()
+        self.resume_event.set()
+
+        # A daemon process can't start processes of its own, which the parallel solver needs for its pool. Either way
+        # close() stops the worker when the GUI exits
+        self.process = worker_context.Process(target=run_worker, daemon=start.solver != "parallel",
+                                              args=(self.shared.name, shape, start, end_step, continued,
+                                                    self.plot_stride, self.spill, store_path, self.steps_done,
+                                                    self.cancel_event, self.resume_event, self.stats_queue))
+        self.process.start()
+
+    # Number of steps the worker has integrated so far
+    def steps_available(self):
+        return self.steps_done.value
+
+    # Number of rows of plot_positions that have been written
+    def plot_rows_available(self):
+        return max((self.steps_done.value + self.plot_stride - 1) // self.plot_stride - self.first_row, 0)
+
+    # Plot rows start_row to stop_row - 1, counted from the first row of the whole run, as (first, rows) where first
+    # is the first row returned. Of a run with no end, only the rows still in its window are returned
+    def plot_rows(self, start_row, stop_row):
+        first = max(start_row, stop_row - self.window, self.first_row)
+        indices = np.arange(first - self.first_row, max(stop_row, first) - self.first_row)
+
+        return first, self.plot_positions.take(indices, axis=0, mode="wrap")
+
+    # Whether the run goes on until it is cancelled
+    def is_endless(self):
+        return self.end_step is None
+
+    # Lazy view of the trajectory written so far, read back from the store
+    def trajectory(self):
+        return TrajectoryStore.open(self.store_path).trajectory()
+
+    # Move the statistics snapshots the worker has sent since the last call into stats_history, returning the latest
+    # one, or None if there are no new ones
+    def collect_stats(self):
+        latest = None
+        while True:
+            try:
+                latest = self.stats_queue.get_nowait()
+            except queue.Empty:
+                return latest
+
+            self.stats_history.append(latest)
+
+    def is_finished(self):
+        return self.end_step is not None and self.steps_done.value >= self.end_step
+
+    def is_running(self):
+        return self.process.is_alive()
+
+    def is_paused(self):
+        return not self.resume_event.is_set()
+
+    def pause(self):
+        self.resume_event.clear()
+
+    def resume(self):
+        self.resume_event.set()
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.resume_event.set()
+
+    # Stop the worker if it is still running and release the shared buffer
+    def close(self):
+        if self.process.is_alive():
+            self.cancel()
+            self.process.join(1)
+
+            if self.process.is_alive():
+                self.process.terminate()
+                self.process.join()
+
+        self.stats_queue.close()
+        self.stats_queue.cancel_join_thread()
+
+        self.plot_positions = None
+        self.latest_position = None
+        self.shared.close()
+        self.shared.unlink()
+
+        if self.owns_store:
+            shutil.rmtree(self.store_path, ignore_errors=True)
+
+# endregion
@@ -0,0 +1,21 @@
+import os
+import sys
+import pytest
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, package_dir)
+
+from gravity_sim import Body, Vec3, load_scenario
+
+
+@pytest.fixture
+def sun_earth_moon():
+    return load_scenario(os.path.join(package_dir, "scenarios", "sun_earth_moon.json"))
+
+
+# Sun, Earth, and Moon along with a heavy probe flagged as a test particle, which must not move the others
+@pytest.fixture
+def with_probe(sun_earth_moon):
+    bodies = dict(sun_earth_moon.bodies)
+    bodies["probe"] = Body("probe", "Probe", Vec3(1e11, 5e10, 0), Vec3(0, 2e4, 0), 1e29, None, True)
+    return bodies
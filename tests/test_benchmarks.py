@@ -0,0 +1,15 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from bench_suite import compare
+
+
+def test_compare_flags_changes_beyond_the_threshold():
+    baseline = {"kernel": {"seconds": 1.0}, "step": {"seconds": 1.0}, "run": {"seconds": 1.0}}
+    results = {"kernel": {"seconds": 1.05}, "step": {"seconds": 1.2}, "run": {"seconds": 0.8}, "tree": {"seconds": 2}}
+
+    rows = {name: (ratio, status) for name, _, _, ratio, status in compare(results, baseline, 0.1)}
+    assert rows == {"kernel": (1.05, "ok"), "step": (1.2, "regression"), "run": (0.8, "improvement"),
+                    "tree": (None, "new")}
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+from gravity_sim import TrajectoryBuffer, TrajectoryRing, simulate, stream
+from gravity_store import TrajectoryStore
+
+
+def random_positions(steps, n=3, seed=0):
+    return np.random.default_rng(seed).uniform(-1e11, 1e11, (steps, n, 3))
+
+
+# Appending a run in uneven pieces, as the GUI's refreshes do, gives every stride-th step and outgrows the capacity
+def test_buffer_extends_by_stride_in_pieces():
+    positions = random_positions(1000)
+    buffer = TrajectoryBuffer(3, stride=7, capacity=4)
+
+    for available in (1, 2, 3, 50, 51, 400, 999, 1000, 1000):
+        buffer.extend(positions, available)
+
+    assert buffer.length == len(positions[::7]) and buffer.next_step == buffer.length * 7
+    for body in range(3):
+        for axis in range(3):
+            np.testing.assert_array_equal(buffer.view(body, axis), positions[::7, body, axis])
+
+
+def test_buffer_reads_arrays_starting_at_an_offset():
+    positions = random_positions(100)
+    buffer = TrajectoryBuffer(3, stride=5)
+
+    assert buffer.extend(positions[:40], 40) == 8
+    assert buffer.extend(positions[40:], 100, offset=40) == 12
+    np.testing.assert_array_equal(buffer.view(1, 2), positions[::5, 1, 2])
+
+
+def test_buffer_views_are_zero_copy_and_truncate():
+    positions = random_positions(100)
+    buffer = TrajectoryBuffer(3, stride=2)
+    buffer.extend(positions, 100)
+
+    view = buffer.view(0, 0, 10, 20)
+    assert np.shares_memory(view, buffer.points)
+    np.testing.assert_array_equal(view, positions[20:40:2, 0, 0])
+
+    buffer.truncate(10)
+    assert buffer.length == 10 and buffer.next_step == 20
+    buffer.extend(positions, 100)
+    np.testing.assert_array_equal(buffer.view(2, 1), positions[::2, 2, 1])
+
+
+# However it is appended to, a ring holds the latest capacity points of every stride-th step as contiguous views
+@pytest.mark.parametrize("pieces", [(1000,), (1, 2, 3, 50, 51, 400, 999, 1000), tuple(range(1, 1001))])
+def test_ring_keeps_the_latest_points(pieces):
+    positions = random_positions(1000)
+    ring = TrajectoryRing(3, stride=3, capacity=40)
+
+    for available in pieces:
+        ring.extend(positions, available)
+        kept = positions[:available:3][-40:]
+
+        assert ring.length == len(kept)
+        for body in range(3):
+            view = ring.view(body, 0)
+            assert np.shares_memory(view, ring.points)
+            np.testing.assert_array_equal(view, kept[:, body, 0])
+
+    np.testing.assert_array_equal(ring.view(2, 1, 10, 20), positions[::3][-40:][10:20, 2, 1])
+
+
+# Appending one step at a time, as a streaming run does, with the array starting at the step itself
+def test_ring_appends_single_steps_and_drops_gaps():
+    positions = random_positions(300)
+    ring = TrajectoryRing(3, stride=2, capacity=25)
+
+    for step in range(200):
+        ring.extend(positions[step:step + 1], step + 1, step)
+    np.testing.assert_array_equal(ring.view(0, 2), positions[:200:2][-25:, 0, 2])
+
+    # Steps missed in between break the line, so the points before them are dropped
+    ring.extend(positions[251:260], 260, 251)
+    assert ring.next_step == 260
+    np.testing.assert_array_equal(ring.view(1, 0), positions[252:260:2, 1, 0])
+
+
+def test_ring_truncate():
+    positions = random_positions(100)
+    ring = TrajectoryRing(3, stride=1, capacity=30)
+    ring.extend(positions, 100)
+
+    ring.truncate(90)
+    assert ring.length == 20 and ring.next_step == 90
+    np.testing.assert_array_equal(ring.view(0, 0), positions[70:90, 0, 0])
+
+    ring.extend(positions, 100)
+    np.testing.assert_array_equal(ring.view(0, 0), positions[70:100, 0, 0])
+
+
+# A streaming run's window and spilled store match the same steps of a run of set length
+def test_stream_matches_simulate(with_probe, tmp_path):
+    expected = simulate(with_probe, 500, 2001)
+    runs = stream(with_probe, 500, window=100, stride=4, yield_freq=250, save_stride=10, store=str(tmp_path / "run"))
+
+    steps = []
+    for i, ring in runs:
+        steps.append(i)
+        np.testing.assert_array_equal(np.stack([ring.view(body, axis) for body in range(4) for axis in range(3)]),
+                                      expected.positions[:i + 1:4][-100:].transpose(1, 2, 0).reshape(12, -1))
+        if i == 2000:
+            break
+    runs.close()
+
+    assert steps == list(range(0, 2001, 250))
+    trajectory = TrajectoryStore.open(str(tmp_path / "run")).trajectory()
+    np.testing.assert_array_equal(np.asarray(trajectory.positions), expected.positions[::10])
@@ -0,0 +1,87 @@
+import json
+import os
+import subprocess
+import sys
+import numpy as np
+from gravity_cache import ResultCache, cache_key
+from gravity_sim import Vec3, simulate
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+settings = {"step_size": 500, "sim_time": 1000, "save_stride": 10, "solver": "barnes_hut",
+            "solver_options": {"theta": 0.5, "softening": 1e3}, "integrator": "adaptive",
+            "integrator_options": {"rtol": 1e-9}}
+
+
+def test_cache_key_is_stable(sun_earth_moon):
+    key = cache_key(sun_earth_moon.bodies, **settings)
+
+    # Option order doesn't matter, and neither do the bodies' colors
+    reordered = dict(settings, solver_options={"softening": 1e3, "theta": 0.5})
+    recolored = {body_id: body._replace(color=[1, 2, 3, 4]) for body_id, body in sun_earth_moon.bodies.items()}
+    assert cache_key(sun_earth_moon.bodies, **reordered) == key
+    assert cache_key(recolored, **settings) == key
+
+    # The same in a new process, whose hash seed is different
+    code = ("import json, sys; from gravity_cache import cache_key; from gravity_sim import load_scenario; "
+            "settings = json.loads(sys.argv[1]); "
+            "print(cache_key(load_scenario('scenarios/sun_earth_moon.json').bodies, **settings))")
+    output = subprocess.run([sys.executable, "-c", code, json.dumps(settings)], cwd=package_dir, check=True,
+                            capture_output=True, text=True, env={"PYTHONHASHSEED": "123", "PYTHONPATH": package_dir})
+    assert output.stdout.strip() == key
+
+
+def test_cache_key_changes_with_inputs_and_back(sun_earth_moon):
+    bodies = dict(sun_earth_moon.bodies)
+    key = cache_key(bodies, **settings)
+
+    moon = bodies["moon"]
+    bodies["moon"] = moon._replace(velocity=Vec3(moon.velocity.x, moon.velocity.y + 1e-9, moon.velocity.z))
+    assert cache_key(bodies, **settings) != key
+
+    bodies["moon"] = moon._replace(test_particle=True)
+    assert cache_key(bodies, **settings) != key
+
+    bodies["moon"] = moon
+    assert cache_key(bodies, **settings) == key
+
+    for name, value in (("sim_time", 1001), ("save_stride", 1), ("solver", "direct"), ("integrator", "verlet"),
+                        ("solver_options", {"theta": 0.4, "softening": 1e3})):
+        assert cache_key(sun_earth_moon.bodies, **dict(settings, **{name: value})) != key
+
+
+# The compute backend and the parallel solver's pool only change how fast a run is, not its result
+def test_cache_key_ignores_execution_options(sun_earth_moon):
+    direct = cache_key(sun_earth_moon.bodies, 500, 1000, solver="direct")
+    assert cache_key(sun_earth_moon.bodies, 500, 1000, solver="direct", solver_options={"backend": "numpy"}) == direct
+
+    parallel = cache_key(sun_earth_moon.bodies, 500, 1000, solver="parallel", solver_options={"softening": 1e3})
+    assert cache_key(sun_earth_moon.bodies, 500, 1000, solver="parallel",
+                     solver_options={"workers": 16, "tile_size": 64, "softening": 1e3}) == parallel
+
+
+def test_result_cache_round_trip(sun_earth_moon, tmp_path):
+    trajectory = simulate(sun_earth_moon.bodies, 500, 200)
+    key = cache_key(sun_earth_moon.bodies, 500, 200)
+
+    cache = ResultCache(str(tmp_path))
+    assert key not in cache and cache.get(key) is None
+    cache.put(key, trajectory)
+
+    # A new cache over the same directory only has the disk tier
+    cached = ResultCache(str(tmp_path)).get(key)
+    assert key in ResultCache(str(tmp_path))
+    np.testing.assert_array_equal(np.asarray(cached.positions), trajectory.positions)
+    np.testing.assert_array_equal(np.asarray(cached.velocities), trajectory.velocities)
+
+
+def test_result_cache_simulates_once_and_evicts(sun_earth_moon, tmp_path):
+    cache = ResultCache(str(tmp_path), memory_bytes=0)
+    first = cache.simulate(sun_earth_moon.bodies, 500, 100)
+    np.testing.assert_array_equal(np.asarray(first.positions), simulate(sun_earth_moon.bodies, 500, 100).positions)
+
+    # With no room in memory the result comes back from its store on disk
+    assert cache.get(cache_key(sun_earth_moon.bodies, 500, 100)) is not None and not cache.memory
+
+    cache.evict(0)
+    assert cache_key(sun_earth_moon.bodies, 500, 100) not in cache
@@ -0,0 +1,41 @@
+import os
+import numpy as np
+from gravity_sim import load_checkpoint, load_trajectory, main, simulate
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+scenario_path = os.path.join(package_dir, "scenarios", "sun_earth_moon.json")
+
+
+def test_batch_run_saves_the_simulated_trajectory(sun_earth_moon, tmp_path):
+    main([scenario_path, "-o", str(tmp_path), "--step-size", "500", "--sim-time", "300", "--save-stride", "7"])
+    trajectory = load_trajectory(tmp_path / "sun_earth_moon.npz")
+    expected = simulate(sun_earth_moon.bodies, 500, 300, save_stride=7)
+
+    assert trajectory.ids == expected.ids and trajectory.names == expected.names
+    np.testing.assert_array_equal(trajectory.times, expected.times)
+    np.testing.assert_array_equal(trajectory.positions, expected.positions)
+    np.testing.assert_array_equal(trajectory.velocities, expected.velocities)
+
+
+# A resumed run keeps the integrator and options of its checkpoint unless others are given
+def test_resume_keeps_the_checkpoint_settings(sun_earth_moon, tmp_path):
+    run = [scenario_path, "-o", str(tmp_path), "--step-size", "500"]
+    checkpoint_path = tmp_path / "sun_earth_moon.checkpoint.npz"
+
+    main(run + ["--sim-time", "600", "--integrator", "adaptive", "--tolerance", "1e-8", "--checkpoint"])
+    main(run + ["--sim-time", "400", "--resume"])
+
+    checkpoint = load_checkpoint(checkpoint_path)
+    assert checkpoint.step == 999 and checkpoint.solver == "direct"
+    assert checkpoint.integrator == "adaptive" and checkpoint.integrator_options == {"rtol": 1e-8}
+
+    expected = simulate(sun_earth_moon.bodies, 500, 1000, integrator="adaptive", integrator_options={"rtol": 1e-8})
+    np.testing.assert_array_equal(load_trajectory(tmp_path / "sun_earth_moon.npz").positions, expected.positions)
+
+    # Options given on the command line replace the checkpoint's, and another integrator its state too
+    main(run + ["--sim-time", "100", "--resume", "--tolerance", "1e-10"])
+    assert load_checkpoint(checkpoint_path).integrator_options == {"rtol": 1e-10}
+
+    main(run + ["--sim-time", "100", "--resume", "--integrator", "yoshida4"])
+    checkpoint = load_checkpoint(checkpoint_path)
+    assert checkpoint.integrator == "yoshida4" and checkpoint.integrator_options is None
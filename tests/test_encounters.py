@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+from gravity_encounters import close_pairs, encounter_step, grid_min_n
+from gravity_sim import Body, Vec3, bodies_to_arrays, get_accel_func, integrate, simulate
+
+
+def brute_force_pairs(positions, radius):
+    first, second = np.triu_indices(len(positions), 1)
+    close = np.linalg.norm(positions[second] - positions[first], axis=1) < radius
+    return set(zip(first[close].tolist(), second[close].tolist()))
+
+
+# Clustered bodies put many of them in the same and neighbouring cells, spread out ones leave most cells empty
+@pytest.mark.parametrize("n", [grid_min_n + 1, 500, 3000])
+@pytest.mark.parametrize("radius", [1e8, 1e9, 1e10])
+def test_grid_pairs_match_brute_force(n, radius):
+    rng = np.random.default_rng(n)
+    centres = rng.uniform(-1e11, 1e11, (8, 3))
+    positions = centres[rng.integers(0, 8, n)] + rng.normal(0, 3e9, (n, 3))
+
+    first, second = close_pairs(positions, radius)
+    assert (first < second).all()
+    assert len(set(zip(first.tolist(), second.tolist()))) == len(first)
+    assert set(zip(first.tolist(), second.tolist())) == brute_force_pairs(positions, radius)
+
+
+def test_grid_pairs_on_cell_boundaries():
+    positions = np.array([[0.0, 0.0, 0.0], [1.0, 0.0, 0.0], [0.999, 0.999, 0.999], [-0.5, -0.5, 0.0],
+                          [2.0, 2.0, 2.0]] * 20) + np.repeat(np.arange(20) * 10.0, 5)[:, np.newaxis]
+    first, second = close_pairs(positions, 1.0)
+    assert set(zip(first.tolist(), second.tolist())) == brute_force_pairs(positions, 1.0)
+
+
+# A light body passing a heavy one a million kilometres out at 500 km/s, next to a distant third body
+def flyby(test_particle=False):
+    return {"a": Body("a", "A", Vec3(0, 0, 0), Vec3(0, 0, 0), 1e30, None),
+            "b": Body("b", "B", Vec3(-1e11, 1e9, 0), Vec3(5e5, 0, 0), 1e24, None, test_particle),
+            "c": Body("c", "C", Vec3(5e10, 0, 0), Vec3(0, 5e4, 0), 1e24, None)}
+
+
+def test_encounter_substeps_resolve_a_flyby():
+    reference = simulate(flyby(), 20, 20001, integrator="yoshida4", save_stride=20000).positions[-1]
+    verlet = simulate(flyby(), 1000, 401, save_stride=400).positions[-1]
+    encounter = simulate(flyby(), 1000, 401, integrator="encounter", save_stride=400).positions[-1]
+
+    assert np.abs(encounter - reference).max() < np.abs(verlet - reference).max() / 10
+
+
+# The close bodies' mutual pull is evaluated on them alone, the whole system only once a step
+def test_encounter_substeps_only_evaluate_the_close_bodies():
+    bodies = dict(flyby(), **{f"far{i}": Body(f"far{i}", f"Far{i}", Vec3(1e11, 1e10 * i, 0), Vec3(0, 3e4, 0), 1e22,
+                                              None) for i in range(20)})
+    _, _, positions, velocities, masses = bodies_to_arrays(bodies)
+    solver = get_accel_func()
+    sizes = []
+
+    def accel_func(positions, masses, targets=None):
+        sizes.append(len(masses))
+        return solver(positions, masses, targets)
+
+    state = {}
+    for _ in integrate(positions, velocities, masses, 1000, 401, accel_func, encounter_step, state):
+        pass
+
+    assert sizes.count(len(masses)) == 401 and set(sizes) == {2, len(masses)}
+    assert sizes.count(2) > state["substeps"] > 0
+
+
+# A test particle in an encounter is substepped like any body but still doesn't pull the others, which only differ
+# by the rounding of the substeps the heavy body takes with it
+def test_test_particle_in_an_encounter():
+    positions = simulate(flyby(True), 1000, 401, integrator="encounter").positions
+    without = simulate({"a": flyby()["a"], "c": flyby()["c"]}, 1000, 401, integrator="encounter").positions
+    np.testing.assert_allclose(positions[:, [0, 2]], without, rtol=1e-12, atol=1e-9)
+
+    massive = simulate(flyby(), 1000, 401, integrator="encounter").positions
+    assert np.abs(positions[:, 1] - massive[:, 1]).max() < 1e5
+
+
+def test_encounter_merges_leave_input_masses_alone():
+    bodies = {"a": Body("a", "A", Vec3(0, 0, 0), Vec3(0, 0, 0), 1e30, None),
+              "b": Body("b", "B", Vec3(1e9, 0, 0), Vec3(-3e4, 0, 0), 1e28, None),
+              "c": Body("c", "C", Vec3(5e10, 0, 0), Vec3(0, 5e4, 0), 1e24, None)}
+    options = {"merge_radius": 1e8}
+
+    trajectory = simulate(bodies, 500, 200, integrator="encounter", integrator_options=options)
+    np.testing.assert_array_equal(trajectory.masses, [1e30, 1e28, 1e24])
+
+    _, _, positions, velocities, masses = bodies_to_arrays(bodies)
+    state = {}
+    for _ in integrate(positions, velocities, masses, 500, 200, get_accel_func(),
+                       lambda *args: encounter_step(*args, **options), state):
+        pass
+
+    np.testing.assert_array_equal(masses, [1e30, 1e28, 1e24])
+    assert state["merge_events"] and state["masses"][1] == 0.0
+    assert state["masses"][0] == pytest.approx(1.01e30)
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+from gravity_ensemble import batch_integrators, perturb_bodies, simulate_ensemble, sweep_bodies
+from gravity_sim import Vec3, simulate
+
+
+# Every member of a batched run matches running it on its own
+@pytest.mark.parametrize("integrator", sorted(batch_integrators))
+def test_ensemble_members_match_simulate(sun_earth_moon, integrator):
+    moon = sun_earth_moon.bodies["moon"]
+    members = sweep_bodies(sun_earth_moon.bodies, "moon", "velocity",
+                           [Vec3(moon.velocity.x, moon.velocity.y + dv, moon.velocity.z) for dv in (-50, 0, 50)])
+    trajectories = simulate_ensemble(members, 500, 500, save_stride=10, integrator=integrator)
+
+    for member, trajectory in zip(members, trajectories):
+        expected = simulate(member, 500, 500, save_stride=10, integrator=integrator)
+        np.testing.assert_array_equal(trajectory.times, expected.times)
+        np.testing.assert_allclose(trajectory.positions, expected.positions, rtol=0, atol=1e-3)
+        np.testing.assert_allclose(trajectory.velocities, expected.velocities, rtol=0, atol=1e-9)
+
+
+def test_ensemble_summary_matches_members(sun_earth_moon):
+    members = perturb_bodies(sun_earth_moon.bodies, 4, position_spread=1e-4, velocity_spread=1e-4, seed=1)
+    trajectories = simulate_ensemble(members, 500, 300, save_stride=7)
+    summary = simulate_ensemble(members, 500, 300, save_stride=7, summary=True)
+
+    positions = np.stack([trajectory.positions for trajectory in trajectories])
+    np.testing.assert_allclose(summary.mean_positions, positions.mean(axis=0), rtol=1e-12)
+    np.testing.assert_allclose(summary.std_positions, positions.std(axis=0), rtol=1e-6, atol=1e-3)
+
+    # The final state is the last step, which a save stride of 7 doesn't save
+    final = simulate_ensemble(members, 500, 300)
+    np.testing.assert_array_equal(summary.final_positions, [trajectory.positions[-1] for trajectory in final])
+    np.testing.assert_array_equal(summary.final_velocities, [trajectory.velocities[-1] for trajectory in final])
+
+
+# A heavy probe flagged as a test particle in one member only pulls the others in the member where it isn't one
+@pytest.mark.parametrize("integrator", sorted(batch_integrators))
+def test_ensemble_test_particles_match_simulate(sun_earth_moon, with_probe, integrator):
+    heavy_probe = dict(with_probe, probe=with_probe["probe"]._replace(test_particle=False))
+    members = simulate_ensemble([with_probe, heavy_probe], 500, 500, integrator=integrator)
+    without = simulate_ensemble([sun_earth_moon.bodies], 500, 500, integrator=integrator)[0].positions
+
+    np.testing.assert_allclose(members[0].positions, simulate(with_probe, 500, 500, integrator=integrator).positions,
+                               rtol=0, atol=1e-3)
+    np.testing.assert_allclose(members[0].positions[:, :3], without, rtol=0, atol=1e-3)
+    assert np.abs(members[1].positions[:, :3] - without).max() > 1e6
+
+
+def test_unbatched_integrator_is_rejected(sun_earth_moon):
+    with pytest.raises(ValueError, match="can't run ensembles"):
+        simulate_ensemble([sun_earth_moon.bodies], 500, 10, integrator="block")
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+import gravity_backends
+import gravity_parallel
+from gravity_backends import calibration_system, compute_backends, crossovers_from_timings, direct_accel, \
+    reference_accel, select_backend
+from gravity_sim import Body, Vec3, accel_block_size, get_accel_func, n_body_accel, n_body_accel_array
+from gravity_tree import barnes_hut_accel
+
+
+def assert_close(accelerations, expected, rtol=1e-10):
+    scale = np.abs(expected).max()
+    np.testing.assert_allclose(accelerations, expected, rtol=0, atol=rtol * scale)
+
+
+def random_system(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-1e11, 1e11, (n, 3)), rng.uniform(1e20, 1e30, n)
+
+
+# The per-body loop the array kernel replaced, over every other body
+def loop_accel(positions, masses, softening=0.0):
+    bodies = [Body(str(i), str(i), Vec3(*position), Vec3(0, 0, 0), mass, None)
+              for i, (position, mass) in enumerate(zip(positions.tolist(), masses.tolist()))]
+
+    return np.array([n_body_accel(body, bodies[:i] + bodies[i + 1:], softening) for i, body in enumerate(bodies)])
+
+
+# Small systems take the kernel's pair-twice path, large ones are split into row blocks
+@pytest.mark.parametrize("n", [2, 5, 40, accel_block_size + 44])
+def test_array_kernel_matches_per_body_loop(n):
+    positions, masses = random_system(n)
+    expected = loop_accel(positions, masses)
+
+    assert_close(n_body_accel_array(positions, masses), expected)
+
+    targets = np.array([0, n - 1])
+    assert_close(n_body_accel_array(positions, masses, targets), expected[targets])
+
+
+def test_array_kernel_softening():
+    positions, masses = random_system(40, seed=1)
+    assert_close(n_body_accel_array(positions, masses, softening=1e9), loop_accel(positions, masses, softening=1e9))
+
+
+def test_barnes_hut_converges_to_reference():
+    positions, masses = random_system(500, seed=3)
+    expected = reference_accel(positions, masses)
+    errors = []
+
+    for theta in (0.8, 0.5, 0.2):
+        accelerations = barnes_hut_accel(positions, masses, theta=theta)
+        errors.append(np.median(np.linalg.norm(accelerations - expected, axis=1) / np.linalg.norm(expected, axis=1)))
+
+    assert errors[1] < 1e-2
+    assert errors[0] > errors[1] > errors[2]
+
+    # Opening every node is the direct sum
+    assert_close(barnes_hut_accel(positions, masses, theta=0.0), expected, rtol=1e-9)
+    assert_close(get_accel_func("barnes_hut", {"theta": 0.0})(positions, masses), expected, rtol=1e-9)
+
+
+def test_barnes_hut_targets_and_softening():
+    positions, masses = random_system(200, seed=4)
+    targets = np.array([0, 99, 199])
+
+    accelerations = barnes_hut_accel(positions, masses, targets, theta=0.0, softening=1e9)
+    assert_close(accelerations, reference_accel(positions, masses, targets, softening=1e9), rtol=1e-9)
+
+
+# The pool only takes over from parallel_min_n bodies, which is lowered so a small system runs across the workers
+def test_parallel_matches_reference(monkeypatch):
+    monkeypatch.setattr(gravity_parallel, "parallel_min_n", 0)
+    positions, masses = random_system(300, seed=5)
+
+    try:
+        accelerations = gravity_parallel.parallel_accel(positions, masses, workers=2, tile_size=64)
+        assert_close(accelerations, reference_accel(positions, masses))
+
+        targets = np.array([1, 150, 299])
+        accelerations = gravity_parallel.parallel_accel(positions, masses, targets, workers=2, tile_size=64,
+                                                        softening=1e9)
+        assert_close(accelerations, reference_accel(positions, masses, targets, softening=1e9))
+
+        accelerations = get_accel_func("parallel", {"workers": 2})(positions, masses)
+        assert_close(accelerations, reference_accel(positions, masses))
+    finally:
+        gravity_parallel.close_force_pools()
+
+
+@pytest.mark.parametrize("backend", sorted(compute_backends))
+@pytest.mark.parametrize("n", [2, 5, 40, 300])
+def test_backend_matches_reference(backend, n):
+    positions, masses = calibration_system(n)
+    assert_close(compute_backends[backend](positions, masses), reference_accel(positions, masses))
+
+
+@pytest.mark.parametrize("backend", sorted(compute_backends))
+def test_backend_targets_and_softening(backend):
+    positions, masses = calibration_system(50, seed=1)
+    targets = np.array([3, 17, 42])
+    expected = reference_accel(positions, masses, targets, softening=1e9)
+
+    assert_close(compute_backends[backend](positions, masses, targets, softening=1e9), expected)
+    assert_close(direct_accel(positions, masses, targets, backend=backend, softening=1e9), expected)
+    assert_close(get_accel_func("direct", {"backend": backend, "softening": 1e9})(positions, masses, targets),
+                 expected)
+
+
+def test_auto_backend_follows_the_crossovers(monkeypatch):
+    monkeypatch.setattr(gravity_backends, "crossovers", [[4, "reference"], [32, "not_installed"], [None, "numpy"]])
+    monkeypatch.setattr(gravity_backends, "backend_choices", {})
+
+    assert [select_backend(n) for n in (2, 4, 5, 32, 1000)] == ["reference"] * 2 + ["numpy"] * 3
+
+    with pytest.raises(ValueError, match="Unknown or unavailable compute backend"):
+        direct_accel(*calibration_system(3), backend="not_installed")
+
+
+def test_crossovers_merge_neighbouring_winners():
+    timings = {2: {"reference": 1, "numpy": 2}, 4: {"reference": 1, "numpy": 2}, 8: {"reference": 3, "numpy": 2},
+               16: {"reference": 9, "numpy": 2}}
+    assert crossovers_from_timings(timings) == [[4, "reference"], [None, "numpy"]]
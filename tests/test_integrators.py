@@ -0,0 +1,113 @@
+import os
+import numpy as np
+import pytest
+import gravity_sim
+from gravity_sim import bodies_to_arrays, get_accel_func, get_integrator, integrate, integrators, load_scenario, \
+    n_body_accel_array, simulate, total_energy
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+steps = 2001
+
+
+# The vectorized Verlet loop matches stepping every body's position and velocity one at a time
+def test_verlet_matches_per_body_steps(sun_earth_moon):
+    _, _, positions, velocities, masses = bodies_to_arrays(sun_earth_moon.bodies)
+    expected = [positions]
+    accel = n_body_accel_array(positions, masses)
+
+    for _ in range(99):
+        new_positions = np.array([position + velocity * 500 + a * (500 ** 2 / 2)
+                                  for position, velocity, a in zip(positions, velocities, accel)])
+        new_accel = n_body_accel_array(new_positions, masses)
+        velocities = np.array([velocity + (a + new_a) * (500 / 2)
+                               for velocity, a, new_a in zip(velocities, accel, new_accel)])
+        positions, accel = new_positions, new_accel
+        expected.append(positions)
+
+    np.testing.assert_allclose(simulate(sun_earth_moon.bodies, 500, 100).positions, expected, rtol=1e-12)
+
+
+def energy_drift(trajectory):
+    energies = [total_energy(position, velocity, trajectory.masses)
+                for position, velocity in zip(trajectory.positions, trajectory.velocities)]
+    return np.abs(np.array(energies) / energies[0] - 1).max()
+
+
+@pytest.mark.parametrize("integrator", ["yoshida4", "adaptive", "block", "wisdom_holman"])
+def test_integrator_matches_verlet(sun_earth_moon, integrator):
+    verlet = simulate(sun_earth_moon.bodies, 500, steps).positions
+    positions = simulate(sun_earth_moon.bodies, 500, steps, integrator=integrator).positions
+
+    # A few hundred metres after 11 days, against the Moon's 4e8 m orbit
+    assert np.abs(positions - verlet).max() < 1e3
+
+
+def test_yoshida4_and_adaptive_beat_verlet(sun_earth_moon):
+    reference = simulate(sun_earth_moon.bodies, 50, 10 * (steps - 1) + 1, integrator="yoshida4").positions[-1]
+    verlet = simulate(sun_earth_moon.bodies, 500, steps)
+    verlet_error = np.abs(verlet.positions[-1] - reference).max()
+
+    for integrator in ("yoshida4", "adaptive"):
+        trajectory = simulate(sun_earth_moon.bodies, 500, steps, integrator=integrator)
+        assert np.abs(trajectory.positions[-1] - reference).max() < verlet_error / 100
+        assert energy_drift(trajectory) < energy_drift(verlet)
+
+
+def test_unknown_integrator_is_rejected():
+    with pytest.raises(ValueError, match="Unknown integrator"):
+        get_integrator("rk9")
+
+
+# With moons on orbits of a few days next to planets on orbits of years, daily steps only substep the moons. Verlet
+# given twice the body accelerations the block steps calculated is still less accurate
+def test_block_steps_save_force_evaluations():
+    bodies = load_scenario(os.path.join(package_dir, "scenarios", "solar_system_moons.json")).bodies
+    days = 10
+    run_time = days * 86400
+    reference = simulate(bodies, 120, run_time // 120 + 1, integrator="yoshida4", save_stride=run_time // 120)
+
+    _, _, positions, velocities, masses = bodies_to_arrays(bodies)
+    state = {}
+    for _, position, _, _ in integrate(positions, velocities, masses, 86400, days + 1, get_accel_func(),
+                                       get_integrator("block"), state):
+        pass
+    block_error = np.abs(position - reference.positions[-1]).max()
+
+    verlet_steps = 2 * state["evaluations"] // len(masses)
+    verlet = simulate(bodies, run_time / verlet_steps, verlet_steps + 1, save_stride=verlet_steps)
+    assert np.abs(verlet.positions[-1] - reference.positions[-1]).max() > block_error
+
+
+# A test particle of any mass feels the other bodies but must leave their motion exactly as it is without it
+@pytest.mark.parametrize("integrator", sorted(integrators))
+def test_test_particle_leaves_others_unchanged(sun_earth_moon, with_probe, integrator):
+    without = simulate(sun_earth_moon.bodies, 500, 500, integrator=integrator).positions
+    positions = simulate(with_probe, 500, 500, integrator=integrator).positions
+
+    np.testing.assert_array_equal(positions[:, :3], without)
+    assert not np.array_equal(positions[0, 3], positions[-1, 3])
+
+
+# Bodies are test particles when flagged or no heavier than the threshold, and there is no mask without any. The
+# function is reached through its module, as pytest would collect it as a test if it were imported by name
+def test_test_particle_mask(sun_earth_moon, with_probe):
+    _, _, _, _, masses = bodies_to_arrays(with_probe)
+    assert list(gravity_sim.test_particle_mask(with_probe, masses)) == [False, False, False, True]
+    assert list(gravity_sim.test_particle_mask(with_probe, masses, 1e23)) == [False, False, True, True]
+    assert gravity_sim.test_particle_mask(sun_earth_moon.bodies, masses[:3]) is None
+
+
+# Without tight moons, Wisdom-Holman's daily steps end closer to the reference than Verlet's hourly ones
+def test_wisdom_holman_beats_verlet_without_moons():
+    bodies = load_scenario(os.path.join(package_dir, "scenarios", "solar_system.json")).bodies
+    del bodies["moon"]
+    days = 60
+    run_time = days * 86400
+
+    reference = simulate(bodies, 300, run_time // 300 + 1, integrator="yoshida4", save_stride=run_time // 300)
+    wisdom_holman = simulate(bodies, 86400, days + 1, integrator="wisdom_holman", save_stride=days)
+    verlet = simulate(bodies, 3600, run_time // 3600 + 1, save_stride=run_time // 3600)
+
+    wisdom_holman_error = np.abs(wisdom_holman.positions[-1] - reference.positions[-1]).max()
+    assert wisdom_holman_error < np.abs(verlet.positions[-1] - reference.positions[-1]).max() / 2
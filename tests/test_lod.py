@@ -0,0 +1,54 @@
+import numpy as np
+from gravity_lod import decimate_view, points_per_pixel, view_margin
+
+
+def circle(points, turns=1, radius=1.0):
+    angles = np.linspace(0, 2 * np.pi * turns, points)
+    return radius * np.cos(angles), radius * np.sin(angles)
+
+
+def test_whole_line_in_view_is_reduced_to_the_pixels_it_crosses():
+    x, y = circle(100_000, turns=20)
+    points_x, points_y = decimate_view(x, y, (-1.5, 1.5), (-1.5, 1.5), 200, 200)
+
+    assert not np.isnan(points_x).any()
+    assert len(points_x) <= points_per_pixel * 200 + 2
+    assert (points_x[0], points_y[0]) == (x[0], y[0]) and (points_x[-1], points_y[-1]) == (x[-1], y[-1])
+
+    # Extremes are kept, so the line reaches as far as it did, to within the pixel of its furthest point
+    pixel = 3 / 200
+    np.testing.assert_allclose([points_x.min(), points_x.max(), points_y.min(), points_y.max()],
+                               [x.min(), x.max(), y.min(), y.max()], rtol=0, atol=pixel)
+
+    # Every point kept is a point of the line
+    assert np.isin(points_x, x).all() and np.isin(points_y, y).all()
+
+
+# A zoomed in view keeps the points near it, breaking the line with a NaN wherever it leaves, and every point dropped
+# is far outside the view
+def test_zoomed_view_keeps_nearby_points_and_breaks_the_line():
+    x, y = circle(4000, turns=2)
+    x_range, y_range = (0.9, 1.1), (-0.1, 0.1)
+    points_x, points_y = decimate_view(x, y, x_range, y_range, 1000, 1000)
+
+    gaps = np.isnan(points_x)
+    assert gaps.sum() == 2 and np.array_equal(gaps, np.isnan(points_y))
+
+    visible = (np.abs(x - 1) <= 0.1 * (1 + 2 * view_margin)) & (np.abs(y) <= 0.1 * (1 + 2 * view_margin))
+    assert set(zip(x[visible], y[visible])) <= set(zip(points_x[~gaps], points_y[~gaps]))
+    assert len(points_x) - 2 < len(x) / 10
+
+
+def test_line_out_of_view_is_dropped():
+    x, y = circle(1000)
+    points_x, points_y = decimate_view(x, y, (10, 11), (10, 11), 500, 500)
+    assert len(points_x) == 0 and len(points_y) == 0
+
+
+# The last point of the line is always kept as well
+def test_points_in_one_pixel_are_drawn_once():
+    x = np.repeat(np.arange(50.0), 100)
+    y = np.zeros_like(x)
+    points_x, _ = decimate_view(x, y, (0, 50), (-1, 1), 50, 10)
+
+    assert list(points_x) == list(range(50)) + [49]
@@ -0,0 +1,59 @@
+import numpy as np
+from gravity_preview import Preview
+from gravity_sim import simulate
+
+
+def buffered_positions(buffer):
+    return np.transpose(buffer.points[:, :, :buffer.length], (2, 0, 1))
+
+
+def test_levels_get_finer_and_longer(sun_earth_moon):
+    preview = Preview(sun_earth_moon.bodies, 500, 3000)
+
+    step_sizes = [dt for dt, _ in preview.levels]
+    horizons = [dt * (steps - 1) for dt, steps in preview.levels]
+    assert step_sizes == sorted(step_sizes, reverse=True) and step_sizes[-1] == 500
+    assert horizons == sorted(horizons) and horizons[-1] == 500 * 3000
+
+
+# With no time to spare, advance takes a single step a call, so a level is only finished once all of its steps are
+def test_advance_keeps_to_its_budget(sun_earth_moon):
+    preview = Preview(sun_earth_moon.bodies, 500, 3000, max_points=256)
+    first_steps = preview.levels[0][1]
+
+    for _ in range(first_steps):
+        assert not preview.advance(0)
+    assert preview.buffer is None and preview.horizon() == 0.0
+
+    assert preview.advance(0)
+    assert preview.horizon() == preview.levels[0][0] * (first_steps - 1)
+
+    horizon = preview.horizon()
+    while not preview.is_done():
+        if preview.advance(0):
+            assert preview.horizon() >= horizon
+            horizon = preview.horizon()
+
+    assert horizon == 500 * 3000 and not preview.advance(0)
+
+
+def test_finest_level_matches_full_run(sun_earth_moon):
+    preview = Preview(sun_earth_moon.bodies, 500, 3000, max_points=256)
+    while not preview.is_done():
+        preview.advance(1.0)
+
+    positions = simulate(sun_earth_moon.bodies, 500, 3000).positions[::preview.buffer.stride]
+    np.testing.assert_array_equal(buffered_positions(preview.buffer)[:len(positions)], positions)
+
+
+# The heavy probe is a test particle, so the others move just as they do without it
+def test_preview_keeps_test_particles(with_probe, sun_earth_moon):
+    preview = Preview(with_probe, 500, 3000, max_points=256)
+    while not preview.is_done():
+        preview.advance(1.0)
+
+    positions = simulate(with_probe, 500, 3000).positions[::preview.buffer.stride]
+    np.testing.assert_array_equal(buffered_positions(preview.buffer)[:len(positions)], positions)
+
+    without_probe = simulate(sun_earth_moon.bodies, 500, 3000).positions[::preview.buffer.stride]
+    np.testing.assert_allclose(buffered_positions(preview.buffer)[:len(positions), :3], without_probe, rtol=1e-12)
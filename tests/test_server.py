@@ -0,0 +1,128 @@
+import json
+import time
+import urllib.error
+import urllib.request
+import numpy as np
+import pytest
+from gravity_cache import ResultCache
+from gravity_server import JobServer, cancel_job, job_status, server_request, start_server, stop_server, submit_job
+from gravity_sim import scenario_to_dict, simulate
+
+
+@pytest.fixture
+def jobs(tmp_path):
+    server = JobServer(max_jobs=1, cache=ResultCache(str(tmp_path)))
+    yield server
+    server.close()
+
+
+def job_request(bodies, sim_time, **settings):
+    return dict(scenario_to_dict(list(bodies.values()), 500, sim_time), **settings)
+
+
+def wait_until_finished(jobs, job, timeout=60):
+    deadline = time.time() + timeout
+    while job.status not in ("done", "cancelled", "failed"):
+        assert time.time() < deadline, f"job {job.id} still {job.status}"
+        jobs.wait()
+
+
+def test_identical_jobs_are_shared(jobs, sun_earth_moon):
+    first, shared = jobs.submit(job_request(sun_earth_moon.bodies, 3000))
+    second, second_shared = jobs.submit(job_request(sun_earth_moon.bodies, 3000))
+    other, other_shared = jobs.submit(job_request(sun_earth_moon.bodies, 3001))
+
+    assert not shared and second_shared and not other_shared
+    assert second is first and first.submitters == 2 and other is not first
+
+    wait_until_finished(jobs, first)
+    assert first.status == "done"
+
+    trajectory = jobs.result(first.id)
+    np.testing.assert_array_equal(np.asarray(trajectory.positions),
+                                  simulate(sun_earth_moon.bodies, 500, 3000).positions)
+
+    # Once cached, the same job is done as soon as it is submitted
+    cached, cached_shared = jobs.submit(job_request(sun_earth_moon.bodies, 3000))
+    assert cached is not first and not cached_shared and cached.status == "done"
+
+
+def test_shared_job_is_cancelled_once_every_submitter_has(jobs, sun_earth_moon):
+    job, _ = jobs.submit(job_request(sun_earth_moon.bodies, 10_000_000))
+    jobs.submit(job_request(sun_earth_moon.bodies, 10_000_000))
+
+    jobs.cancel(job.id)
+    assert job.status in ("queued", "running") and job.submitters == 1
+
+    jobs.cancel(job.id)
+    wait_until_finished(jobs, job)
+    assert job.status == "cancelled" and jobs.result(job.id) is None
+
+
+def test_queued_job_is_dropped_and_priorities_start_first(jobs, sun_earth_moon):
+    running, _ = jobs.submit(job_request(sun_earth_moon.bodies, 10_000_000))
+    low, _ = jobs.submit(job_request(sun_earth_moon.bodies, 2000, priority=0))
+    high, _ = jobs.submit(job_request(sun_earth_moon.bodies, 2001, priority=5))
+    dropped, _ = jobs.submit(job_request(sun_earth_moon.bodies, 2002))
+
+    jobs.cancel(dropped.id)
+    assert dropped.status == "cancelled"
+
+    # With one worker, the later but higher priority job has to be done before the other one starts
+    jobs.cancel(running.id)
+    wait_until_finished(jobs, low)
+    assert low.status == "done" and high.status == "done"
+    assert dropped.status == "cancelled"
+
+
+@pytest.mark.parametrize("settings, message", [({"solver": "nope"}, "unknown solver"),
+                                               ({"integrator": "rk9"}, "unknown integrator"),
+                                               ({"solver_options": {"thetaa": 1}}, "unknown solver option"),
+                                               ({"integrator": "verlet", "integrator_options": {"eta": 1}},
+                                                "unknown integrator option"),
+                                               ({"sim_time": 0}, "sim_time"),
+                                               ({"step_size": None}, "step_size must be a number"),
+                                               ({"save_stride": [1]}, "save_stride must be a number"),
+                                               ({"priority": {"high": 1}}, "priority must be a number")])
+def test_bad_requests_are_rejected(jobs, sun_earth_moon, settings, message):
+    request = job_request(sun_earth_moon.bodies, 100)
+    request.update(settings)
+
+    with pytest.raises(ValueError, match=message):
+        jobs.submit(request)
+
+
+def test_http_interface(tmp_path, sun_earth_moon):
+    server = start_server(port=0, max_jobs=1, cache=ResultCache(str(tmp_path)))
+
+    try:
+        summary = submit_job(server.url, sun_earth_moon.bodies, 500, 10_000_000)
+        assert not summary["deduplicated"]
+        assert submit_job(server.url, sun_earth_moon.bodies, 500, 10_000_000)["deduplicated"]
+
+        with pytest.raises(ValueError, match="unknown solver"):
+            submit_job(server.url, sun_earth_moon.bodies, 500, 100, solver="nope")
+        with pytest.raises(ValueError):
+            job_status(server.url, "no-such-job")
+
+        cancel_job(server.url, summary["id"])
+        assert cancel_job(server.url, summary["id"])["status"] in ("running", "cancelled", "queued")
+        assert summary["id"] in [job["id"] for job in server_request(server.url, "/jobs")]
+    finally:
+        stop_server(server)
+
+
+# A setting of the wrong type is a bad request, not a server error
+def test_http_rejects_null_step_size(tmp_path, sun_earth_moon):
+    server = start_server(port=0, max_jobs=1, cache=ResultCache(str(tmp_path)))
+    request = urllib.request.Request(f"{server.url}/jobs", method="POST", headers={"Content-Type": "application/json"},
+                                     data=json.dumps(job_request(sun_earth_moon.bodies, 100, step_size=None)).encode())
+
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request, timeout=10)
+
+        assert error.value.code == 400
+        assert "step_size" in json.loads(error.value.read())["error"]
+    finally:
+        stop_server(server)
@@ -0,0 +1,21 @@
+import os
+import subprocess
+import sys
+import pytest
+
+package_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+# Modules loaded by importing a module in a new process, among the given ones
+def loaded_modules(module, candidates):
+    code = f"import sys, {module}; print(' '.join(name for name in {candidates!r} if name in sys.modules))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=package_dir, check=True, capture_output=True, text=True)
+    return output.stdout.split()
+
+
+# The headless core and the force kernels leave the command line, the stores, and astropy unloaded until used
+@pytest.mark.parametrize("module", ["gravity_sim", "gravity_backends"])
+def test_core_imports_stay_light(module):
+    candidates = ["argparse", "astropy", "dearpygui", "gravity_store", "gravity_cache", "gravity_tree",
+                  "gravity_parallel", "gravity_integrators"]
+    assert loaded_modules(module, candidates) == []
@@ -0,0 +1,56 @@
+import json
+import numpy as np
+import pytest
+from gravity_sim import accel_block_size, bodies_to_arrays, simulate, total_energy
+from gravity_stats import RunStats, conserved_quantities, write_json_lines
+
+
+def test_conserved_quantities_match_pairwise_sums():
+    rng = np.random.default_rng(0)
+    n = accel_block_size + 20
+    positions, velocities, masses = rng.uniform(-1e11, 1e11, (n, 3)), rng.uniform(-3e4, 3e4, (n, 3)), \
+        rng.uniform(1e20, 1e30, n)
+
+    energy, momentum, angular_momentum = conserved_quantities(positions, velocities, masses)
+    assert energy == pytest.approx(total_energy(positions, velocities, masses), rel=1e-12)
+    np.testing.assert_allclose(momentum, np.sum(masses[:, None] * velocities, axis=0), rtol=1e-12)
+    np.testing.assert_allclose(angular_momentum, np.sum(masses[:, None] * np.cross(positions, velocities), axis=0),
+                               rtol=1e-12)
+
+
+# A run's phases are counted per call, and its drift is measured from the first sample
+def test_run_stats_of_a_run(sun_earth_moon, tmp_path):
+    stats = RunStats(sample_freq=100)
+    trajectory = simulate(sun_earth_moon.bodies, 500, 1001, stats=stats)
+    snapshot = stats.snapshot(scenario="sun_earth_moon")
+
+    assert snapshot["scenario"] == "sun_earth_moon"
+    assert snapshot["counters"]["step"] == 1000 and snapshot["counters"]["force"] == 1001
+    assert snapshot["counters"]["diagnostics"] == 11
+    assert snapshot["phase_times"]["step"] >= snapshot["phase_times"]["force"] * 1000 / 1001 > 0
+
+    _, _, _, _, masses = bodies_to_arrays(sun_earth_moon.bodies)
+    start = total_energy(trajectory.positions[0], trajectory.velocities[0], masses)
+    end = total_energy(trajectory.positions[-1], trajectory.velocities[-1], masses)
+    assert snapshot["drift"]["energy"] == pytest.approx(abs(end / start - 1), rel=1e-6)
+    assert snapshot["max_drift"]["energy"] >= snapshot["drift"]["energy"]
+    assert snapshot["drift"]["momentum"] < 1e-12 and snapshot["drift"]["angular_momentum"] < 1e-12
+
+    path = str(tmp_path / "stats" / "runs.jsonl")
+    write_json_lines(path, [snapshot, snapshot])
+    with open(path) as file:
+        assert [json.loads(line) for line in file] == [json.loads(json.dumps(snapshot))] * 2
+
+
+def test_run_stats_timers_and_counters():
+    stats = RunStats()
+    stats.count("merges")
+    stats.count("merges", 2)
+    stats.add_time("store", 0.5)
+
+    double = stats.timed("double", lambda value: 2 * value)
+    assert double(3) == 6 and double(4) == 8
+
+    snapshot = stats.snapshot()
+    assert snapshot["counters"] == {"merges": 3, "store": 1, "double": 2}
+    assert snapshot["phase_times"]["store"] == 0.5
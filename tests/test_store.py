@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+from gravity_sim import integrators, interpolate_positions, load_checkpoint, load_scenario, load_trajectory, resume, \
+    save_scenario, save_trajectory, scenario_from_dict, simulate
+from gravity_store import TrajectoryStore
+
+
+def test_trajectory_file_round_trip(sun_earth_moon, tmp_path):
+    trajectory = simulate(sun_earth_moon.bodies, 500, 100)
+    save_trajectory(tmp_path / "run.npz", trajectory)
+    loaded = load_trajectory(tmp_path / "run.npz")
+
+    assert loaded.ids == trajectory.ids and loaded.names == trajectory.names
+    assert loaded.step_size == trajectory.step_size
+    np.testing.assert_array_equal(loaded.masses, trajectory.masses)
+    np.testing.assert_array_equal(loaded.positions, trajectory.positions)
+    np.testing.assert_array_equal(loaded.velocities, trajectory.velocities)
+
+
+def test_store_matches_in_memory_run(sun_earth_moon, tmp_path):
+    expected = simulate(sun_earth_moon.bodies, 500, 3000, save_stride=7)
+    simulate(sun_earth_moon.bodies, 500, 3000, save_stride=7, store=str(tmp_path / "run"), chunk_steps=64)
+
+    trajectory = TrajectoryStore.open(str(tmp_path / "run")).trajectory()
+    assert trajectory.ids == expected.ids and len(trajectory.positions) == len(expected.positions)
+    np.testing.assert_array_equal(np.asarray(trajectory.times), expected.times)
+    np.testing.assert_array_equal(np.asarray(trajectory.positions), expected.positions)
+    np.testing.assert_array_equal(np.asarray(trajectory.velocities), expected.velocities)
+
+    # Indexing reads across chunk files, the same as indexing the arrays
+    np.testing.assert_array_equal(trajectory.positions[5:140:3], expected.positions[5:140:3])
+    np.testing.assert_array_equal(trajectory.positions[-1, 2], expected.positions[-1, 2])
+    np.testing.assert_array_equal(trajectory.velocities[60:70, :, 0], expected.velocities[60:70, :, 0])
+
+
+def test_store_truncate_extend_and_compact(sun_earth_moon, tmp_path):
+    expected = simulate(sun_earth_moon.bodies, 500, 200)
+    path = str(tmp_path / "run")
+
+    store = TrajectoryStore.create(path, expected.ids, expected.names, expected.masses, 500, 1, 16)
+    store.extend(expected.times[:150], expected.positions[:150], expected.velocities[:150])
+    store.truncate(100)
+    for i in range(100, 200):
+        store.append(expected.times[i], expected.positions[i], expected.velocities[i])
+    store.close()
+    store.compact()
+
+    trajectory = TrajectoryStore.open(path).trajectory()
+    np.testing.assert_array_equal(np.asarray(trajectory.positions), expected.positions)
+    np.testing.assert_array_equal(np.asarray(trajectory.velocities), expected.velocities)
+
+
+# A run checkpointed, reloaded, and resumed matches the same run done in one go exactly
+@pytest.mark.parametrize("integrator", sorted(integrators))
+def test_checkpoint_resume_matches_uninterrupted_run(sun_earth_moon, tmp_path, integrator):
+    expected = simulate(sun_earth_moon.bodies, 500, 2000, integrator=integrator)
+
+    checkpoint = str(tmp_path / "run.ckpt.npz")
+    store = str(tmp_path / "run")
+    simulate(sun_earth_moon.bodies, 500, 1200, integrator=integrator, checkpoint=checkpoint, store=store)
+    assert load_checkpoint(checkpoint).step == 1199
+
+    resumed = resume(checkpoint, 800, store=store)
+    assert load_checkpoint(checkpoint).integrator == integrator
+    np.testing.assert_array_equal(np.asarray(resumed.positions), expected.positions)
+    np.testing.assert_array_equal(np.asarray(resumed.velocities), expected.velocities)
+
+
+# Without a store only the new steps are returned
+def test_resume_without_store_returns_new_steps(sun_earth_moon, tmp_path):
+    expected = simulate(sun_earth_moon.bodies, 500, 1000, save_stride=10)
+
+    checkpoint = str(tmp_path / "run.ckpt.npz")
+    simulate(sun_earth_moon.bodies, 500, 601, checkpoint=checkpoint, checkpoint_freq=250)
+    resumed = resume(checkpoint, 399, save_stride=10)
+
+    np.testing.assert_array_equal(resumed.times, expected.times[61:])
+    np.testing.assert_array_equal(resumed.positions, expected.positions[61:])
+
+
+@pytest.mark.parametrize("extension", [".json", ".csv", ".npz"])
+def test_scenario_round_trip(sun_earth_moon, tmp_path, extension):
+    path = str(tmp_path / f"scenario{extension}")
+    save_scenario(path, sun_earth_moon.bodies, 250, 1234)
+    scenario = load_scenario(path)
+
+    assert list(scenario.bodies) == list(sun_earth_moon.bodies)
+
+    # CSV files only hold the bodies
+    if extension != ".csv":
+        assert (scenario.step_size, scenario.sim_time) == (250, 1234)
+
+    for body_id, body in sun_earth_moon.bodies.items():
+        loaded = scenario.bodies[body_id]
+        assert loaded.name == body.name and loaded.mass == body.mass
+        assert tuple(loaded.position) == tuple(body.position) and tuple(loaded.velocity) == tuple(body.velocity)
+        assert (loaded.color is None) == (body.color is None)
+
+
+def test_duplicate_and_unknown_scenarios_are_rejected(sun_earth_moon, tmp_path):
+    body = {"name": "Earth", "position": [0, 0, 0], "velocity": [0, 0, 0], "mass": 1.0}
+    with pytest.raises(ValueError, match="duplicate body 'earth'"):
+        scenario_from_dict({"bodies": [body, dict(body, name="earth")]})
+
+    with pytest.raises(ValueError, match="unknown scenario format"):
+        save_scenario(str(tmp_path / "scenario.txt"), sun_earth_moon.bodies)
+
+
+@pytest.mark.parametrize("extension", [".json", ".csv", ".npz"])
+def test_scenario_keeps_test_particles(with_probe, tmp_path, extension):
+    path = str(tmp_path / f"scenario{extension}")
+    save_scenario(path, with_probe)
+
+    assert [body.test_particle for body in load_scenario(path).bodies.values()] == [False, False, False, True]
+
+
+def test_interpolation_is_exact_at_saved_steps_and_close_between(sun_earth_moon):
+    full = simulate(sun_earth_moon.bodies, 500, 2001)
+    strided = simulate(sun_earth_moon.bodies, 500, 2001, save_stride=100)
+
+    np.testing.assert_array_equal(interpolate_positions(strided, strided.times[3]), strided.positions[3])
+
+    # Hermite interpolation keeps the Moon within a few kilometres between saved steps 100 apart
+    for step in (50, 1234, 1999):
+        error = np.abs(interpolate_positions(strided, full.times[step]) - full.positions[step]).max()
+        assert error < 5e3
+
+    np.testing.assert_array_equal(interpolate_positions(strided, -1.0), strided.positions[0])
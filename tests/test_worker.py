@@ -0,0 +1,72 @@
+import time
+import numpy as np
+import pytest
+from gravity_sim import simulate
+from gravity_worker import SimulationWorker
+
+
+@pytest.fixture
+def workers():
+    started = []
+    yield started
+
+    for worker in started:
+        worker.close()
+
+
+def wait_until(condition, timeout=60):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_worker_matches_simulate(workers, sun_earth_moon):
+    worker = SimulationWorker(sun_earth_moon.bodies, 500, 2000, plot_stride=10, save_stride=5)
+    workers.append(worker)
+    wait_until(lambda: worker.is_finished() and not worker.is_running())
+
+    expected = simulate(sun_earth_moon.bodies, 500, 2000)
+    assert worker.plot_rows_available() == 200
+
+    first, rows = worker.plot_rows(0, 200)
+    assert first == 0
+    np.testing.assert_array_equal(rows, expected.positions[::10])
+    np.testing.assert_array_equal(worker.latest_position, expected.positions[-1])
+
+    trajectory = worker.trajectory()
+    np.testing.assert_array_equal(np.asarray(trajectory.positions), expected.positions[::5])
+    np.testing.assert_array_equal(np.asarray(trajectory.velocities), expected.velocities[::5])
+
+
+def test_worker_pauses_and_cancels(workers, sun_earth_moon):
+    worker = SimulationWorker(sun_earth_moon.bodies, 500, 10_000_000)
+    workers.append(worker)
+    wait_until(lambda: worker.steps_available() > 0)
+
+    worker.pause()
+    time.sleep(0.2)
+    paused_at = worker.steps_available()
+    time.sleep(0.2)
+    assert worker.is_paused() and worker.steps_available() == paused_at
+
+    worker.cancel()
+    wait_until(lambda: not worker.is_running())
+    assert not worker.is_finished() and worker.steps_available() < 10_000_000
+
+
+# A run with no end keeps only the latest window of plot rows, which match the same steps of a run of set length
+def test_endless_worker_keeps_the_latest_window(workers, sun_earth_moon):
+    worker = SimulationWorker(sun_earth_moon.bodies, 500, None, plot_stride=2, window=50, spill=False)
+    workers.append(worker)
+    wait_until(lambda: worker.steps_available() > 1000)
+
+    worker.pause()
+    time.sleep(0.2)
+    rows = worker.plot_rows_available()
+    first, positions = worker.plot_rows(0, rows)
+
+    assert worker.is_endless() and not worker.is_finished()
+    assert first == rows - 50 and len(positions) == 50
+    expected = simulate(sun_earth_moon.bodies, 500, 2 * rows).positions
+    np.testing.assert_array_equal(positions, expected[2 * first::2])